@@ -1,24 +1,79 @@
 """DIET API endpoints for dashboard and module generation."""
 import os
-from fastapi import APIRouter, Depends, HTTPException, Query
+import gzip
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from typing import Optional
-from app.database import get_db
+from typing import List, Optional
+from app.config import settings
+from app.database import get_db, get_read_db
 from app.schemas import (
     AggregateResponse,
     ModuleGenerateRequest,
-    ModuleGenerateResponse
+    ModuleGenerateResponse,
+    BroadcastResponse,
+    TeacherQueryDetail,
+    SearchResponse,
+    SimilarQueriesResponse
 )
-from app.models import MicroModule, Cluster
+from app.models import MicroModule, Cluster, Broadcast, TeacherQuery
 from app.services.aggregator import AggregationService
-from app.services.template_engine import TemplateEngine
-from app.services.pptx_generator import PPTXGenerator
-from datetime import datetime
+from app.services.template_engine import get_template_engine
+from app.services.export_store import export_store
+from app.services.compact_module import compact_filename
+from app.services.module_builder import module_builder
+from app.services.broadcast import broadcast_engine
+from app.services.dedupe import duplicate_detector
+from app.services.search import search_service
+from app.services.similarity import similarity_index
+from app.services.sample_prebuild import SamplePrebuilder
+from app.services.metrics import InstrumentedRoute
+from app.utils.static_files import file_response, accepts_gzip
 
-router = APIRouter(prefix="/diet", tags=["diet"])
+router = APIRouter(prefix="/diet", tags=["diet"], route_class=InstrumentedRoute)
 aggregator = AggregationService()
-template_engine = TemplateEngine()
-pptx_generator = PPTXGenerator()
+sample_prebuilder = SamplePrebuilder(samples_dir=settings.SAMPLES_PATH)
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+
+# Shown while the database has no queries yet (fresh demo install)
+DEMO_STATS = {
+    "total_queries": 15,
+    "by_topic": {
+        "concept-confusion": 5,
+        "classroom-management": 4,
+        "student-absenteeism": 3,
+        "parent-engagement": 2,
+        "need-tlms": 1
+    },
+    "by_cluster": {
+        "Cluster A": 7,
+        "Cluster B": 5,
+        "Cluster C": 3
+    },
+    "sample_queries": [
+        {
+            "id": "q1",
+            "cluster_id": "cluster-a",
+            "topic_tag": "concept-confusion",
+            "narrative_text": "Students confused about fractions",
+            "created_at": "2026-01-22T10:30:00Z",
+            "resolved": False,
+            "flagged_for_crp": True
+        },
+        {
+            "id": "q2", 
+            "cluster_id": "cluster-b",
+            "topic_tag": "classroom-management",
+            "narrative_text": "Kids won't sit still during math",
+            "created_at": "2026-01-22T09:15:00Z",
+            "resolved": True,
+            "flagged_for_crp": False
+        }
+    ]
+}
 
 
 @router.get("/aggregate", response_model=AggregateResponse)
@@ -26,101 +81,299 @@ def get_aggregated_data(
     cluster: Optional[str] = Query(None),
     topic: Optional[str] = Query(None),
     date_from: Optional[str] = Query(None),
-    date_to: Optional[str] = Query(None)
+    date_to: Optional[str] = Query(None),
+    include_archived: bool = Query(True),
+    db: Session = Depends(get_read_db)
 ):
     """
     Get aggregated statistics for DIET dashboard.
     
+    Runs on the read-only analytics session, so dashboard scans do not
+    hold up teacher inserts. An empty, unfiltered database returns demo
+    data.
+    
     Query params:
     - cluster: Filter by cluster name
     - topic: Filter by topic tag
     - date_from: ISO date (e.g., 2026-01-01)
     - date_to: ISO date
+    - include_archived: Count queries moved to cold storage (default true)
     """
-    # Mock data for demo
-    mock_stats = {
-        "total_queries": 15,
-        "by_topic": {
-            "concept-confusion": 5,
-            "classroom-management": 4,
-            "student-absenteeism": 3,
-            "parent-engagement": 2,
-            "need-tlms": 1
-        },
-        "by_cluster": {
-            "Cluster A": 7,
-            "Cluster B": 5,
-            "Cluster C": 3
-        },
-        "sample_queries": [
-            {
-                "id": "q1",
-                "cluster_id": "cluster-a",
-                "topic_tag": "concept-confusion",
-                "narrative_text": "Students confused about fractions",
-                "created_at": "2026-01-22T10:30:00Z",
-                "resolved": False,
-                "flagged_for_crp": True
-            },
+    stats = aggregator.get_aggregated_stats(db, cluster, topic, date_from, date_to, include_archived)
+    
+    if stats["total_queries"] == 0 and not any([cluster, topic, date_from, date_to]):
+        return AggregateResponse(**DEMO_STATS)
+    
+    return AggregateResponse(**stats)
+
+
+@router.get("/crp-queue", response_model=List[TeacherQueryDetail])
+def get_crp_queue(
+    cluster: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_read_db)
+):
+    """Flagged queries still waiting for a CRP classroom visit, newest first."""
+    return aggregator.get_crp_queue(db, cluster, limit)
+
+
+@router.get("/search", response_model=SearchResponse)
+def search_queries(
+    q: str = Query(..., min_length=1, max_length=200, description='Words or "quoted phrases"'),
+    cluster: Optional[str] = Query(None),
+    topic: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Full-text search over teacher narratives, best matches first.
+    
+    Follow next_cursor for further pages.
+    """
+    try:
+        return search_service.search(db, q, cluster, topic, date_from, date_to, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/queries/{query_id}/similar", response_model=SimilarQueriesResponse)
+def get_similar_queries(
+    query_id: str,
+    k: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """
+    The k most similar past queries across all clusters.
+    
+    If the neighbours mostly carry another topic, that topic is returned
+    as suggested_topic: the keyword detector may have mislabeled the query.
+    """
+    query = db.query(TeacherQuery).filter(TeacherQuery.id == query_id).first()
+    if not query:
+        raise HTTPException(status_code=404, detail="Query not found")
+    
+    if not similarity_index.ensure_loaded():
+        # The leader builds the first index in the background
+        raise HTTPException(
+            status_code=503,
+            detail="The similarity index is still being built",
+            headers={"Retry-After": str(settings.SIMILARITY_REFRESH_INTERVAL_SECONDS)}
+        )
+    neighbours = similarity_index.similar(query.narrative_text, k, exclude=query_id)
+    neighbour_rows = db.query(
+        TeacherQuery.id, TeacherQuery.topic_tag, TeacherQuery.narrative_text, Cluster.name
+    ).join(Cluster, Cluster.id == TeacherQuery.cluster_id).filter(
+        TeacherQuery.id.in_([neighbour_id for neighbour_id, _ in neighbours])
+    )
+    rows = {row.id: row for row in neighbour_rows}
+    # Rows deleted since they were indexed are skipped
+    neighbours = [(neighbour_id, score) for neighbour_id, score in neighbours if neighbour_id in rows]
+    votes = similarity_index.topic_vote(neighbours, {i: row.topic_tag for i, row in rows.items()})
+    top_topic = next(iter(votes), None)
+    
+    return SimilarQueriesResponse(
+        query_id=query.id,
+        topic=query.topic_tag,
+        results=[
             {
-                "id": "q2", 
-                "cluster_id": "cluster-b",
-                "topic_tag": "classroom-management",
-                "narrative_text": "Kids won't sit still during math",
-                "created_at": "2026-01-22T09:15:00Z",
-                "resolved": True,
-                "flagged_for_crp": False
+                "id": neighbour_id,
+                "cluster": rows[neighbour_id].name,
+                "topic": rows[neighbour_id].topic_tag,
+                "narrative_text": rows[neighbour_id].narrative_text,
+                "similarity": score
             }
-        ]
-    }
-    
-    return AggregateResponse(**mock_stats)
+            for neighbour_id, score in neighbours
+        ],
+        topic_votes=votes,
+        suggested_topic=top_topic if top_topic != query.topic_tag and votes.get(top_topic, 0) >= 0.5 else None
+    )
 
 
 @router.post("/generate-module", response_model=ModuleGenerateResponse)
 def generate_micro_module(
-    request: ModuleGenerateRequest
+    request: ModuleGenerateRequest,
+    db: Session = Depends(get_db)
 ):
     """
     Generate a 2-slide micro-module PPTX for a topic and cluster.
+    
+    The render inputs are stored on the MicroModule row so the export
+    store can re-render the file after evicting it.
     """
     try:
-        # Generate title
-        title = f"{request.topic.replace('-', ' ').title()} - Micro Module"
-        
-        # Generate filename
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        filename = f"module_{request.cluster.replace(' ', '_')}_{request.topic}_{timestamp}.pptx"
-        
-        # Mock response data for demo
-        response_data = {
-            "advice": f"Teaching strategies for {request.topic}:\n1. Start with concrete examples\n2. Use visual aids\n3. Practice with guided exercises",
-            "materials": ["Worksheets", "Visual charts", "Practice problems"]
-        }
-        
-        # Generate PPTX
-        output_path = pptx_generator.generate_micro_module(
-            title=title,
-            topic=request.topic,
-            advice=response_data["advice"],
-            materials=response_data["materials"],
-            cluster=request.cluster,
-            output_filename=filename
-        )
+        module = module_builder.create(db, request.cluster, request.topic)
+        filename = os.path.basename(module.slides_pptx_path)
         
         # Return absolute URL for download
         base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000")
         download_url = f"{base_url}/exports/{filename}"
         
         return ModuleGenerateResponse(
-            module_id=f"module_{timestamp}",
+            module_id=module.id,
             pptx_link=download_url,
-            title=title
+            title=module.title,
+            compact_link=f"{base_url}{settings.API_PREFIX}/diet/modules/{module.id}/download?format=html"
         )
     except Exception as e:
-        # Fallback: return a sample module link
+        db.rollback()
+        # Fallback: the prebuilt deck for the topic, else the bundled sample
+        base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000")
+        if sample_prebuilder.lookup(request.topic, get_template_engine()):
+            pptx_link = f"{base_url}{settings.API_PREFIX}/diet/sample-module/{request.topic}.pptx"
+        else:
+            pptx_link = f"{base_url}/exports/sample_module.pptx"
         return ModuleGenerateResponse(
             module_id="sample_module",
-            pptx_link="http://127.0.0.1:8000/exports/sample_module.pptx",
+            pptx_link=pptx_link,
             title=f"{request.topic.replace('-', ' ').title()} - Sample Module"
-        )
\ No newline at end of file
+        )
+
+
+@router.api_route("/sample-module/{topic}.pptx", methods=["GET", "HEAD"])
+def get_sample_module(topic: str, request: Request):
+    """
+    Download the prebuilt sample deck for a topic.
+    
+    Decks are rendered ahead of time by scripts/prebuild_sample_modules.py;
+    a deck whose template changed since the build is not served.
+    """
+    path = sample_prebuilder.lookup(topic, get_template_engine())
+    if path is None:
+        raise HTTPException(status_code=404, detail="No prebuilt sample for this topic")
+    
+    # The URL is stable across rebuilds, so it must not be cached as immutable
+    return file_response(
+        request.headers,
+        path,
+        request.method,
+        media_type=PPTX_MEDIA_TYPE,
+        content_addressed=False
+    )
+
+
+def _accept_quality(accept: str, media_type: str) -> float:
+    """Quality value the Accept header gives a media type (exact match only)."""
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0].lower() != media_type:
+            continue
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    return float(param[2:])
+                except ValueError:
+                    return 0.0
+        return 1.0
+    return 0.0
+
+
+@router.get("/modules/{module_id}/download")
+def download_module(
+    module_id: str,
+    request: Request,
+    format: Optional[str] = Query(None, description="pptx or html; overrides Accept"),
+    db: Session = Depends(get_db)
+):
+    """
+    Download a micro-module as PPTX or compact HTML.
+    
+    Without ?format the Accept header decides: text/html ranked above the
+    PPTX media type selects the compact version, anything else gets the
+    PPTX. The compact file is stored gzip-compressed and sent as-is to
+    clients that accept gzip.
+    """
+    module = db.query(MicroModule).filter(MicroModule.id == module_id).first()
+    
+    if not module or not module.slides_pptx_path:
+        raise HTTPException(status_code=404, detail="Module not found")
+    
+    if format is None:
+        accept = request.headers.get("accept", "")
+        wants_html = _accept_quality(accept, "text/html") > _accept_quality(accept, PPTX_MEDIA_TYPE)
+        format = "html" if wants_html else "pptx"
+    
+    vary = {"Vary": "Accept, Accept-Encoding"}
+    pptx_name = os.path.basename(module.slides_pptx_path)
+    
+    if format == "pptx":
+        path = export_store.open(db, pptx_name)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Module file not found")
+        response = file_response(request.headers, path, media_type=PPTX_MEDIA_TYPE)
+        response.headers.update(vary)
+        return response
+    
+    if format != "html":
+        raise HTTPException(status_code=422, detail="Format must be pptx or html")
+    
+    path = export_store.open(db, compact_filename(pptx_name))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Module file not found")
+    
+    if accepts_gzip(request.headers):
+        response = file_response(request.headers, path)
+        response.headers.update(vary)
+        return response
+    
+    with open(path, "rb") as f:
+        body = gzip.decompress(f.read())
+    return Response(body, media_type="text/html; charset=utf-8", headers=vary)
+
+
+@router.post("/modules/{module_id}/broadcast", response_model=BroadcastResponse)
+def broadcast_module(module_id: str, db: Session = Depends(get_db)):
+    """
+    Announce a module to every consenting teacher who asked about its topic.
+    
+    Recipients are queued immediately; messages are sent in the background
+    at the provider's rate limit. Poll /diet/broadcasts/{id} for progress.
+    """
+    module = db.query(MicroModule).filter(MicroModule.id == module_id).first()
+    if not module:
+        raise HTTPException(status_code=404, detail="Module not found")
+    
+    base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000")
+    message = (
+        f"📚 New training module: {module.title}\n"
+        f"{base_url}{settings.API_PREFIX}/diet/modules/{module.id}/download?format=html"
+    )
+    broadcast = broadcast_engine.create(
+        db, module.cluster_id, module.topic_tag, message, module_id=module.id
+    )
+    broadcast_engine.start(broadcast.id)
+    
+    return BroadcastResponse(
+        broadcast_id=broadcast.id,
+        status=broadcast.status,
+        recipients=broadcast_engine.stats(db, broadcast.id)
+    )
+
+
+@router.get("/broadcasts/{broadcast_id}", response_model=BroadcastResponse)
+def get_broadcast(broadcast_id: str, db: Session = Depends(get_db)):
+    """Delivery progress of a broadcast."""
+    broadcast = db.query(Broadcast).filter(Broadcast.id == broadcast_id).first()
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    
+    return BroadcastResponse(
+        broadcast_id=broadcast.id,
+        status=broadcast.status,
+        recipients=broadcast_engine.stats(db, broadcast.id)
+    )
+
+
+@router.get("/dedupe-stats")
+def get_dedupe_stats():
+    """
+    Near-duplicate detector counters since startup.
+    
+    `suppressed` counts resends from the same number, which were not
+    stored again; `cross_sender` counts chain messages matching a query
+    from another number. Those are not merged: each is stored as its
+    sender's own query and counts on the dashboard like any other.
+    """
+    return duplicate_detector.stats()
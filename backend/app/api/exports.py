@@ -0,0 +1,74 @@
+"""Download endpoints for rendered exports and archived queries."""
+import json
+import os
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.database import get_db, get_read_db
+from app.models import Cluster
+from app.services.archive import query_archive
+from app.services.export_store import export_store
+from app.services.metrics import InstrumentedRoute
+from app.utils.static_files import file_response
+
+router = APIRouter(prefix="/exports", tags=["exports"], route_class=InstrumentedRoute)
+
+
+# Archived records are exported without the phone hash
+ARCHIVE_EXPORT_FIELDS = (
+    "id", "cluster_id", "topic_tag", "narrative_text", "created_at", "resolved", "flagged_for_crp"
+)
+
+
+@router.get("/archive/queries")
+def export_archived_queries(
+    cluster: Optional[str] = Query(None),
+    topic: Optional[str] = Query(None),
+    date_from: Optional[str] = Query(None, description="ISO date or datetime"),
+    date_to: Optional[str] = Query(None, description="ISO date or datetime"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Stream archived teacher queries as NDJSON, oldest first.
+    
+    Only the archive members that can match the filters are read, one
+    at a time, so memory use does not depend on the archive size.
+    """
+    try:
+        from_date = datetime.fromisoformat(date_from) if date_from else None
+        to_date = datetime.fromisoformat(date_to) if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO format, e.g. 2025-06-01")
+    
+    cluster_id = None
+    if cluster:
+        cluster_obj = db.query(Cluster).filter(Cluster.name == cluster).first()
+        cluster_id = cluster_obj.id if cluster_obj else ""
+    records = query_archive.iter_records(cluster_id, topic, from_date, to_date)
+    lines = (
+        json.dumps({field: record[field] for field in ARCHIVE_EXPORT_FIELDS}) + "\n"
+        for record in records
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@router.api_route("/{filename}", methods=["GET", "HEAD"])
+def download_export(filename: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Download an exported PPTX.
+    
+    Files evicted by the export store quota are rendered again from
+    their MicroModule / LFADesign record before being served. Responses
+    support Range requests so interrupted downloads can resume; exports
+    can be re-rendered under the same name, so clients revalidate by ETag.
+    """
+    if os.path.basename(filename) != filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="Export not found")
+    
+    path = export_store.open(db, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    
+    return file_response(request.headers, path, request.method)
@@ -1,16 +1,26 @@
 """LFA (Logical Framework Analysis) API endpoints."""
 import os
+import re
 import json
 from datetime import datetime
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.schemas import LFAExportRequest, LFAExportResponse
 from app.models import LFADesign
-from app.services.pptx_generator import PPTXGenerator
+from app.services.export_store import export_store
+from app.services.metrics import InstrumentedRoute
 
-router = APIRouter(prefix="/lfa", tags=["lfa"])
-pptx_generator = PPTXGenerator()
+router = APIRouter(prefix="/lfa", tags=["lfa"], route_class=InstrumentedRoute)
+
+
+def _export_response(filename: str, lfa_id: str) -> LFAExportResponse:
+    """Build the response with an absolute download URL."""
+    base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000")
+    return LFAExportResponse(
+        export_url=f"{base_url}/exports/{filename}",
+        lfa_id=lfa_id
+    )
 
 
 @router.post("/export", response_model=LFAExportResponse)
@@ -19,24 +29,17 @@ def export_lfa(
     db: Session = Depends(get_db)
 ):
     """
-    Export LFA design as a 1-2 slide PPTX document.
+    Save an LFA design and return the download link for its PPTX.
+    
+    The 1-2 slide PPTX is not rendered here: the first download of the
+    link renders it through the export store, which keeps it cached.
     """
     # Generate filename
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    safe_title = request.title.replace(" ", "_")[:50]
+    # The title comes from the user: keep only characters safe in a URL and a path
+    safe_title = re.sub(r"[^A-Za-z0-9_-]", "_", request.title)[:50]
     filename = f"lfa_{safe_title}_{timestamp}.pptx"
     
-    # Generate PPTX
-    output_path = pptx_generator.generate_lfa_export(
-        title=request.title,
-        problem_statement=request.problem_statement,
-        student_change=request.student_change,
-        stakeholders=request.stakeholders,
-        practice_changes=request.practice_changes,
-        indicators=request.indicators,
-        output_filename=filename
-    )
-    
     # Create database record
     lfa = LFADesign(
         title=request.title,
@@ -45,17 +48,42 @@ def export_lfa(
         stakeholders_json=json.dumps(request.stakeholders),
         practice_changes_json=json.dumps(request.practice_changes),
         indicators_json=json.dumps(request.indicators),
-        exported_path=output_path
+        exported_path=export_store.path_for(filename)
     )
     db.add(lfa)
     db.commit()
-    db.refresh(lfa)
     
-    # Return absolute URL for download
-    base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000")
-    download_url = f"{base_url}/exports/{filename}"
+    # Index the (not yet rendered) file so a download renders it
+    export_store.register(db, filename, "lfa", lfa.id)
     
-    return LFAExportResponse(
-        export_url=download_url,
-        lfa_id=lfa.id
-    )
\ No newline at end of file
+    return _export_response(filename, lfa.id)
+
+
+@router.put("/{lfa_id}", response_model=LFAExportResponse)
+def update_lfa(
+    lfa_id: str,
+    request: LFAExportRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Update a saved LFA design.
+    
+    Drops the cached PPTX so the next download renders the new version.
+    """
+    lfa = db.query(LFADesign).filter(LFADesign.id == lfa_id).first()
+    
+    if not lfa:
+        raise HTTPException(status_code=404, detail="LFA design not found")
+    
+    lfa.title = request.title
+    lfa.problem_statement = request.problem_statement
+    lfa.student_change = request.student_change
+    lfa.stakeholders_json = json.dumps(request.stakeholders)
+    lfa.practice_changes_json = json.dumps(request.practice_changes)
+    lfa.indicators_json = json.dumps(request.indicators)
+    db.commit()
+    
+    filename = os.path.basename(lfa.exported_path)
+    export_store.invalidate(db, filename)
+    
+    return _export_response(filename, lfa.id)
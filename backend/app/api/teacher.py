@@ -1,20 +1,37 @@
 """Teacher API endpoints."""
-from fastapi import APIRouter, Depends, HTTPException, Query
+import zlib
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Optional
 from app.database import get_db
 from app.schemas import (
     TeacherQueryCreate,
     TeacherQueryResponse,
     TeacherQueryDetail,
-    FlagRequest
+    FlagRequest,
+    SyncRequest,
+    SyncItemResult,
+    SyncResponse,
+    ErasureRequest,
+    ErasureStatus
 )
-from app.models import TeacherQuery, Cluster
-from app.services.template_engine import TemplateEngine
+from app.models import TeacherQuery, Cluster, ErasureTombstone, generate_uuid
+from app.services.template_engine import get_template_engine
+from app.services.cluster_matcher import cluster_matcher
+from app.services.admission import admission_controller, ADMIT, REJECT
+from app.services.write_queue import query_write_queue
+from app.services.dedupe import duplicate_detector, DuplicateMatch
+from app.services.idempotency import idempotency_cache
+from app.services.similarity import similarity_index
+from app.services.erasure import erasure_service
+from app.services.metrics import InstrumentedRoute
+from app.config import settings
 from app.utils.privacy import hash_phone_number, check_consent_required, get_consent_message
 
-router = APIRouter(prefix="/teacher", tags=["teacher"])
-template_engine = TemplateEngine()
+router = APIRouter(prefix="/teacher", tags=["teacher"], route_class=InstrumentedRoute)
 
 
 @router.post("/query", response_model=TeacherQueryResponse)
@@ -31,6 +48,10 @@ def create_teacher_query(
     - topic: Topic tag (optional, will be auto-detected if not provided)
     - text: Problem description (required)
     - consent_given: Consent flag (default: false)
+    
+    Under load, admission control answers from the templates at once and
+    queues the write (see _degraded_response); a number sending faster
+    than ADMISSION_PHONE_RATE gets 429.
     """
     # Validate required fields with friendly messages
     if not query.cluster or not query.cluster.strip():
@@ -48,6 +69,27 @@ def create_teacher_query(
         ephemeral_id = f"demo-{int(time.time())}"
         phone_hash = hashlib.sha256(ephemeral_id.encode()).hexdigest()
     
+    # Resends are answered but not stored again; a chain message forwarded
+    # by another teacher is that teacher's own query and is stored
+    if settings.DEDUPE_ENABLED and query.consent_given:
+        duplicate = duplicate_detector.find(query.text, phone_hash)
+        if duplicate is not None and duplicate.same_sender:
+            return _duplicate_response(query, duplicate)
+    
+    with admission_controller.admit(phone_hash) as decision:
+        if decision == REJECT:
+            raise HTTPException(
+                status_code=429,
+                detail="You are sending messages too quickly. Please wait a minute and try again.",
+                headers={"Retry-After": "60"}
+            )
+        if decision != ADMIT:
+            return _degraded_response(query, phone_hash)
+        return _persist_query(query, phone_hash, db)
+
+
+def _persist_query(query: TeacherQueryCreate, phone_hash: str, db: Session) -> TeacherQueryResponse:
+    """Normal path: check consent, store the query and answer from templates."""
     # Check consent
     consent_required = check_consent_required(phone_hash, db)
     
@@ -66,12 +108,13 @@ def create_teacher_query(
         db.add(cluster)
         db.commit()
         db.refresh(cluster)
+        cluster_matcher.add_created(cluster.name, cluster.id)
     
     # Detect topic from text
-    detected_topic = template_engine.detect_topic(query.text, query.topic)
+    detected_topic = get_template_engine().detect_topic(query.text, query.topic)
     
     # Generate templated response
-    response_data = template_engine.generate_response(detected_topic, query.cluster)
+    response_data = get_template_engine().generate_response(detected_topic, query.cluster, query.language)
     
     # Create query record
     new_query = TeacherQuery(
@@ -84,6 +127,7 @@ def create_teacher_query(
     db.add(new_query)
     db.commit()
     db.refresh(new_query)
+    duplicate_detector.add(new_query.id, query.text, phone_hash)
     
     return TeacherQueryResponse(
         id=new_query.id,
@@ -93,6 +137,201 @@ def create_teacher_query(
     )
 
 
+def _degraded_response(query: TeacherQueryCreate, phone_hash: str) -> TeacherQueryResponse:
+    """
+    Saturated path: answer from the in-memory templates without the database.
+    
+    The query is queued for a background writer under a pre-assigned id.
+    Consent cannot be looked up here, so only queries that carry consent
+    are accepted.
+    """
+    if not query.consent_given:
+        return TeacherQueryResponse(
+            id="consent-pending",
+            advice=get_consent_message(),
+            module_sample_link="",
+            consent_required=True
+        )
+    
+    detected_topic = get_template_engine().detect_topic(query.text, query.topic)
+    response_data = get_template_engine().generate_response(detected_topic, query.cluster, query.language)
+    
+    query_id = generate_uuid()
+    queued = query_write_queue.submit({
+        "id": query_id,
+        "cluster": query.cluster,
+        "phone_hash": phone_hash,
+        "topic_tag": detected_topic,
+        "narrative_text": query.text,
+        "consent_given": True
+    })
+    if not queued:
+        raise HTTPException(
+            status_code=503,
+            detail="EduPulse is very busy right now. Please try again in a few minutes.",
+            headers={"Retry-After": "120"}
+        )
+    duplicate_detector.add(query_id, query.text, phone_hash)
+    
+    return TeacherQueryResponse(
+        id=query_id,
+        advice=response_data["advice"],
+        module_sample_link=response_data["demo_link"],
+        consent_required=False
+    )
+
+
+def _duplicate_response(query: TeacherQueryCreate, duplicate: DuplicateMatch) -> TeacherQueryResponse:
+    """Answer a resend with the same advice, pointing at the sender's original query."""
+    detected_topic = get_template_engine().detect_topic(query.text, query.topic)
+    response_data = get_template_engine().generate_response(detected_topic, query.cluster, query.language)
+    
+    return TeacherQueryResponse(
+        id=duplicate.query_id,
+        advice=response_data["advice"],
+        module_sample_link=response_data["demo_link"],
+        consent_required=False
+    )
+
+
+@router.post("/sync", response_model=SyncResponse, response_model_exclude_none=True)
+async def sync_teacher_queries(request: Request, db: Session = Depends(get_db)):
+    """
+    Upload a batch of queries recorded offline, in one round trip.
+    
+    The body is a SyncRequest, optionally sent with
+    `Content-Encoding: gzip`. Each item carries a client-generated key;
+    resending a batch after a dropped connection returns the stored
+    result for items already synced instead of creating them again.
+    All new items are written in one transaction.
+    """
+    raw = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        raw = _gunzip_limited(raw, settings.SYNC_MAX_BYTES)
+    elif len(raw) > settings.SYNC_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Sync batch is too large")
+    
+    try:
+        batch = SyncRequest.model_validate_json(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    if not batch.phone.strip():
+        raise HTTPException(status_code=422, detail="Phone number is required for sync")
+    if len(batch.items) > settings.SYNC_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.SYNC_MAX_ITEMS} queries per sync"
+        )
+    
+    return await run_in_threadpool(_sync_batch, batch, db)
+
+
+def _gunzip_limited(raw: bytes, limit: int) -> bytes:
+    """Decompress a gzip body, refusing anything that inflates past the limit."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(raw, limit + 1)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Body is not valid gzip")
+    if len(data) > limit or decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Sync batch is too large")
+    return data
+
+
+def _sync_batch(batch: SyncRequest, db: Session) -> SyncResponse:
+    """Create the batch's new queries; clusters and consent are resolved once."""
+    phone_hash = hash_phone_number(batch.phone)
+    
+    with admission_controller.admit(phone_hash) as decision:
+        if decision == REJECT:
+            raise HTTPException(
+                status_code=429,
+                detail="You are sending messages too quickly. Please wait a minute and try again.",
+                headers={"Retry-After": "60"}
+            )
+        if decision != ADMIT:
+            # The app keeps the batch and retries; nothing is lost offline
+            raise HTTPException(
+                status_code=503,
+                detail="EduPulse is very busy right now. Please try again in a few minutes.",
+                headers={"Retry-After": "120"}
+            )
+        
+        scope = f"sync:{phone_hash[:16]}:"
+        done = idempotency_cache.get_many(db, [scope + item.key for item in batch.items])
+        consent_required = check_consent_required(phone_hash, db)
+        clusters: Dict[str, Cluster] = {}
+        new_clusters = []
+        created = []
+        staged: Dict[str, str] = {}
+        results = []
+        
+        for item in batch.items:
+            key = scope + item.key
+            if key in done:
+                results.append(SyncItemResult.model_validate_json(done[key]))
+                continue
+            
+            if not item.cluster.strip() or not item.text.strip():
+                results.append(SyncItemResult(key=item.key, status="invalid"))
+                continue
+            if consent_required and not item.consent_given:
+                results.append(SyncItemResult(key=item.key, status="consent_required"))
+                continue
+            
+            topic = get_template_engine().detect_topic(item.text, item.topic)
+            duplicate = None
+            if settings.DEDUPE_ENABLED:
+                duplicate = duplicate_detector.find(item.text, phone_hash)
+            
+            if duplicate is not None and duplicate.same_sender:
+                result = SyncItemResult(key=item.key, status="duplicate", id=duplicate.query_id, topic=topic)
+            else:
+                cluster = clusters.get(item.cluster)
+                if cluster is None:
+                    cluster = db.query(Cluster).filter(Cluster.name == item.cluster).first()
+                    if cluster is None:
+                        cluster = Cluster(name=item.cluster, region="Unknown")
+                        db.add(cluster)
+                        db.flush()
+                        new_clusters.append(cluster)
+                    clusters[item.cluster] = cluster
+                
+                new_query = TeacherQuery(
+                    id=generate_uuid(),
+                    phone_hash=phone_hash,
+                    cluster_id=cluster.id,
+                    topic_tag=topic,
+                    narrative_text=item.text,
+                    consent_given=True
+                )
+                db.add(new_query)
+                created.append(new_query)
+                consent_required = False
+                result = SyncItemResult(key=item.key, status="created", id=new_query.id, topic=topic)
+            
+            body = result.model_dump_json(exclude_none=True)
+            idempotency_cache.stage(db, key, body)
+            done[key] = staged[key] = body
+            results.append(result)
+        
+        try:
+            db.commit()
+        except IntegrityError:
+            # Same keys synced concurrently: the client retries and gets replays
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Batch is already being synced, please retry")
+    
+    for key, body in staged.items():
+        idempotency_cache.remember(key, body)
+    for cluster in new_clusters:
+        cluster_matcher.add_created(cluster.name, cluster.id)
+    for new_query in created:
+        duplicate_detector.add(new_query.id, new_query.narrative_text, phone_hash)
+    
+    return SyncResponse(results=results)
+
+
 @router.get("/query/{query_id}", response_model=TeacherQueryDetail)
 def get_teacher_query(query_id: str, db: Session = Depends(get_db)):
     """Get details of a specific teacher query."""
@@ -114,10 +353,39 @@ def delete_teacher_query(query_id: str, db: Session = Depends(get_db)):
     
     db.delete(query)
     db.commit()
+    similarity_index.remove([query_id])
     
     return {"message": "Query deleted successfully", "id": query_id}
 
 
+@router.post("/erasure", response_model=ErasureStatus)
+def request_erasure(request: ErasureRequest, db: Session = Depends(get_db)):
+    """
+    Erase every query sent from a phone number (consent withdrawn).
+    
+    Work is done inline for up to ERASURE_REQUEST_BUDGET_SECONDS; a
+    heavy user's request comes back "running" and the erasure job
+    finishes it. Poll GET /erasure/{id} for the outcome.
+    """
+    if not request.phone.strip():
+        raise HTTPException(status_code=422, detail="Please add your phone number")
+    
+    tombstone = erasure_service.request(db, hash_phone_number(request.phone))
+    erasure_service.run(db, tombstone, settings.ERASURE_REQUEST_BUDGET_SECONDS)
+    return tombstone
+
+
+@router.get("/erasure/{erasure_id}", response_model=ErasureStatus)
+def get_erasure(erasure_id: str, db: Session = Depends(get_db)):
+    """Status of an erasure request."""
+    tombstone = db.get(ErasureTombstone, erasure_id)
+    
+    if not tombstone:
+        raise HTTPException(status_code=404, detail="Erasure request not found")
+    
+    return tombstone
+
+
 @router.get("/sample-response")
 def get_sample_response(
     topic: Optional[str] = Query(default="subtraction-borrowing", description="Topic tag")
@@ -126,7 +394,7 @@ def get_sample_response(
     Get a deterministic mock advice response for UI mock mode.
     Useful when backend is down or for frontend development.
     """
-    response_data = template_engine.generate_response(topic, "Sample Cluster")
+    response_data = get_template_engine().generate_response(topic, "Sample Cluster")
     
     return TeacherQueryResponse(
         id="sample-mock-id",
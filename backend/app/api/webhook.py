@@ -1,65 +1,181 @@
 """WhatsApp webhook endpoint for Twilio integration."""
-from fastapi import APIRouter, Depends, Form
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Form, HTTPException
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from twilio.twiml.messaging_response import MessagingResponse
+from starlette.concurrency import run_in_threadpool
 from app.database import get_db
 from app.schemas import TeacherQueryCreate
 from app.api.teacher import create_teacher_query
 from app.config import settings
+from app.models import TeacherQuery
+from app.utils.privacy import hash_phone_number, check_consent_required, get_consent_message
+from app.services.cluster_matcher import cluster_matcher
+from app.services.session_store import session_store, ConversationSession
+from app.services.module_builder import module_builder
+from app.services.idempotency import idempotency_cache
+from app.services.messaging import create_transport
+from app.services.reply_worker import ReplyWorker, ReplyJob
+from app.services.sms import SmsRenderer
+from app.services.template_engine import get_template_engine
+from app.services.metrics import InstrumentedRoute
 
-router = APIRouter(prefix="/webhook", tags=["webhook"])
+router = APIRouter(prefix="/webhook", tags=["webhook"], route_class=InstrumentedRoute)
 
 
 @router.post("/whatsapp")
 async def whatsapp_webhook(
     From: str = Form(...),
     Body: str = Form(...),
+    MessageSid: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     """
     Twilio WhatsApp webhook endpoint.
     
     Receives messages from WhatsApp and returns TwiML response.
+    Twilio retries on timeout with the same MessageSid; a retry gets the
+    TwiML produced the first time instead of creating another query.
+    
+    With WEBHOOK_ASYNC_REPLY the message is queued and an empty TwiML is
+    returned at once, without touching the database; the reply is sent
+    later through the Twilio REST API. The endpoint is async only so the
+    reply queue is fed from the event loop; the synchronous path runs in
+    the threadpool.
+    """
+    replay_key = f"whatsapp:{MessageSid}" if MessageSid else None
+    
+    if settings.WEBHOOK_ASYNC_REPLY:
+        # Retries of already answered messages are dropped by the worker
+        if replay_key is None or idempotency_cache.peek(replay_key) is None:
+            if not reply_worker.submit(ReplyJob(From, Body, replay_key)):
+                # Queue full: let Twilio retry later
+                return Response(status_code=503)
+        return _twiml()
+    
+    # The reply needs the database; keep it off the event loop
+    return await run_in_threadpool(_answer, db, From, Body, replay_key)
+
+
+@router.post("/sms")
+def sms_webhook(
+    From: str = Form(...),
+    Body: str = Form(...),
+    MessageSid: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Twilio SMS webhook endpoint for basic phones.
+    
+    Same conversation as WhatsApp (consent, CRP, MODULE), but every reply
+    is folded to GSM-7 and cut to SMS_MAX_SEGMENTS, since a single emoji
+    switches the whole message to UCS-2 and multiplies the segment count.
+    """
+    replay_key = f"sms:{MessageSid}" if MessageSid else None
+    return _answer(db, From, Body, replay_key, channel="sms")
+
+
+def _answer(db: Session, From: str, Body: str, replay_key: Optional[str], channel: str = "whatsapp"):
+    """
+    Reply TwiML for one message; a retry with the same key gets the first reply.
+    
+    The key is claimed before any work, so a retry that arrives while
+    the first delivery is still being answered waits for that reply
+    (503, for Twilio to retry again, if it takes too long). The key
+    stores the reply text, as the async reply worker does, so either
+    path can replay what the other stored.
     """
-    # Create messaging response
+    if replay_key:
+        cached = idempotency_cache.get(db, replay_key)
+        if cached is not None:
+            return _twiml(cached)
+        if not idempotency_cache.claim(db, replay_key):
+            cached = idempotency_cache.wait(db, replay_key)
+            return _twiml(cached) if cached is not None else Response(status_code=503)
+    
+    try:
+        text = _reply_text(db, From, Body, channel=channel)
+        if channel == "sms":
+            text = sms_renderer.compact(text)
+    except Exception:
+        if replay_key:
+            idempotency_cache.release(db, replay_key)
+        raise
+    
+    if replay_key:
+        text = idempotency_cache.put(db, replay_key, text)
+    
+    return _twiml(text)
+
+
+def _twiml(body: Optional[str] = None) -> str:
+    """TwiML reply document (twilio is imported on the first webhook, not at startup)."""
+    from twilio.twiml.messaging_response import MessagingResponse
+    
     resp = MessagingResponse()
-    msg = resp.message()
+    if body is not None:
+        resp.message().body(body)
+    return str(resp)
+
+
+def _reply_text(db: Session, From: str, Body: str, channel: str = "whatsapp") -> str:
+    """
+    Process one inbound message and return the reply text.
     
+    Conversation state (cluster, last query, pending consent) comes from
+    the session store, so keywords need no DB lookup to find context.
+    WhatsApp and SMS share the session of a phone number; on "sms" the
+    advice comes compacted to the segment budget, with the same cluster
+    and language overrides as on WhatsApp.
+    """
     # Parse incoming message
     phone = From.replace("whatsapp:", "")
     message_text = Body.strip()
+    command = message_text.upper()
     
-    # Check for consent response
-    if message_text.upper() == "YES":
-        msg.body(
-            "Thank you for opting in! You can now send your classroom questions "
-            "and receive immediate support. How can I help you today?"
+    phone_hash = hash_phone_number(phone)
+    session = session_store.get_or_create(phone_hash)
+    if channel == "whatsapp" and session.address != From:
+        # Lets broadcasts reach this teacher while the session lives
+        session = session_store.update(phone_hash, address=From)
+    if session.consented is None:
+        # Once per session: has this number used EduPulse before?
+        session = session_store.update(
+            phone_hash, consented=not check_consent_required(phone_hash, db)
         )
-        return str(resp)
-    
-    # Default cluster for WhatsApp (can be enhanced with NLU)
-    # For MVP, we'll ask user to include cluster in message or use a default
-    cluster = "General"
     
-    # Detect if message contains cluster info
-    cluster_keywords = {
-        "cluster a": "Cluster A",
-        "cluster b": "Cluster B",
-        "cluster c": "Cluster C"
-    }
+    # Check for consent response
+    if command == "YES":
+        pending_text = session.pending_text
+        session = session_store.update(phone_hash, consented=True, pending_text=None)
+        if not pending_text:
+            return (
+                "Thank you for opting in! You can now send your classroom questions "
+                "and receive immediate support. How can I help you today?"
+            )
+        # Answer the question that was held for consent
+        message_text = pending_text
+    elif not session.consented:
+        session_store.update(phone_hash, pending_text=message_text)
+        return get_consent_message()
+    elif command == "CRP":
+        return _flag_last_query(db, session)
+    elif command == "MODULE":
+        return _queue_module(db, session)
     
-    for keyword, cluster_name in cluster_keywords.items():
-        if keyword in message_text.lower():
-            cluster = cluster_name
-            break
+    # Use the cluster named in the message, else the one remembered for this teacher
+    cluster_matcher.ensure_loaded(db)
+    cluster = cluster_matcher.match(message_text) or session.cluster or "General"
+    topic = get_template_engine().detect_topic(message_text)
     
     # Create query request
     query_request = TeacherQueryCreate(
         phone=phone,
         cluster=cluster,
-        topic="general",  # Will be auto-detected
+        topic=topic,  # Detected once here; the query path takes it as given
         text=message_text,
-        consent_given=True  # Assume consent given for returning users
+        consent_given=True  # Consent confirmed above
     )
     
     # Call teacher query endpoint
@@ -67,20 +183,67 @@ async def whatsapp_webhook(
         response = create_teacher_query(query_request, db)
         
         if response.consent_required:
-            msg.body(response.advice)
-        else:
-            # Format response for WhatsApp
-            response_text = (
-                f"🎓 {response.advice}\n\n"
-                f"📹 Demo: {settings.FRONTEND_URL}{response.module_sample_link}\n\n"
-                f"💬 Reply 'CRP' to flag for classroom visit\n"
-                f"📚 Reply 'MODULE' to request training material"
-            )
-            msg.body(response_text)
+            return response.advice
+        
+        session_store.update(
+            phone_hash,
+            cluster=cluster,
+            last_query_id=response.id,
+            last_topic=topic
+        )
+        
+        if channel == "sms":
+            return sms_renderer.advice(topic, cluster)
+        
+        # Format response for WhatsApp
+        return (
+            f"🎓 {response.advice}\n\n"
+            f"📹 Demo: {settings.FRONTEND_URL}{response.module_sample_link}\n\n"
+            f"💬 Reply 'CRP' to flag for classroom visit\n"
+            f"📚 Reply 'MODULE' to request training material"
+        )
+    
+    except HTTPException as e:
+        # Admission control: rate limited or saturated
+        return e.detail
     
     except Exception as e:
-        msg.body(
-            "Sorry, I encountered an error. Please try again or contact support."
-        )
+        return "Sorry, I encountered an error. Please try again or contact support."
+
+
+def _flag_last_query(db: Session, session: ConversationSession) -> str:
+    """Handle 'CRP': flag the teacher's last query for a classroom visit."""
+    if not session.last_query_id:
+        return "Please send your classroom question first, then reply 'CRP' to request a visit."
+    
+    db.query(TeacherQuery).filter(
+        TeacherQuery.id == session.last_query_id
+    ).update({TeacherQuery.flagged_for_crp: True}, synchronize_session=False)
+    db.commit()
+    
+    return "✅ Your last question has been flagged for a CRP classroom visit."
+
+
+def _queue_module(db: Session, session: ConversationSession) -> str:
+    """Handle 'MODULE': queue a micro-module for the last topic and cluster."""
+    if not session.last_topic:
+        return "Please send your classroom question first, then reply 'MODULE' for training material."
     
-    return str(resp)
\ No newline at end of file
+    module = module_builder.create(
+        db, session.cluster or "General", session.last_topic, render=False
+    )
+    module_builder.queue_render(module)
+    
+    base_url = os.getenv("BASE_URL", "http://127.0.0.1:8000")
+    return (
+        f"📚 Your training module is being prepared:\n"
+        f"{base_url}{settings.API_PREFIX}/diet/modules/{module.id}/download?format=html"
+    )
+
+
+reply_worker = ReplyWorker(
+    handler=_reply_text,
+    transport=create_transport(settings.WEBHOOK_REPLY_TRANSPORT)
+)
+
+sms_renderer = SmsRenderer()
@@ -11,13 +11,54 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "EduPulse"
     VERSION: str = "1.0.0"
     API_PREFIX: str = "/api"
+    # Development mode: allows stand-ins such as the stub message transport.
+    # gunicorn.conf.py turns it off for production launches.
+    DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
     
     # Database
     DATABASE_URL: str = os.getenv(
         "DATABASE_URL", 
         "sqlite:///./edupulse.db"
     )
+    # Analytics reads (e.g. a Postgres replica); defaults to DATABASE_URL
+    DATABASE_READ_URL: Optional[str] = os.getenv("DATABASE_READ_URL")
+    DB_POOL_SIZE: int = 10
+    DB_READ_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 10
+    DB_POOL_RECYCLE_SECONDS: int = 1800
     
+    # SQLite pragmas (per connection)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64000
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # Monthly teacher_queries partitions (PostgreSQL)
+    PARTITION_MONTHS_AHEAD: int = 3
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = 24 * 3600
+
+    # Similar-query index (hashed TF-IDF)
+    SIMILARITY_INDEX_PATH: str = "similarity_index"
+    SIMILARITY_FEATURES: int = 2 ** 20
+    SIMILARITY_MAX_DELTA: int = 5000
+    SIMILARITY_REFRESH_INTERVAL_SECONDS: int = 60
+    SIMILARITY_REBUILD_INTERVAL_SECONDS: int = 6 * 3600
+
+    # Cold storage: queries from past academic years move to gzip archives
+    ARCHIVE_PATH: str = "archive"
+    ARCHIVE_ACADEMIC_YEAR_START_MONTH: int = 6  # June
+    ARCHIVE_BATCH_SIZE: int = 2000
+    ARCHIVE_MAX_BATCHES: int = 50  # Per run, so a backlog is spread over runs
+    ARCHIVE_INTERVAL_SECONDS: int = 24 * 3600
+
+    # Right to erasure: rows are deleted in chunks within a time budget
+    ERASURE_CHUNK_SIZE: int = 500
+    ERASURE_REQUEST_BUDGET_SECONDS: float = 2.0  # Spent inline; the job finishes the rest
+    ERASURE_JOB_BUDGET_SECONDS: float = 30.0
+    ERASURE_INTERVAL_SECONDS: int = 60
+
     # Security
     SECRET_KEY: str = os.getenv(
         "SECRET_KEY", 
@@ -42,10 +83,82 @@ class Settings(BaseSettings):
     TWILIO_AUTH_TOKEN: Optional[str] = os.getenv("TWILIO_AUTH_TOKEN")
     TWILIO_PHONE_NUMBER: Optional[str] = os.getenv("TWILIO_PHONE_NUMBER")
     
+    # WhatsApp webhook: ack immediately and reply through the REST API
+    WEBHOOK_ASYNC_REPLY: bool = False
+    WEBHOOK_REPLY_TRANSPORT: str = "auto"  # twilio, stub, or auto (twilio if TWILIO_* set)
+    WEBHOOK_REPLY_CONCURRENCY: int = 4
+    WEBHOOK_REPLY_QUEUE_SIZE: int = 1000
+    WEBHOOK_REPLY_MAX_ATTEMPTS: int = 4
+    WEBHOOK_REPLY_BACKOFF_SECONDS: float = 0.5
+    
+    # Admission control on teacher queries (web and WhatsApp)
+    ADMISSION_GLOBAL_RATE: float = 200.0
+    ADMISSION_GLOBAL_BURST: int = 400
+    ADMISSION_PHONE_RATE: float = 1 / 6  # 10 queries a minute per number
+    ADMISSION_PHONE_BURST: int = 10
+    ADMISSION_PHONE_BUCKETS: int = 100000
+    ADMISSION_MAX_CONCURRENCY: Optional[int] = None  # Default: DB pool size + overflow
+    ADMISSION_WAIT_SECONDS: float = 0.25
+    WRITE_QUEUE_SIZE: int = 10000
+    WRITE_QUEUE_BATCH_SIZE: int = 200
+    
+    # Offline batch sync
+    SYNC_MAX_ITEMS: int = 200
+    SYNC_MAX_BYTES: int = 1024 * 1024  # Decompressed body limit
+    
+    # Near-duplicate suppression on ingest (MinHash over query text)
+    DEDUPE_ENABLED: bool = True
+    DEDUPE_THRESHOLD: float = 0.8  # Estimated Jaccard similarity of word shingles
+    DEDUPE_WINDOW_SECONDS: int = 24 * 3600
+    DEDUPE_MAX_ENTRIES: int = 20000
+    DEDUPE_MIN_CROSS_SENDER_WORDS: int = 12  # Shorter texts are only deduped per number
+    
+    # Broadcasts (new-module announcements); keep the rate under the provider's limit
+    BROADCAST_TRANSPORT: str = "auto"
+    BROADCAST_RATE_PER_SECOND: float = 20.0
+    BROADCAST_BURST: int = 20
+    BROADCAST_WORKERS: int = 4
+    BROADCAST_BATCH_SIZE: int = 500
+    BROADCAST_MAX_ATTEMPTS: int = 3
+    BROADCAST_BACKOFF_SECONDS: float = 0.5
+    
+    # SMS channel for basic phones
+    SMS_TRANSPORT: str = "auto"
+    SMS_MAX_SEGMENTS: int = 2
+    
+    # WhatsApp conversation sessions
+    SESSION_CACHE_SIZE: int = 50000
+    SESSION_TTL_SECONDS: int = 7 * 24 * 3600
+    SESSION_SPILL_PATH: Optional[str] = None  # e.g. "sessions.sqlite"
+    SESSION_WRITE_THROUGH: bool = False  # Needs a spill path; set with several workers
+
+    # Multi-worker deployment; gunicorn.conf.py sets the paths
+    INVALIDATION_PATH: Optional[str] = None  # e.g. "invalidation.sqlite", shared by the workers
+    INVALIDATION_POLL_SECONDS: float = 1.0
+    INVALIDATION_RETENTION_SECONDS: int = 3600
+    LEADER_LOCK_PATH: Optional[str] = None  # e.g. "scheduler.lock"; one worker runs the maintenance jobs
+
+    # /metrics (Prometheus text format)
+    METRICS_ENABLED: bool = True
+    METRICS_DIR: Optional[str] = None  # Per-worker snapshots merged by /metrics; set by gunicorn.conf.py
+    METRICS_SNAPSHOT_SECONDS: float = 5.0
+
+    # Idempotency (webhook retries, batch sync)
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_TTL_SECONDS: int = 48 * 3600
+    IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS: int = 3600
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0  # A retry waits this long for the in-flight reply (Twilio times out at 15)
+    IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS: int = 120  # A claim left this long unanswered is taken over
+    
     # File paths
     TEMPLATES_PATH: str = "templates/response_templates.yaml"
     EXPORTS_PATH: str = "exports"
     MEDIA_PATH: str = "media"
+    SAMPLES_PATH: str = "templates/samples"
+    
+    # Export store
+    EXPORTS_QUOTA_BYTES: int = 200 * 1024 * 1024
+    EXPORTS_COMPACTION_INTERVAL_SECONDS: int = 600
     
     class Config:
         case_sensitive = True
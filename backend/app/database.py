@@ -1,16 +1,78 @@
 """Database configuration and session management."""
-from sqlalchemy import create_engine
+from typing import Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
 
-# Create session factory
+def engine_options(url: str, read_only: bool = False) -> Dict:
+    """
+    create_engine() keyword arguments for a backend.
+
+    SQLite gets a thread-shareable connection, a busy timeout and, for a
+    file database, a sized pool; server databases get a sized,
+    pre-pinged, recycled pool. The read-only profile uses the smaller
+    analytics pool.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    pool = {
+        "pool_size": settings.DB_READ_POOL_SIZE if read_only else settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS
+    }
+    if backend == "sqlite":
+        options = {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+            }
+        }
+        if parsed.database not in (None, "", ":memory:"):
+            options.update(pool)
+        return options
+
+    options = dict(pool, pool_recycle=settings.DB_POOL_RECYCLE_SECONDS, pool_pre_ping=True)
+    if read_only and backend == "postgresql":
+        options["connect_args"] = {"options": "-c default_transaction_read_only=on"}
+    return options
+
+
+def _apply_sqlite_pragmas(engine: Engine, read_only: bool):
+    """Set per-connection pragmas (WAL lets readers run beside the writer)."""
+    in_memory = engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def create_engine_for(url: str, read_only: bool = False) -> Engine:
+    """Engine with the profile for its backend."""
+    new_engine = create_engine(url, **engine_options(url, read_only))
+    if new_engine.dialect.name == "sqlite":
+        _apply_sqlite_pragmas(new_engine, read_only)
+    return new_engine
+
+
+# Create database engines: writes go to `engine`; dashboard analytics read
+# through `read_engine` (a replica URL on Postgres, query_only on SQLite)
+engine = create_engine_for(settings.DATABASE_URL)
+read_engine = create_engine_for(settings.DATABASE_READ_URL or settings.DATABASE_URL, read_only=True)
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Base class for models
 Base = declarative_base()
@@ -25,6 +87,22 @@ def get_db():
         db.close()
 
 
-def init_db():
-    """Initialize database - create all tables."""
-    Base.metadata.create_all(bind=engine)
+def get_read_db():
+    """Dependency for read-only analytics endpoints."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def init_db(bind: Engine = engine):
+    """
+    Initialize database - apply the Alembic migrations.
+
+    A database created by create_all before migrations ran at startup is
+    stamped with the revision it matches first (see app.migrations).
+    """
+    from app.migrations import upgrade_schema
+
+    upgrade_schema(bind)
@@ -1,25 +1,53 @@
 """Main FastAPI application."""
 import os
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from app.config import settings
-from app.database import init_db
-from app.api import teacher, diet, lfa, webhook
+from app.database import init_db, engine, read_engine
+from app.api import teacher, diet, lfa, webhook, exports
+from app.services.export_store import run_compaction, usage_families
+from app.services import idempotency, cluster_matcher, partitions, similarity, archive
+from app.services.erasure import erasure_service
+from app.services.invalidation import invalidation_bus
+from app.services.session_store import session_store
+from app.services.broadcast import broadcast_engine
+from app.services.write_queue import query_write_queue
+from app.services.scheduler import scheduler
+from app.services.metrics import metrics, CONTENT_TYPE, InstrumentedRoute, pool_families, cache_families
+from app.services.template_engine import get_template_engine
+from app.services.idempotency import idempotency_cache
+from app.utils.static_files import CachedStaticFiles
 
-# Initialize database
-init_db()
 
-# Create exports directory
-os.makedirs(settings.EXPORTS_PATH, exist_ok=True)
-os.makedirs(settings.MEDIA_PATH, exist_ok=True)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepare the database and directories, then run the background jobs.
+
+    Importing this module has no side effects; everything that touches
+    the database or the filesystem happens here, once per worker (under
+    gunicorn the master has already migrated, see gunicorn.conf.py).
+    """
+    await run_in_threadpool(init_db)
+    os.makedirs(settings.EXPORTS_PATH, exist_ok=True)
+    os.makedirs(settings.MEDIA_PATH, exist_ok=True)
+    await start_background_jobs()
+    yield
+    await stop_background_jobs()
+
 
 # Create FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    description="Teacher support platform for low-bandwidth environments"
+    description="Teacher support platform for low-bandwidth environments",
+    lifespan=lifespan
 )
+app.router.route_class = InstrumentedRoute
 
 # CORS middleware
 app.add_middleware(
@@ -59,9 +87,14 @@ async def validation_exception_handler(request, exc: RequestValidationError):
         }
     )
 
-# Mount static files for exports and media
-app.mount("/exports", StaticFiles(directory=settings.EXPORTS_PATH), name="exports")
-app.mount("/media", StaticFiles(directory=settings.MEDIA_PATH), name="media")
+# Exports go through the quota-bounded export store; demo media rarely changes
+app.include_router(exports.router)
+app.mount(
+    "/media",
+    # The directory is created by the lifespan, after this mount
+    CachedStaticFiles(directory=settings.MEDIA_PATH, check_dir=False, cache_control="public, max-age=86400"),
+    name="media"
+)
 
 # Include routers
 app.include_router(teacher.router, prefix=settings.API_PREFIX)
@@ -70,6 +103,83 @@ app.include_router(lfa.router, prefix=settings.API_PREFIX)
 app.include_router(webhook.router, prefix=settings.API_PREFIX)
 
 
+def subscribe_invalidations():
+    """Drop this worker's cached copies when another worker changes the data behind them."""
+    invalidation_bus.poll()  # Start from now
+    invalidation_bus.subscribe("sessions", session_store.evict)
+    invalidation_bus.subscribe("clusters", lambda key: cluster_matcher.run_refresh())
+    invalidation_bus.subscribe("similarity", similarity.apply_invalidation)
+    invalidation_bus.subscribe("erasure", erasure_service.forget_in_memory)
+
+
+async def start_background_jobs():
+    """
+    Start periodic maintenance jobs (called from the lifespan).
+
+    Per-worker caches are refreshed in every worker; jobs on shared
+    tables and files run in the leader worker only.
+    """
+    subscribe_invalidations()
+    scheduler.add("metrics-snapshot", settings.METRICS_SNAPSHOT_SECONDS, metrics.write_snapshot)
+    scheduler.add("invalidation-poll", settings.INVALIDATION_POLL_SECONDS, invalidation_bus.poll)
+    scheduler.add("invalidation-trim", 3600, invalidation_bus.trim, leader_only=True)
+    scheduler.add(
+        "export-compaction",
+        settings.EXPORTS_COMPACTION_INTERVAL_SECONDS,
+        run_compaction,
+        leader_only=True
+    )
+    scheduler.add(
+        "idempotency-cleanup",
+        settings.IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS,
+        idempotency.run_cleanup,
+        leader_only=True
+    )
+    scheduler.add("session-expiry", 3600, session_store.purge_expired)
+    # Picks up clusters created by other workers or the seed script
+    scheduler.add("cluster-index-refresh", 300, cluster_matcher.run_refresh)
+    scheduler.add(
+        "partition-maintenance",
+        settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+        partitions.run_maintenance,
+        leader_only=True
+    )
+    scheduler.add(
+        "similarity-refresh",
+        settings.SIMILARITY_REFRESH_INTERVAL_SECONDS,
+        similarity.run_refresh
+    )
+    scheduler.add(
+        "similarity-rebuild",
+        settings.SIMILARITY_REBUILD_INTERVAL_SECONDS,
+        similarity.run_rebuild,
+        leader_only=True
+    )
+    scheduler.add(
+        "query-archive", settings.ARCHIVE_INTERVAL_SECONDS, archive.run_archive, leader_only=True
+    )
+    scheduler.add(
+        "erasure", settings.ERASURE_INTERVAL_SECONDS, erasure_service.run_pending, leader_only=True
+    )
+    scheduler.start()
+    if scheduler.is_leader():
+        # Jobs first run after one interval; make sure this month's partition exists now
+        await run_in_threadpool(partitions.run_maintenance)
+        # Continue broadcasts interrupted by the last shutdown
+        broadcast_engine.resume()
+        # Map or build the similarity index now rather than after one refresh interval
+        threading.Thread(target=similarity.run_refresh, name="similarity-refresh", daemon=True).start()
+
+
+async def stop_background_jobs():
+    """Stop periodic maintenance jobs and reply workers."""
+    await scheduler.stop()
+    await webhook.reply_worker.stop(10)
+    # Give queries answered in degraded mode a chance to reach the DB
+    await run_in_threadpool(query_write_queue.join, 10)
+    session_store.flush()
+
+
 @app.get("/")
 def root():
     """Root endpoint."""
@@ -86,6 +196,25 @@ def health_check():
     return {"status": "healthy", "version": settings.VERSION}
 
 
+def _cache_families():
+    """Cache hit counters; the template engine only once something has loaded it."""
+    caches = {"sessions": session_store, "idempotency": idempotency_cache}
+    if get_template_engine.cache_info().currsize:
+        caches["templates"] = get_template_engine()
+    return cache_families(caches)
+
+
+metrics.add_collector(lambda: pool_families({"write": engine, "read": read_engine}))
+metrics.add_collector(_cache_families)
+metrics.add_collector(usage_families, shared=True)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics for every worker on this host."""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
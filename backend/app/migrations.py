@@ -0,0 +1,79 @@
+"""Schema setup through the Alembic migrations."""
+import logging
+import os
+from typing import Optional
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_LOCATION = os.path.join(_BACKEND_DIR, "backend", "alembic")
+VERSION_LOCATION = os.path.join(_BACKEND_DIR, "backend", "backend", "alembic", "versions")
+
+
+def alembic_config(connection: Optional[Connection] = None):
+    """Alembic config for the bundled migrations, bound to a connection if given."""
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", SCRIPT_LOCATION)
+    config.set_main_option("version_locations", VERSION_LOCATION)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def legacy_revision(connection: Connection) -> Optional[str]:
+    """
+    Revision an unversioned database (built by create_all) already matches.
+
+    Databases created before startup ran migrations have tables but no
+    alembic_version row. The newest migration whose objects exist is
+    taken as applied. A PostgreSQL table created that way is not
+    partitioned; migration 006 would have to be run by hand.
+
+    Returns:
+        None for an empty database
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    if "teacher_queries" not in tables:
+        return None
+    columns = {c["name"] for c in inspector.get_columns("teacher_queries")}
+    indexes = {i["name"] for i in inspector.get_indexes("teacher_queries")}
+    recipient_columns = (
+        {c["name"] for c in inspector.get_columns("broadcast_recipients")}
+        if "broadcast_recipients" in tables else set()
+    )
+    markers = [
+        ("010", "address" in recipient_columns),
+        ("008", "erasure_tombstones" in tables),
+        ("007", "teacher_queries_fts" in tables or "narrative_tsv" in columns),
+        ("005", "ix_teacher_queries_crp_open" in indexes),
+        ("004", "broadcasts" in tables),
+        ("003", "idempotency_records" in tables),
+        ("002", "export_files" in tables),
+    ]
+    return next((revision for revision, present in markers if present), "001")
+
+
+def upgrade_schema(engine: Engine, revision: str = "head"):
+    """
+    Bring a database to `revision`, stamping an unversioned one first.
+
+    Args:
+        engine: Database to migrate
+        revision: Target revision
+    """
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+
+    with engine.begin() as connection:
+        config = alembic_config(connection)
+        if MigrationContext.configure(connection).get_current_revision() is None:
+            stamp = legacy_revision(connection)
+            if stamp is not None:
+                logger.info("Stamping unversioned database at revision %s", stamp)
+                command.stamp(config, stamp)
+        command.upgrade(config, revision)
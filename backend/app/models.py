@@ -1,10 +1,8 @@
 """SQLAlchemy ORM models."""
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Integer
-from sqlalchemy.dialects.postgresql import UUID as PGUUID
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Boolean, DateTime, Text, ForeignKey, Integer, Index, text, DDL, event
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 
 
@@ -45,8 +43,8 @@ class TeacherQuery(Base):
     
     id = Column(String, primary_key=True, default=generate_uuid)
     phone_hash = Column(String(64), nullable=True, index=True)  # SHA-256 hash
-    cluster_id = Column(String, ForeignKey("clusters.id"), nullable=False, index=True)
-    topic_tag = Column(String(100), nullable=False, index=True)
+    cluster_id = Column(String, ForeignKey("clusters.id"), nullable=False)  # Indexed via composites below
+    topic_tag = Column(String(100), nullable=False)
     narrative_text = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     resolved = Column(Boolean, default=False)
@@ -55,6 +53,58 @@ class TeacherQuery(Base):
     
     # Relationships
     cluster = relationship("Cluster", back_populates="queries")
+    
+    __table_args__ = (
+        # Covers broadcast recipient selection (index-only scan)
+        Index("ix_teacher_queries_broadcast", "cluster_id", "topic_tag", "consent_given", "phone_hash"),
+        # Dashboard filters: cluster + topic + date range, and topic + date range
+        Index("ix_teacher_queries_cluster_topic_created", "cluster_id", "topic_tag", "created_at"),
+        Index("ix_teacher_queries_topic_created", "topic_tag", "created_at"),
+        # CRP queue: only flagged, unresolved rows are indexed
+        Index(
+            "ix_teacher_queries_crp_open", "created_at", "cluster_id",
+            sqlite_where=text("flagged_for_crp = 1 AND resolved = 0"),
+            postgresql_where=text("flagged_for_crp AND NOT resolved")
+        ),
+    )
+
+
+# Full-text index over narrative_text, queried by app.services.search.
+# SQLite: an FTS5 external-content table (no second copy of the text)
+# kept in sync by triggers. teacher_queries has no INTEGER PRIMARY KEY, so
+# VACUUM may renumber rowids: rebuild the index afterwards
+# (SearchService.rebuild_index). Postgres: a generated tsvector column + GIN.
+TEACHER_QUERY_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS teacher_queries_fts USING fts5("
+        "narrative_text, content='teacher_queries', content_rowid='rowid', "
+        "tokenize='porter unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS teacher_queries_fts_ai AFTER INSERT ON teacher_queries BEGIN "
+        "INSERT INTO teacher_queries_fts(rowid, narrative_text) VALUES (new.rowid, new.narrative_text); END",
+        "CREATE TRIGGER IF NOT EXISTS teacher_queries_fts_ad AFTER DELETE ON teacher_queries BEGIN "
+        "INSERT INTO teacher_queries_fts(teacher_queries_fts, rowid, narrative_text) "
+        "VALUES ('delete', old.rowid, old.narrative_text); END",
+        "CREATE TRIGGER IF NOT EXISTS teacher_queries_fts_au AFTER UPDATE OF narrative_text ON teacher_queries BEGIN "
+        "INSERT INTO teacher_queries_fts(teacher_queries_fts, rowid, narrative_text) "
+        "VALUES ('delete', old.rowid, old.narrative_text); "
+        "INSERT INTO teacher_queries_fts(rowid, narrative_text) VALUES (new.rowid, new.narrative_text); END",
+    ],
+    "postgresql": [
+        "ALTER TABLE teacher_queries ADD COLUMN IF NOT EXISTS narrative_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(narrative_text, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_teacher_queries_narrative_tsv ON teacher_queries USING gin (narrative_tsv)",
+    ],
+}
+
+for _dialect, _statements in TEACHER_QUERY_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(TeacherQuery.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+# The FTS table is not in the metadata; drop it with its content table
+event.listen(
+    TeacherQuery.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS teacher_queries_fts").execute_if(dialect="sqlite")
+)
 
 
 class MicroModule(Base):
@@ -82,9 +132,74 @@ class LFADesign(Base):
     title = Column(String(200), nullable=False)
     problem_statement = Column(Text, nullable=False)
     student_change = Column(Text, nullable=False)
-    stakeholders_json = Column(Text)  # JSON array as text for SQLite compat
-    practice_changes_json = Column(Text)  # JSON array
-    indicators_json = Column(Text)  # JSON array
+    # JSON arrays as text for SQLite compat; only loaded when rendering
+    stakeholders_json = deferred(Column(Text), group="lfa_lists")
+    practice_changes_json = deferred(Column(Text), group="lfa_lists")
+    indicators_json = deferred(Column(Text), group="lfa_lists")
     exported_path = Column(String(500))
     created_at = Column(DateTime, default=datetime.utcnow)
-    created_by = Column(String, ForeignKey("diet_users.id"), nullable=True)
\ No newline at end of file
+    created_by = Column(String, ForeignKey("diet_users.id"), nullable=True)
+
+class ExportFile(Base):
+    """Index entry for a rendered file in the exports directory."""
+    __tablename__ = "export_files"
+    
+    filename = Column(String(255), primary_key=True)
+    owner_type = Column(String(20), nullable=False)  # "module" or "lfa"
+    owner_id = Column(String, nullable=False, index=True)
+    size_bytes = Column(Integer, default=0)
+    resident = Column(Boolean, default=True)  # False once evicted from disk
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IdempotencyRecord(Base):
+    """Response already produced for a retried request (e.g. Twilio MessageSid)."""
+    __tablename__ = "idempotency_records"
+    
+    key = Column(String(100), primary_key=True)  # "<scope>:<client key>"
+    response_body = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class Broadcast(Base):
+    """Announcement sent to every consenting teacher of a cluster and topic."""
+    __tablename__ = "broadcasts"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    cluster_id = Column(String, ForeignKey("clusters.id"), nullable=False)
+    topic_tag = Column(String(100), nullable=False)
+    module_id = Column(String, ForeignKey("micro_modules.id"), nullable=True)
+    message = Column(Text, nullable=False)
+    status = Column(String(20), default="running", index=True)  # running, done
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+
+class BroadcastRecipient(Base):
+    """Delivery state of one broadcast for one phone hash."""
+    __tablename__ = "broadcast_recipients"
+    
+    broadcast_id = Column(String, ForeignKey("broadcasts.id"), primary_key=True)
+    phone_hash = Column(String(64), primary_key=True)
+    status = Column(String(20), default="queued", nullable=False)  # queued, sent, failed, unreachable
+    address = Column(Text, nullable=True)  # Reply address sealed with app.utils.privacy.seal
+    attempts = Column(Integer, default=0)
+    provider_id = Column(String(100), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_broadcast_recipients_status", "broadcast_id", "status"),
+    )
+
+
+class ErasureTombstone(Base):
+    """Right-to-erasure request for one phone hash, kept after its rows are gone."""
+    __tablename__ = "erasure_tombstones"
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    phone_hash = Column(String(64), nullable=False, index=True)
+    status = Column(String(20), default="pending", nullable=False, index=True)  # pending, running, done
+    rows_deleted = Column(Integer, default=0, nullable=False)
+    requested_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
@@ -1,6 +1,6 @@
 """Pydantic schemas for request/response validation."""
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, Field
 
 
@@ -12,6 +12,7 @@ class TeacherQueryCreate(BaseModel):
     topic: str = Field(default="general", description="Topic tag/identifier")
     text: str = Field(..., description="Problem narrative")
     consent_given: bool = Field(default=True, description="Explicit consent flag")
+    language: Optional[str] = Field(default=None, description="Preferred language code, e.g. 'hi' (default: cluster's)")
 
 
 class TeacherQueryResponse(BaseModel):
@@ -25,6 +26,34 @@ class TeacherQueryResponse(BaseModel):
         from_attributes = True
 
 
+class SyncItem(BaseModel):
+    """One query recorded offline by the teacher app."""
+    key: str = Field(..., min_length=1, max_length=64, description="Client-generated idempotency key")
+    cluster: str = Field(..., description="Cluster name")
+    topic: str = Field(default="", description="Topic tag (auto-detected if empty)")
+    text: str = Field(..., description="Problem narrative")
+    consent_given: bool = Field(default=True, description="Explicit consent flag")
+
+
+class SyncRequest(BaseModel):
+    """Batch of offline queries from one phone (body may be gzip-encoded)."""
+    phone: str = Field(..., description="Phone number with country code")
+    items: List[SyncItem]
+
+
+class SyncItemResult(BaseModel):
+    """Outcome of one synced item: created, duplicate, consent_required or invalid."""
+    key: str
+    status: str
+    id: Optional[str] = None
+    topic: Optional[str] = None
+
+
+class SyncResponse(BaseModel):
+    """Per-item results, in request order."""
+    results: List[SyncItemResult]
+
+
 class TeacherQueryDetail(BaseModel):
     """Detailed teacher query."""
     id: str
@@ -39,6 +68,23 @@ class TeacherQueryDetail(BaseModel):
         from_attributes = True
 
 
+class ErasureRequest(BaseModel):
+    """Right-to-erasure request for every query sent from a phone."""
+    phone: str = Field(..., description="Phone number with country code")
+
+
+class ErasureStatus(BaseModel):
+    """Progress of an erasure request: pending, running or done."""
+    id: str
+    status: str
+    rows_deleted: int
+    requested_at: datetime
+    completed_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
 # Aggregation Schemas
 class AggregateRequest(BaseModel):
     """Request for aggregated data."""
@@ -69,6 +115,48 @@ class ModuleGenerateResponse(BaseModel):
     module_id: str
     pptx_link: str
     title: str
+    compact_link: Optional[str] = Field(default=None, description="Low-bandwidth HTML version")
+
+
+class BroadcastResponse(BaseModel):
+    """State of a module announcement broadcast."""
+    broadcast_id: str
+    status: str
+    recipients: Dict[str, int] = Field(default_factory=dict, description="Recipient count by delivery status")
+
+
+class SearchHit(BaseModel):
+    """One full-text search match."""
+    id: str
+    cluster: str
+    topic: str
+    created_at: datetime
+    snippet: str = Field(..., description="Matching excerpt, terms wrapped in [ ]")
+    rank: float = Field(..., description="Lower is more relevant")
+
+
+class SearchResponse(BaseModel):
+    """A page of search results."""
+    results: List[SearchHit]
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor for the next page")
+
+
+class SimilarQuery(BaseModel):
+    """A past query close to the one being read."""
+    id: str
+    cluster: str
+    topic: str
+    narrative_text: str
+    similarity: float = Field(..., description="TF-IDF cosine similarity, 0-1")
+
+
+class SimilarQueriesResponse(BaseModel):
+    """Nearest past queries and what their topics suggest."""
+    query_id: str
+    topic: str
+    results: List[SimilarQuery]
+    topic_votes: Dict[str, float] = Field(default_factory=dict, description="Similarity-weighted topic shares")
+    suggested_topic: Optional[str] = Field(default=None, description="Set when the neighbours disagree with the topic")
 
 
 # LFA Schemas
@@ -0,0 +1,115 @@
+"""Admission control for the teacher query path."""
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from app.config import settings
+from app.database import engine
+from app.utils.rate_limit import TokenBucket
+
+ADMIT = "admit"  # Normal path: the request may use the database
+DEGRADE = "degrade"  # Saturated: answer from templates, persist later
+REJECT = "reject"  # This phone is sending too fast
+
+
+def pool_capacity(default: int = 15) -> int:
+    """Connections the engine's pool can hand out (pool size + overflow)."""
+    pool = engine.pool
+    try:
+        return pool.size() + max(pool._max_overflow, 0)
+    except (AttributeError, TypeError):
+        return default
+
+
+def _on_event_loop() -> bool:
+    """True when called from the thread running an asyncio event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class AdmissionController:
+    """
+    Decide, before touching the database, whether to serve a request.
+
+    A per-phone-hash token bucket rejects floods from one number; a global
+    bucket and a concurrency limit sized to the connection pool switch the
+    request to the degraded path instead of letting it wait for a
+    connection until it times out. Only a request running in a worker
+    thread waits up to `wait_seconds` for a slot; on the event loop the
+    slot is taken without waiting, since a wait there stalls every request.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = settings.ADMISSION_GLOBAL_RATE,
+        global_burst: int = settings.ADMISSION_GLOBAL_BURST,
+        phone_rate: float = settings.ADMISSION_PHONE_RATE,
+        phone_burst: int = settings.ADMISSION_PHONE_BURST,
+        max_concurrency: Optional[int] = settings.ADMISSION_MAX_CONCURRENCY,
+        wait_seconds: float = settings.ADMISSION_WAIT_SECONDS,
+        max_phones: int = settings.ADMISSION_PHONE_BUCKETS
+    ):
+        """Initialize buckets and the concurrency limit (default: pool capacity)."""
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.phone_rate = phone_rate
+        self.phone_burst = phone_burst
+        self.max_concurrency = max_concurrency or pool_capacity()
+        self.wait_seconds = wait_seconds
+        self.max_phones = max_phones
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._phones: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.degraded = 0
+        self.rejected = 0
+
+    @contextmanager
+    def admit(self, phone_hash: str) -> Iterator[str]:
+        """
+        Classify a request as ADMIT, DEGRADE or REJECT.
+
+        An admitted request holds a concurrency slot until the block exits.
+        """
+        decision = self._decide(phone_hash)
+        try:
+            yield decision
+        finally:
+            if decision == ADMIT:
+                self._slots.release()
+
+    def forget(self, phone_hash: str):
+        """Drop the rate-limit state kept for a phone hash."""
+        with self._lock:
+            self._phones.pop(phone_hash, None)
+
+    def _decide(self, phone_hash: str) -> str:
+        """Take the tokens and slot for one request."""
+        if not self._phone_bucket(phone_hash).try_acquire():
+            self.rejected += 1
+            return REJECT
+        wait = 0 if _on_event_loop() else self.wait_seconds
+        if self.global_bucket.try_acquire() and self._slots.acquire(timeout=wait):
+            self.admitted += 1
+            return ADMIT
+        self.degraded += 1
+        return DEGRADE
+
+    def _phone_bucket(self, phone_hash: str) -> TokenBucket:
+        """Bucket for a phone hash; the least recently seen are dropped past the bound."""
+        with self._lock:
+            bucket = self._phones.get(phone_hash)
+            if bucket is None:
+                bucket = TokenBucket(self.phone_rate, self.phone_burst)
+                self._phones[phone_hash] = bucket
+                while len(self._phones) > self.max_phones:
+                    self._phones.popitem(last=False)
+            else:
+                self._phones.move_to_end(phone_hash)
+            return bucket
+
+
+admission_controller = AdmissionController()
@@ -1,9 +1,10 @@
 """Aggregation service for DIET dashboard analytics."""
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, true, false
 from datetime import datetime
 from typing import Dict, List, Optional
 from app.models import TeacherQuery, Cluster
+from app.services.archive import query_archive
 
 
 class AggregationService:
@@ -15,7 +16,8 @@ class AggregationService:
         cluster: Optional[str] = None,
         topic: Optional[str] = None,
         date_from: Optional[str] = None,
-        date_to: Optional[str] = None
+        date_to: Optional[str] = None,
+        include_archived: bool = True
     ) -> Dict:
         """
         Get aggregated statistics with filters.
@@ -26,6 +28,7 @@ class AggregationService:
             topic: Filter by topic tag
             date_from: ISO date string
             date_to: ISO date string
+            include_archived: Add rows moved to the cold-storage archive to the counts
         
         Returns:
             Dict with counts, breakdowns, and sample queries
@@ -34,27 +37,33 @@ class AggregationService:
         query = db.query(TeacherQuery)
         
         # Apply filters
+        cluster_id = None
         if cluster:
             cluster_obj = db.query(Cluster).filter(Cluster.name == cluster).first()
-            if cluster_obj:
-                query = query.filter(TeacherQuery.cluster_id == cluster_obj.id)
+            # Unknown cluster: match nothing rather than everything
+            cluster_id = cluster_obj.id if cluster_obj else ""
+            query = query.filter(TeacherQuery.cluster_id == cluster_id)
         
         if topic:
             query = query.filter(TeacherQuery.topic_tag == topic)
         
+        # Shared by the breakdowns, so partitioned tables are pruned to the range there too
+        date_filters = []
+        from_date = to_date = None
         if date_from:
             try:
                 from_date = datetime.fromisoformat(date_from)
-                query = query.filter(TeacherQuery.created_at >= from_date)
+                date_filters.append(TeacherQuery.created_at >= from_date)
             except ValueError:
                 pass
         
         if date_to:
             try:
                 to_date = datetime.fromisoformat(date_to)
-                query = query.filter(TeacherQuery.created_at <= to_date)
+                date_filters.append(TeacherQuery.created_at <= to_date)
             except ValueError:
                 pass
+        query = query.filter(*date_filters)
         
         # Total count
         total_queries = query.count()
@@ -64,11 +73,11 @@ class AggregationService:
         topic_counts = db.query(
             TeacherQuery.topic_tag,
             func.count(TeacherQuery.id)
-        ).group_by(TeacherQuery.topic_tag)
+        ).filter(*date_filters).group_by(TeacherQuery.topic_tag)
         
         if cluster:
             topic_counts = topic_counts.filter(
-                TeacherQuery.cluster_id == cluster_obj.id
+                TeacherQuery.cluster_id == cluster_id
             )
         
         for topic_name, count in topic_counts.all():
@@ -79,7 +88,7 @@ class AggregationService:
         cluster_counts = db.query(
             Cluster.name,
             func.count(TeacherQuery.id)
-        ).join(TeacherQuery).group_by(Cluster.name)
+        ).join(TeacherQuery).filter(*date_filters).group_by(Cluster.name)
         
         if topic:
             cluster_counts = cluster_counts.filter(
@@ -89,6 +98,21 @@ class AggregationService:
         for cluster_name, count in cluster_counts.all():
             by_cluster[cluster_name] = count
         
+        if include_archived:
+            # Same filters as above, answered from the archive rollups
+            topic_filter = topic or None
+            total_queries += sum(query_archive.rollup(cluster_id, topic_filter, from_date, to_date).values())
+            for (_, topic_name), count in query_archive.rollup(cluster_id, None, from_date, to_date).items():
+                by_topic[topic_name] = by_topic.get(topic_name, 0) + count
+            archived_by_cluster = query_archive.rollup(None, topic_filter, from_date, to_date)
+            if archived_by_cluster:
+                names = dict(db.query(Cluster.id, Cluster.name).filter(
+                    Cluster.id.in_({cluster_key for cluster_key, _ in archived_by_cluster})
+                ))
+                for (cluster_key, _), count in archived_by_cluster.items():
+                    name = names.get(cluster_key, cluster_key)
+                    by_cluster[name] = by_cluster.get(name, 0) + count
+        
         # Sample queries (limit 10)
         sample_queries = query.order_by(
             TeacherQuery.created_at.desc()
@@ -112,6 +136,31 @@ class AggregationService:
             ]
         }
     
+    @staticmethod
+    def get_crp_queue(db: Session, cluster: Optional[str] = None, limit: int = 50) -> List[TeacherQuery]:
+        """
+        Flagged, unresolved queries awaiting a CRP visit, newest first.
+        
+        Args:
+            db: Database session
+            cluster: Filter by cluster name
+            limit: Maximum rows
+        
+        Returns:
+            List of TeacherQuery rows
+        """
+        # Literal booleans (not bound parameters) so the planner can match
+        # the predicate of the partial index ix_teacher_queries_crp_open
+        query = db.query(TeacherQuery).filter(
+            TeacherQuery.flagged_for_crp == true(),
+            TeacherQuery.resolved == false()
+        )
+        if cluster:
+            cluster_obj = db.query(Cluster).filter(Cluster.name == cluster).first()
+            query = query.filter(TeacherQuery.cluster_id == (cluster_obj.id if cluster_obj else ""))
+        
+        return query.order_by(TeacherQuery.created_at.desc()).limit(limit).all()
+    
     @staticmethod
     def get_topic_trends(db: Session, days: int = 30) -> List[Dict]:
         """
@@ -0,0 +1,537 @@
+"""Cold storage for old teacher queries: monthly gzip NDJSON archives."""
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import or_, true, false
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import TeacherQuery
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker is the only mode
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    "id", "phone_hash", "cluster_id", "topic_tag", "narrative_text",
+    "created_at", "resolved", "flagged_for_crp", "consent_given"
+)
+_MANIFEST = "manifest.json"
+_LOCK_FILE = "archive.lock"
+_INDEX_SUFFIX = ".index.json"
+_FILTER_HASHES = 7
+
+
+def _filter_positions(phone_hash: str, bits: int) -> List[int]:
+    """Bloom filter bit positions of a phone hash."""
+    digest = hashlib.sha256(phone_hash.encode("utf-8")).digest()
+    return [int.from_bytes(digest[i * 4:i * 4 + 4], "big") % bits for i in range(_FILTER_HASHES)]
+
+
+def phone_filter(phone_hashes: Iterable[str]) -> str:
+    """Base64 Bloom filter (about 10 bits per phone, ~1% false positives) over phone hashes."""
+    phones = set(phone_hashes)
+    bits = bytearray(max(8, (len(phones) * 10 + 7) // 8))
+    for phone_hash in phones:
+        for position in _filter_positions(phone_hash, len(bits) * 8):
+            bits[position // 8] |= 1 << (position % 8)
+    return base64.b64encode(bytes(bits)).decode("ascii")
+
+
+def filter_may_contain(encoded: str, phone_hash: str) -> bool:
+    """False only if the phone hash is certainly not in the filter."""
+    bits = base64.b64decode(encoded)
+    return all(bits[p // 8] & (1 << (p % 8)) for p in _filter_positions(phone_hash, len(bits) * 8))
+
+
+def academic_year_start(now: datetime, start_month: int = settings.ARCHIVE_ACADEMIC_YEAR_START_MONTH) -> datetime:
+    """First day of the academic year containing `now`."""
+    year = now.year if now.month >= start_month else now.year - 1
+    return datetime(year, start_month, 1)
+
+
+class QueryArchive:
+    """
+    Append-only monthly archives of teacher queries.
+
+    Rows created before the current academic year are moved, oldest
+    first, into one gzip NDJSON file per month. Every archiving batch is
+    appended as its own gzip member, and a small JSON index next to the
+    file records each member's offset, row count, time span and a
+    (cluster, topic, day) rollup. Counts are answered from the rollups;
+    only members cut by a date filter are decompressed, and exports
+    stream just the members that can match.
+
+    Open CRP cases (flagged, unresolved) stay in the hot table.
+
+    Each member also carries a Bloom filter of its phone hashes, so an
+    erasure request only decompresses and rewrites the members that may
+    hold the teacher's rows.
+
+    Archiving and erasure hold an flock on a file in the archive
+    directory, since they run in different gunicorn workers (the leader's
+    job and any worker's inline erasure) and rewrite the same files.
+    Readers take no lock: they open a month's data file together with the
+    index that points at it and read through that descriptor, so an
+    erasure that replaces and unlinks the file mid-read leaves them on a
+    consistent snapshot.
+    """
+
+    def __init__(
+        self,
+        path: str = settings.ARCHIVE_PATH,
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE
+    ):
+        """Initialize an archive rooted at `path`."""
+        self.path = path
+        self.batch_size = batch_size
+        self._indexes: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the archive against other threads and other worker processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.path, exist_ok=True)
+            fd = os.open(os.path.join(self.path, _LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)  # Releases the flock
+
+    # Archiving
+
+    def archive(
+        self,
+        db: Session,
+        before: Optional[datetime] = None,
+        max_batches: int = settings.ARCHIVE_MAX_BATCHES
+    ) -> int:
+        """
+        Move rows created before `before` (default: this academic year) to the archive.
+
+        Each batch is made durable in the archive before it is deleted
+        from the table. The manifest records the batch's ids and a batch
+        id before anything is appended, and every member it appends
+        carries that batch id. A run interrupted at any point is finished
+        next time (see _finish), so no row is archived twice or lost.
+
+        Returns:
+            Number of rows archived
+        """
+        before = before or academic_year_start(datetime.utcnow())
+        archived = 0
+        with self._exclusive():
+            manifest = self._read_manifest()
+            if manifest.get("pending"):
+                self._finish(db, manifest["pending"], manifest.get("batch"))
+
+            for _ in range(max_batches):
+                rows = db.query(TeacherQuery).filter(
+                    TeacherQuery.created_at < before,
+                    or_(TeacherQuery.flagged_for_crp == false(), TeacherQuery.resolved == true())
+                ).order_by(TeacherQuery.created_at, TeacherQuery.id).limit(self.batch_size).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                batch = uuid.uuid4().hex
+                self._write_manifest({"pending": ids, "batch": batch})
+                self._append_rows(rows, batch)
+                self._delete(db, ids)
+                archived += len(ids)
+        return archived
+
+    def _finish(self, db: Session, ids: List[str], batch: Optional[str]):
+        """
+        Complete a batch interrupted after its manifest was written (archive locked).
+
+        Months that already hold a member of the batch were appended
+        before the interruption; the batch's rows of the other months are
+        appended now, then all of them are deleted. A manifest without a
+        batch id was written after its rows were appended.
+        """
+        if batch is not None:
+            done = {
+                month for month in self.months()
+                if any(m.get("batch") == batch for m in self._load_index(month)["members"])
+            }
+            rows = db.query(TeacherQuery).filter(TeacherQuery.id.in_(ids)).all()
+            self._append_rows(rows, batch, skip_months=done)
+        self._delete(db, ids)
+
+    def _append_rows(self, rows: List[TeacherQuery], batch: str, skip_months: Iterable[str] = ()):
+        """Append a batch of rows as one member per month."""
+        by_month: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_month.setdefault(row.created_at.strftime("%Y-%m"), []).append(self._record(row))
+        for month, records in by_month.items():
+            if month not in skip_months:
+                self._append(month, records, batch)
+
+    def _delete(self, db: Session, ids: List[str]):
+        """Delete archived rows from the table and clear the pending list."""
+        db.query(TeacherQuery).filter(TeacherQuery.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        self._write_manifest({"pending": []})
+
+    @staticmethod
+    def _record(row: TeacherQuery) -> Dict:
+        """Archive record of a row."""
+        record = {field: getattr(row, field) for field in FIELDS}
+        record["created_at"] = row.created_at.isoformat()
+        return record
+
+    def _append(self, month: str, records: List[Dict], batch: Optional[str] = None):
+        """Append records as one gzip member and index it."""
+        os.makedirs(self.path, exist_ok=True)
+        current = self._load_index(month)
+        payload = self._compress(records)
+        index = {"data": self._data_name(month, current), "members": list(current["members"])}
+        # Bytes past the last indexed member (an interrupted append) are overwritten
+        offset = sum(m["length"] for m in index["members"])
+        with open(os.path.join(self.path, index["data"]), "ab") as f:
+            f.truncate(offset)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        index["members"].append(self._member(records, offset, len(payload), batch))
+        self._write_json(self._index_path(month), index)
+
+    @staticmethod
+    def _compress(records: List[Dict]) -> bytes:
+        """One gzip member of NDJSON records."""
+        return gzip.compress(
+            "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records).encode("utf-8")
+        )
+
+    @staticmethod
+    def _member(records: List[Dict], offset: int, length: int, batch: Optional[str] = None) -> Dict:
+        """Index entry of a member holding `records`, written by archiving batch `batch`."""
+        rollup = Counter(
+            f"{r['cluster_id']}\t{r['topic_tag']}\t{r['created_at'][:10]}" for r in records
+        )
+        return {
+            "batch": batch,
+            "offset": offset,
+            "length": length,
+            "rows": len(records),
+            "first": min(r["created_at"] for r in records),
+            "last": max(r["created_at"] for r in records),
+            "rollup": dict(rollup),
+            "phones": phone_filter(r["phone_hash"] for r in records if r["phone_hash"])
+        }
+
+    # Erasure
+
+    def erase(self, phone_hash: str) -> int:
+        """
+        Remove every archived record of a phone hash.
+
+        Only members whose phone filter may match are decompressed
+        (members written before filters existed always are). A month
+        that loses rows is rewritten to a new data file; replacing its
+        index switches readers over, and the old file is then deleted.
+
+        Returns:
+            Number of records removed
+        """
+        if not os.path.isdir(self.path):
+            return 0
+        removed = 0
+        with self._exclusive():
+            self._remove_orphans()
+            for month in self.months():
+                removed += self._erase_month(month, phone_hash)
+        return removed
+
+    def _erase_month(self, month: str, phone_hash: str) -> int:
+        """Rewrite one month without a phone hash's records (archive locked)."""
+        index = self._load_index(month)
+        old_name = self._data_name(month, index)
+        candidates = [
+            m for m in index["members"]
+            if "phones" not in m or filter_may_contain(m["phones"], phone_hash)
+        ]
+        if not candidates:
+            return 0
+        kept_members: Dict[int, List[Dict]] = {}
+        removed = 0
+        with open(os.path.join(self.path, old_name), "rb") as src:
+            member_records = [(member, list(self._read_member(src, member))) for member in candidates]
+        for member, records in member_records:
+            kept = [r for r in records if r["phone_hash"] != phone_hash]
+            if len(kept) != len(records):
+                kept_members[member["offset"]] = kept
+                removed += len(records) - len(kept)
+        if not removed:
+            return 0
+
+        new_name = f"{month}.{int(time.time() * 1000)}.ndjson.gz"
+        members = []
+        offset = 0
+        with open(os.path.join(self.path, old_name), "rb") as src, \
+                open(os.path.join(self.path, new_name), "wb") as dst:
+            for member in index["members"]:
+                if member["offset"] in kept_members:
+                    records = kept_members[member["offset"]]
+                    if not records:
+                        continue
+                    payload = self._compress(records)
+                    entry = self._member(records, offset, len(payload), member.get("batch"))
+                else:
+                    # Untouched members are copied without recompressing
+                    src.seek(member["offset"])
+                    payload = src.read(member["length"])
+                    entry = dict(member, offset=offset)
+                dst.write(payload)
+                members.append(entry)
+                offset += len(payload)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        if members:
+            self._write_json(self._index_path(month), {"data": new_name, "members": members})
+        else:
+            os.remove(self._index_path(month))
+            os.remove(os.path.join(self.path, new_name))
+        os.remove(os.path.join(self.path, old_name))
+        return removed
+
+    def _remove_orphans(self):
+        """
+        Delete data files no index points at (archive locked).
+
+        They are left behind by a rewrite interrupted before or after its
+        index was replaced, and may still hold erased records.
+        """
+        if not os.path.isdir(self.path):
+            return
+        referenced = {self._data_name(month, self._load_index(month)) for month in self.months()}
+        for name in os.listdir(self.path):
+            if name.endswith(".ndjson.gz") and name not in referenced:
+                os.remove(os.path.join(self.path, name))
+
+    # Reading
+
+    def months(self) -> List[str]:
+        """Archived months, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name[:-len(_INDEX_SUFFIX)] for name in os.listdir(self.path) if name.endswith(_INDEX_SUFFIX))
+
+    def iter_records(
+        self,
+        cluster_id: Optional[str] = None,
+        topic: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Iterator[Dict]:
+        """
+        Stream archived records matching the filters, oldest month first.
+
+        Months and members outside the date range, or whose rollup has no
+        matching cluster/topic, are skipped without decompressing.
+        """
+        for data, member in self._members(date_from, date_to):
+            if not self._rollup_matches(member, cluster_id, topic):
+                continue
+            for record in self._read_member(data, member):
+                if self._matches(record, cluster_id, topic, date_from, date_to):
+                    yield record
+
+    def rollup(
+        self,
+        cluster_id: Optional[str] = None,
+        topic: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Counter:
+        """
+        Archived row counts by (cluster_id, topic) matching the filters.
+
+        Members entirely inside the date range are counted from their
+        index; only members cut by the range are streamed.
+        """
+        counts: Counter = Counter()
+        for data, member in self._members(date_from, date_to):
+            inside = (
+                (date_from is None or datetime.fromisoformat(member["first"]) >= date_from)
+                and (date_to is None or datetime.fromisoformat(member["last"]) <= date_to)
+            )
+            if inside:
+                for key, count in member["rollup"].items():
+                    row_cluster, row_topic, _ = key.split("\t")
+                    if (cluster_id is None or row_cluster == cluster_id) and (topic is None or row_topic == topic):
+                        counts[(row_cluster, row_topic)] += count
+            elif self._rollup_matches(member, cluster_id, topic):
+                for record in self._read_member(data, member):
+                    if self._matches(record, cluster_id, topic, date_from, date_to):
+                        counts[(record["cluster_id"], record["topic_tag"])] += 1
+        return counts
+
+    def stats(self) -> Dict:
+        """Archived months, rows and bytes."""
+        months = self.months()
+        rows = size = 0
+        for month in months:
+            with self._open_month(month) as (index, data):
+                rows += sum(m["rows"] for m in index["members"])
+                size += os.fstat(data.fileno()).st_size if data else 0
+        return {"months": len(months), "rows": rows, "bytes": size}
+
+    def _members(self, date_from: Optional[datetime], date_to: Optional[datetime]) -> Iterator[Tuple[BinaryIO, Dict]]:
+        """(data file, member) pairs whose time span overlaps the range."""
+        first_month = date_from.strftime("%Y-%m") if date_from else None
+        last_month = date_to.strftime("%Y-%m") if date_to else None
+        for month in self.months():
+            if (first_month and month < first_month) or (last_month and month > last_month):
+                continue
+            with self._open_month(month) as (index, data):
+                for member in index["members"]:
+                    if date_from and datetime.fromisoformat(member["last"]) < date_from:
+                        continue
+                    if date_to and datetime.fromisoformat(member["first"]) > date_to:
+                        continue
+                    yield data, member
+
+    @staticmethod
+    def _rollup_matches(member: Dict, cluster_id: Optional[str], topic: Optional[str]) -> bool:
+        """True if the member can hold rows for the cluster and topic."""
+        if cluster_id is None and topic is None:
+            return True
+        for key in member["rollup"]:
+            row_cluster, row_topic, _ = key.split("\t")
+            if (cluster_id is None or row_cluster == cluster_id) and (topic is None or row_topic == topic):
+                return True
+        return False
+
+    @staticmethod
+    def _matches(
+        record: Dict,
+        cluster_id: Optional[str],
+        topic: Optional[str],
+        date_from: Optional[datetime],
+        date_to: Optional[datetime]
+    ) -> bool:
+        """Apply the filters to one record."""
+        if cluster_id is not None and record["cluster_id"] != cluster_id:
+            return False
+        if topic is not None and record["topic_tag"] != topic:
+            return False
+        created_at = datetime.fromisoformat(record["created_at"])
+        return (date_from is None or created_at >= date_from) and (date_to is None or created_at <= date_to)
+
+    @staticmethod
+    def _read_member(data: BinaryIO, member: Dict) -> Iterator[Dict]:
+        """Decompress one member of an open data file and yield its records."""
+        data.seek(member["offset"])
+        payload = data.read(member["length"])
+        for line in gzip.decompress(payload).splitlines():
+            yield json.loads(line)
+
+    # Files
+
+    def _index_path(self, month: str) -> str:
+        """Index file path of a month."""
+        return os.path.join(self.path, month + _INDEX_SUFFIX)
+
+    @staticmethod
+    def _data_name(month: str, index: Dict) -> str:
+        """Data file a month's index points at (rewrites give it a new name)."""
+        return index.get("data", f"{month}.ndjson.gz")
+
+    @contextmanager
+    def _open_month(self, month: str) -> Iterator[Tuple[Dict, Optional[BinaryIO]]]:
+        """
+        A month's index and the data file it points at, opened together.
+
+        If an erasure replaced the file between reading the index and
+        opening it, the new index is read and its file opened instead.
+        The data file is None for a month without members.
+        """
+        while True:
+            index = self._load_index(month)
+            if not index["members"]:
+                yield index, None
+                return
+            try:
+                data = open(os.path.join(self.path, self._data_name(month, index)), "rb")
+            except FileNotFoundError:
+                if self._load_index(month) is index:
+                    raise  # Not a rewrite: the index points at a missing file
+                continue
+            with data:
+                yield index, data
+            return
+
+    def _load_index(self, month: str) -> Dict:
+        """A month's index, cached until the file changes."""
+        index_path = self._index_path(month)
+        try:
+            stat = os.stat(index_path)
+        except OSError:
+            return {"members": []}
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._indexes.get(month)
+        if cached and cached[0] == version:
+            return cached[1]
+        with open(index_path) as f:
+            index = json.load(f)
+        self._indexes[month] = (version, index)
+        return index
+
+    def _read_manifest(self) -> Dict:
+        """Archiver state (the ids and batch id of a batch not yet deleted from the table)."""
+        try:
+            with open(os.path.join(self.path, _MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest: Dict):
+        """Atomically replace the manifest."""
+        os.makedirs(self.path, exist_ok=True)
+        self._write_json(os.path.join(self.path, _MANIFEST), manifest)
+
+    @staticmethod
+    def _write_json(path: str, value: Dict):
+        """Write JSON through a temp file and rename, so readers never see a partial file."""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(value, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+query_archive = QueryArchive()
+
+
+def run_archive() -> int:
+    """Periodic job: move queries from past academic years to the archive."""
+    db = SessionLocal()
+    try:
+        archived = query_archive.archive(db)
+        if archived:
+            logger.info("Archived %d teacher queries", archived)
+        return archived
+    finally:
+        db.close()
@@ -0,0 +1,221 @@
+"""Rate-limited announcements to every consenting teacher of a cluster and topic."""
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Broadcast, BroadcastRecipient, TeacherQuery
+from app.services.messaging import MessageTransport, TransportError, create_transport
+from app.services.session_store import session_store
+from app.utils.privacy import seal, unseal
+from app.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def session_address(phone_hash: str) -> Optional[str]:
+    """
+    Reply address of a teacher with a live WhatsApp session.
+
+    Teacher queries only store hashes, so a teacher can be reached only
+    while the session store still holds the address they wrote from.
+    """
+    session = session_store.get(phone_hash)
+    return session.address if session is not None else None
+
+
+class BroadcastEngine:
+    """
+    Queue and send broadcasts.
+
+    Recipients are written as `queued` rows when a broadcast is created,
+    with the reply address known at that point sealed into the row, so
+    a restart (which empties the session store) does not make them
+    unreachable. A single runner thread then walks them in pages, sends through a
+    token bucket shared by a small pool of sender threads, and records
+    each page's outcome in one batched UPDATE. Broadcasts left `running`
+    by a restart are picked up again by resume(); at most one page of
+    messages may be sent twice in that case.
+    """
+
+    def __init__(
+        self,
+        transport: MessageTransport,
+        session_factory: Callable[[], Session] = SessionLocal,
+        resolve_address: Callable[[str], Optional[str]] = session_address,
+        rate_per_second: float = settings.BROADCAST_RATE_PER_SECOND,
+        burst: int = settings.BROADCAST_BURST,
+        workers: int = settings.BROADCAST_WORKERS,
+        batch_size: int = settings.BROADCAST_BATCH_SIZE,
+        max_attempts: int = settings.BROADCAST_MAX_ATTEMPTS,
+        backoff_seconds: float = settings.BROADCAST_BACKOFF_SECONDS
+    ):
+        """Initialize with the outbound transport and provider limits."""
+        self.transport = transport
+        self.session_factory = session_factory
+        self.resolve_address = resolve_address
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broadcast")
+        self._senders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="broadcast-send")
+        self._running: Dict[str, Future] = {}
+
+    def create(
+        self,
+        db: Session,
+        cluster_id: str,
+        topic: str,
+        message: str,
+        module_id: Optional[str] = None
+    ) -> Broadcast:
+        """
+        Create a broadcast and queue one row per consenting phone hash.
+
+        Recipients are streamed from the covering index on
+        teacher_queries and inserted in batches, in the same transaction
+        as the broadcast row.
+        """
+        broadcast = Broadcast(
+            cluster_id=cluster_id,
+            topic_tag=topic,
+            module_id=module_id,
+            message=message,
+            status="running"
+        )
+        db.add(broadcast)
+        db.flush()
+
+        recipients = db.query(TeacherQuery.phone_hash).filter(
+            TeacherQuery.cluster_id == cluster_id,
+            TeacherQuery.topic_tag == topic,
+            TeacherQuery.consent_given == True,
+            TeacherQuery.phone_hash.isnot(None)
+        ).distinct().execution_options(yield_per=self.batch_size)
+
+        batch = []
+        for (phone_hash,) in recipients:
+            address = self.resolve_address(phone_hash)
+            batch.append({
+                "broadcast_id": broadcast.id,
+                "phone_hash": phone_hash,
+                "status": "queued",
+                "address": seal(address) if address else None,
+                "attempts": 0
+            })
+            if len(batch) >= self.batch_size:
+                db.execute(insert(BroadcastRecipient), batch)
+                batch = []
+        if batch:
+            db.execute(insert(BroadcastRecipient), batch)
+
+        db.commit()
+        db.refresh(broadcast)
+        return broadcast
+
+    def start(self, broadcast_id: str) -> Future:
+        """Send a broadcast in the background (no-op if already running)."""
+        future = self._running.get(broadcast_id)
+        if future is None or future.done():
+            future = self._runner.submit(self._run, broadcast_id)
+            self._running[broadcast_id] = future
+        return future
+
+    def resume(self) -> int:
+        """
+        Restart every broadcast left running (e.g. after a restart).
+
+        Returns:
+            Number of broadcasts resumed
+        """
+        db = self.session_factory()
+        try:
+            ids = [b_id for (b_id,) in db.query(Broadcast.id).filter(Broadcast.status == "running")]
+        finally:
+            db.close()
+        for broadcast_id in ids:
+            self.start(broadcast_id)
+        return len(ids)
+
+    def stats(self, db: Session, broadcast_id: str) -> Dict[str, int]:
+        """Recipient counts by status."""
+        rows = db.query(BroadcastRecipient.status, func.count()).filter(
+            BroadcastRecipient.broadcast_id == broadcast_id
+        ).group_by(BroadcastRecipient.status).all()
+        return {status: count for status, count in rows}
+
+    def _run(self, broadcast_id: str):
+        """Runner thread: send every queued recipient, one page at a time."""
+        db = self.session_factory()
+        try:
+            broadcast = db.get(Broadcast, broadcast_id)
+            if broadcast is None or broadcast.status != "running":
+                return
+            message = broadcast.message
+
+            last_hash = ""
+            while True:
+                page = db.query(
+                    BroadcastRecipient.phone_hash, BroadcastRecipient.address, BroadcastRecipient.attempts
+                ).filter(
+                    BroadcastRecipient.broadcast_id == broadcast_id,
+                    BroadcastRecipient.status == "queued",
+                    BroadcastRecipient.phone_hash > last_hash
+                ).order_by(BroadcastRecipient.phone_hash).limit(self.batch_size).all()
+                if not page:
+                    break
+                last_hash = page[-1].phone_hash
+
+                outcomes = self._senders.map(
+                    lambda row: self._send_one(row.phone_hash, row.address, row.attempts or 0, message), page
+                )
+                now = datetime.utcnow()
+                db.execute(update(BroadcastRecipient), [
+                    {
+                        "broadcast_id": broadcast_id,
+                        "phone_hash": row.phone_hash,
+                        "status": status,
+                        "attempts": attempts,
+                        "provider_id": provider_id,
+                        "updated_at": now
+                    }
+                    for row, (status, attempts, provider_id) in zip(page, outcomes)
+                ])
+                db.commit()
+
+            broadcast.status = "done"
+            broadcast.completed_at = datetime.utcnow()
+            db.commit()
+        except Exception:
+            logger.exception("Broadcast %s stopped; it will resume on restart", broadcast_id)
+        finally:
+            db.close()
+
+    def _send_one(
+        self, phone_hash: str, sealed_address: Optional[str], attempts: int, message: str
+    ) -> Tuple[str, int, Optional[str]]:
+        """Deliver to one recipient; returns (status, attempts, provider id)."""
+        address = unseal(sealed_address) if sealed_address else None
+        if address is None:
+            # Not known when queued; the teacher may have written since
+            address = self.resolve_address(phone_hash)
+        if address is None:
+            return "unreachable", attempts, None
+
+        while attempts < self.max_attempts:
+            self.bucket.acquire()
+            attempts += 1
+            try:
+                return "sent", attempts, self.transport.send(address, message)
+            except TransportError as e:
+                logger.warning("Broadcast send failed (attempt %d): %s", attempts, e)
+                time.sleep(self.backoff_seconds * (2 ** (attempts - 1)))
+        return "failed", attempts, None
+
+
+broadcast_engine = BroadcastEngine(transport=create_transport(settings.BROADCAST_TRANSPORT))
@@ -0,0 +1,218 @@
+"""Find cluster names in free-text messages with a normalized token trie."""
+import re
+import logging
+import threading
+import unicodedata
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Cluster
+from app.services.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Romanization variants common in Indian place names (Hoskote/Hosakote,
+# Bagalkot/Bagalkote, Vijayapura/Wijayapura...). Applied in order.
+_FOLDS = [
+    ("aa", "a"), ("ee", "i"), ("oo", "u"), ("ou", "u"),
+    ("ph", "f"), ("sh", "s"), ("kh", "k"), ("gh", "g"), ("bh", "b"),
+    ("dh", "d"), ("th", "t"), ("jh", "j"), ("ch", "c"), ("ck", "k"),
+    ("w", "v"), ("z", "j"), ("q", "k"), ("y", "i"),
+]
+_REPEATS = re.compile(r"(.)\1+")
+_TOKEN = re.compile(r"\w+")
+
+# Generic words that may be omitted when a name is written in a message
+_GENERIC = {"cluster", "crc", "block"}
+
+# Names shorter than this (after normalization) are only matched exactly
+# as a whole message; "A" or "B" would otherwise match everywhere.
+_MIN_NAME_CHARS = 4
+_MIN_FUZZY_TOKEN = 4
+
+
+def fold_token(token: str) -> str:
+    """Fold spelling variants of a lowercase token onto one form."""
+    if not token.isascii():
+        return token
+    for source, target in _FOLDS:
+        token = token.replace(source, target)
+    token = _REPEATS.sub(r"\1", token)
+    # Trailing vowel is often dropped or added ("Bagalkot"/"Bagalkote")
+    if len(token) > _MIN_FUZZY_TOKEN and token[-1] in "aeiu":
+        token = token[:-1]
+    return token
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercase, strip Latin accents, tokenize and fold."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    chars = []
+    for ch in decomposed:
+        if unicodedata.combining(ch) and chars and chars[-1].isascii():
+            continue
+        chars.append(ch)
+    return [fold_token(t) for t in _TOKEN.findall("".join(chars))]
+
+
+def _deletes(token: str) -> Set[str]:
+    """The token and every variant with one character removed."""
+    variants = {token}
+    if len(token) >= _MIN_FUZZY_TOKEN:
+        variants.update(token[:i] + token[i + 1:] for i in range(len(token)))
+    return variants
+
+
+class _Node:
+    """Trie node keyed by folded tokens."""
+    __slots__ = ("children", "name")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.name: Optional[str] = None
+
+
+class ClusterMatcher:
+    """
+    Index of cluster names for matching inside WhatsApp messages.
+
+    Names are stored in a trie over folded tokens. Misspellings are
+    handled per token with a deletion-neighbourhood index (edit distance
+    one for tokens of 4+ characters), so a lookup costs a few dict
+    probes per message token whatever the number of clusters.
+
+    Lookups take no lock. add() (serialized by the lock) only inserts
+    trie nodes and replaces vocabulary entries with new frozensets, so
+    a concurrent match() never iterates a set that is being changed.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._root = _Node()
+        self._vocabulary: Dict[str, FrozenSet[str]] = {}
+        self._known_ids: Set[str] = set()
+        self._watermark: Optional[datetime] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._known_ids)
+
+    def add(self, name: str, cluster_id: Optional[str] = None):
+        """
+        Index one cluster name (and its form without generic words).
+
+        Args:
+            name: Display name, returned by match()
+            cluster_id: Cluster id, used to skip rows already indexed
+        """
+        tokens = normalize(name)
+        if not tokens:
+            return
+        variants = [tokens]
+        stripped = [t for t in tokens if t not in _GENERIC]
+        if stripped and stripped != tokens:
+            variants.append(stripped)
+
+        with self._lock:
+            if cluster_id is not None:
+                self._known_ids.add(cluster_id)
+            for variant in variants:
+                node = self._root
+                for token in variant:
+                    node = node.children.setdefault(token, _Node())
+                    for key in _deletes(token):
+                        indexed = self._vocabulary.get(key, frozenset())
+                        if token not in indexed:
+                            self._vocabulary[key] = indexed | {token}
+                if node.name is None:
+                    node.name = name
+
+    def add_created(self, name: str, cluster_id: str):
+        """Index a cluster this worker just created, and have the other workers pick it up."""
+        self.add(name, cluster_id)
+        invalidation_bus.publish("clusters", cluster_id)
+
+    def refresh(self, db: Session) -> int:
+        """
+        Index clusters created since the last refresh.
+
+        Returns:
+            Number of clusters added
+        """
+        query = db.query(Cluster.id, Cluster.name, Cluster.created_at)
+        if self._watermark is not None:
+            query = query.filter(Cluster.created_at >= self._watermark)
+
+        added = 0
+        for cluster_id, name, created_at in query.yield_per(1000):
+            if cluster_id in self._known_ids:
+                continue
+            self.add(name, cluster_id)
+            added += 1
+            if created_at and (self._watermark is None or created_at > self._watermark):
+                self._watermark = created_at
+        self._loaded = True
+        return added
+
+    def ensure_loaded(self, db: Session):
+        """Load every cluster on first use."""
+        if not self._loaded:
+            self.refresh(db)
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        Best cluster name mentioned in a message.
+
+        The longest match wins; ties go to the fewest corrected tokens,
+        then to the earliest position.
+
+        Returns:
+            Cluster display name, or None
+        """
+        tokens = normalize(text)
+        candidates = [self._candidates(t) for t in tokens]
+        best: Optional[Tuple[int, int, int, str]] = None
+
+        for start in range(len(tokens)):
+            stack = [(self._root, start, 0, 0)]
+            while stack:
+                node, position, edits, chars = stack.pop()
+                if node.name is not None and position > start:
+                    whole_message = start == 0 and position == len(tokens)
+                    if chars >= _MIN_NAME_CHARS or whole_message:
+                        key = (chars, -edits, -start, node.name)
+                        if best is None or key[:3] > best[:3]:
+                            best = key
+                if position == len(tokens):
+                    continue
+                for token, cost in candidates[position]:
+                    child = node.children.get(token)
+                    if child is not None:
+                        stack.append((child, position + 1, edits + cost, chars + len(token)))
+
+        return best[3] if best else None
+
+    def _candidates(self, token: str) -> List[Tuple[str, int]]:
+        """Indexed tokens within one edit of a message token, with their cost."""
+        found: Dict[str, int] = {}
+        for key in _deletes(token):
+            for indexed in self._vocabulary.get(key, ()):
+                if indexed == token:
+                    found[indexed] = 0
+                elif len(token) >= _MIN_FUZZY_TOKEN and len(indexed) >= _MIN_FUZZY_TOKEN:
+                    found.setdefault(indexed, 1)
+        return list(found.items())
+
+
+cluster_matcher = ClusterMatcher()
+
+
+def run_refresh() -> int:
+    """Periodic job: index clusters added by other workers or scripts."""
+    db = SessionLocal()
+    try:
+        return cluster_matcher.refresh(db)
+    finally:
+        db.close()
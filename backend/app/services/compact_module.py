@@ -0,0 +1,79 @@
+"""Compact single-file HTML rendering of micro-modules for slow links."""
+import os
+import gzip
+import html
+from typing import List, Union
+from app.services.module_content import generate_script
+from app.services.metrics import timed, RENDER_SECONDS
+
+COMPACT_SUFFIX = ".html.gz"
+
+# Inline, minimal styling: one file, no external requests
+_STYLE = (
+    "body{font:16px/1.4 sans-serif;max-width:40em;margin:auto;padding:8px}"
+    "h1{font-size:1.4em}h2{font-size:1.1em;margin-bottom:4px}"
+)
+
+
+class CompactModuleGenerator:
+    """Generate gzip-precompressed HTML micro-modules."""
+
+    def __init__(self, exports_path: str = "exports"):
+        """Initialize with exports directory (created on the first render)."""
+        self.exports_path = exports_path
+
+    @timed(RENDER_SECONDS, "module_html")
+    def generate_micro_module(
+        self,
+        title: str,
+        topic: str,
+        advice: str,
+        materials: Union[str, List[str]],
+        cluster: str,
+        output_filename: str
+    ) -> str:
+        """
+        Generate the compact counterpart of the 2-slide PPTX micro-module.
+
+        Takes the same inputs as PPTXGenerator.generate_micro_module and
+        writes the HTML gzip-compressed, ready to be served as-is with
+        Content-Encoding: gzip.
+
+        Returns:
+            Full path to generated file
+        """
+        steps = [s.strip() for s in advice.split('\n') if s.strip()]
+        if isinstance(materials, (list, tuple)):
+            materials = ", ".join(materials)
+        script = generate_script(topic, steps[0] if steps else advice)
+
+        e = html.escape
+        parts = [
+            "<!doctype html><meta charset=utf-8>",
+            "<meta name=viewport content='width=device-width'>",
+            f"<title>{e(title)}</title><style>{_STYLE}</style>",
+            f"<h1>{e(title)}</h1>",
+            f"<p>For: {e(cluster)}<br>Topic: {e(topic.replace('-', ' ').title())}</p>",
+            "<h2>Quick Action Steps</h2><ul>",
+            "".join(f"<li>{e(step)}" for step in steps),
+            "</ul><h2>Sample Classroom Script</h2>",
+            f"<p>{e(script)}</p>",
+            f"<h2>Materials Needed</h2><p>{e(str(materials))}</p>",
+            "<h2>Time Required</h2><p>15-20 minutes</p>",
+            "<h2>Support Available</h2>",
+            "<p>Contact your CRP · WhatsApp support · Demo video link</p>",
+        ]
+
+        os.makedirs(self.exports_path, exist_ok=True)
+        output_path = os.path.join(self.exports_path, output_filename)
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            # mtime=0 keeps the bytes deterministic for the same inputs
+            f.write(gzip.compress("".join(parts).encode("utf-8"), 9, mtime=0))
+        os.replace(tmp_path, output_path)
+        return output_path
+
+
+def compact_filename(pptx_filename: str) -> str:
+    """Name of the compact file cached next to a module PPTX."""
+    return os.path.splitext(pptx_filename)[0] + COMPACT_SUFFIX
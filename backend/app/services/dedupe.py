@@ -0,0 +1,225 @@
+"""Near-duplicate detection for incoming teacher queries (MinHash + LSH)."""
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from app.config import settings
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_TOKEN = re.compile(r"\w+")
+
+Signature = Tuple[int, ...]
+
+
+@dataclass
+class _Entry:
+    """One recently accepted query."""
+    query_id: str
+    phone_hash: str
+    signature: Signature
+    bands: Tuple[int, ...]
+    word_count: int
+    seen_at: float
+
+
+@dataclass
+class DuplicateMatch:
+    """An earlier query that a new message duplicates."""
+    query_id: str
+    similarity: float
+    same_sender: bool
+
+
+class NearDuplicateDetector:
+    """
+    Time-windowed MinHash/LSH index over query text.
+
+    Each accepted query is reduced to a MinHash signature of its word
+    shingles and filed under one bucket per LSH band. A new message is
+    compared only with entries sharing a band, so lookups cost the same
+    whatever the traffic. Entries leave the index after the window or
+    when the entry bound is reached, which bounds memory.
+
+    A resend from the same phone hash is a duplicate at any length. A
+    match across phone hashes (forwarded chain messages) needs at least
+    `min_cross_sender_words`, so short common questions from different
+    teachers are not counted as chain messages. Only a same-sender match
+    may stand in for the new query: the earlier id of another sender is
+    never handed back.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3,
+        threshold: float = settings.DEDUPE_THRESHOLD,
+        window_seconds: int = settings.DEDUPE_WINDOW_SECONDS,
+        max_entries: int = settings.DEDUPE_MAX_ENTRIES,
+        min_cross_sender_words: int = settings.DEDUPE_MIN_CROSS_SENDER_WORDS
+    ):
+        """Initialize an empty index; num_perm must be a multiple of bands."""
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.min_cross_sender_words = min_cross_sender_words
+
+        rng = random.Random(1)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[int, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.checked = 0
+        self.suppressed = 0  # Resent by the same teacher
+        self.cross_sender = 0  # Same text from another number, still stored
+        self.evicted = 0
+
+    def signature(self, text: str) -> Tuple[Signature, int]:
+        """
+        MinHash signature of a text's word shingles.
+
+        Returns:
+            (signature, number of words)
+        """
+        words = _TOKEN.findall(text.lower())
+        k = self.shingle_size
+        if len(words) <= k:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+            for s in shingles
+        ]
+        signature = tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._perms
+        )
+        return signature, len(words)
+
+    def find(self, text: str, phone_hash: str) -> Optional[DuplicateMatch]:
+        """
+        Recent query this message duplicates, or None.
+
+        A same-sender match is preferred over a closer one from another
+        number, so a resend is recognised even while a chain message is
+        circulating.
+        """
+        signature, word_count = self.signature(text)
+        now = time.time()
+        with self._lock:
+            self.checked += 1
+            self._expire(now)
+            candidates: Set[int] = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best: Optional[DuplicateMatch] = None
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                same_sender = entry.phone_hash == phone_hash
+                if not same_sender and min(word_count, entry.word_count) < self.min_cross_sender_words:
+                    continue
+                similarity = sum(
+                    x == y for x, y in zip(signature, entry.signature)
+                ) / self.num_perm
+                if similarity >= self.threshold and (
+                    best is None or (same_sender, similarity) > (best.same_sender, best.similarity)
+                ):
+                    best = DuplicateMatch(entry.query_id, similarity, same_sender)
+
+            if best is not None:
+                if best.same_sender:
+                    self.suppressed += 1
+                else:
+                    self.cross_sender += 1
+            return best
+
+    def add(self, query_id: str, text: str, phone_hash: str):
+        """Index an accepted query."""
+        signature, word_count = self.signature(text)
+        bands = tuple(self._band_keys(signature))
+        now = time.time()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(query_id, phone_hash, signature, bands, word_count, now)
+            for key in bands:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            self._expire(now)
+
+    def forget(self, phone_hash: str) -> int:
+        """
+        Drop every entry sent from a phone hash (right to erasure).
+
+        Returns:
+            Number of entries dropped
+        """
+        with self._lock:
+            doomed = [i for i, entry in self._entries.items() if entry.phone_hash == phone_hash]
+            for entry_id in doomed:
+                self._drop(entry_id)
+        return len(doomed)
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for the dashboard."""
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "suppressed": self.suppressed,
+                "cross_sender": self.cross_sender,
+                "evicted": self.evicted,
+                "entries": len(self._entries),
+                "window_seconds": self.window_seconds,
+                "max_entries": self.max_entries
+            }
+
+    def _band_keys(self, signature: Signature) -> List[int]:
+        """One bucket key per band."""
+        r = self.rows
+        return [hash((band, signature[band * r:(band + 1) * r])) for band in range(self.bands)]
+
+    def _expire(self, now: float):
+        """Evict entries past the window or the bound (lock held)."""
+        cutoff = now - self.window_seconds
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.seen_at >= cutoff and len(self._entries) <= self.max_entries:
+                break
+            self._drop(entry_id)
+            self.evicted += 1
+
+    def _drop(self, entry_id: int):
+        """Remove an entry and its band memberships (lock held)."""
+        entry = self._entries.pop(entry_id)
+        for key in entry.bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+duplicate_detector = NearDuplicateDetector()
@@ -0,0 +1,160 @@
+"""Right to erasure: remove every trace of a teacher's phone hash."""
+import logging
+import time
+from datetime import datetime
+from typing import Callable
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import BroadcastRecipient, ErasureTombstone, TeacherQuery
+from app.services.admission import admission_controller
+from app.services.archive import query_archive
+from app.services.dedupe import duplicate_detector
+from app.services.idempotency import idempotency_cache
+from app.services.invalidation import invalidation_bus
+from app.services.session_store import session_store
+from app.services.similarity import similarity_index
+from app.services.write_queue import query_write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class ErasureService:
+    """
+    Erase a phone hash from the database, caches and archives.
+
+    A request records a tombstone, then works through it in steps: the
+    in-memory state (write queue, sessions, duplicate sketches, rate
+    limits), the teacher queries in chunks of `chunk_size` ids picked
+    through the phone_hash index, broadcast recipients, sync replay
+    records, and the cold archive. Each step is idempotent and the
+    chunks commit separately, so a run stops at its deadline and the
+    periodic job resumes the tombstone where it left off. The tombstone
+    stays, without the data, as the record that the erasure happened.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        chunk_size: int = settings.ERASURE_CHUNK_SIZE
+    ):
+        """Initialize with the session factory used by the periodic job."""
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+
+    def request(self, db: Session, phone_hash: str) -> ErasureTombstone:
+        """Tombstone for a phone hash, reusing an unfinished one."""
+        tombstone = db.query(ErasureTombstone).filter(
+            ErasureTombstone.phone_hash == phone_hash,
+            ErasureTombstone.status != "done"
+        ).first()
+        if tombstone is None:
+            tombstone = ErasureTombstone(phone_hash=phone_hash, status="pending", rows_deleted=0)
+            db.add(tombstone)
+            db.commit()
+        return tombstone
+
+    def forget_in_memory(self, phone_hash: str):
+        """Scrub this worker's in-memory state (also the invalidation handler for other workers)."""
+        # Rows still waiting for the writer would land after the delete
+        query_write_queue.discard(phone_hash)
+        session_store.evict(phone_hash)
+        duplicate_detector.forget(phone_hash)
+        admission_controller.forget(phone_hash)
+
+    def run(self, db: Session, tombstone: ErasureTombstone, budget_seconds: float) -> bool:
+        """
+        Work on a tombstone until it is done or the budget is spent.
+
+        Returns:
+            True once nothing is left to erase
+        """
+        deadline = time.monotonic() + budget_seconds
+        phone_hash = tombstone.phone_hash
+        if tombstone.status == "pending":
+            tombstone.status = "running"
+            db.commit()
+
+        self.forget_in_memory(phone_hash)
+        session_store.forget(phone_hash)
+        invalidation_bus.publish("erasure", phone_hash)
+
+        while True:
+            ids = [
+                query_id for (query_id,) in db.query(TeacherQuery.id).filter(
+                    TeacherQuery.phone_hash == phone_hash
+                ).limit(self.chunk_size)
+            ]
+            if not ids:
+                break
+            db.query(TeacherQuery).filter(TeacherQuery.id.in_(ids)).delete(synchronize_session=False)
+            tombstone.rows_deleted += len(ids)
+            db.commit()
+            similarity_index.remove(ids)
+            invalidation_bus.publish("similarity", ",".join(ids))
+            if time.monotonic() >= deadline:
+                return False
+
+        db.query(BroadcastRecipient).filter(
+            BroadcastRecipient.phone_hash == phone_hash
+        ).delete(synchronize_session=False)
+        idempotency_cache.forget_prefix(db, f"sync:{phone_hash[:16]}:")
+        if time.monotonic() >= deadline:
+            db.commit()
+            return False
+
+        tombstone.rows_deleted += query_archive.erase(phone_hash)
+        tombstone.status = "done"
+        tombstone.completed_at = datetime.utcnow()
+        db.commit()
+        return True
+
+    def run_pending(self, budget_seconds: float = settings.ERASURE_JOB_BUDGET_SECONDS) -> int:
+        """
+        Periodic job: continue unfinished tombstones, oldest first.
+
+        The saved similarity index still holds erased queries (hidden
+        from results in memory only), so it is rebuilt once any erasure
+        that deleted rows has completed since the index was built. The
+        check reads the tombstones, so it also covers erasures finished
+        inline by another worker.
+
+        Returns:
+            Number of tombstones completed
+        """
+        deadline = time.monotonic() + budget_seconds
+        completed = 0
+        db = self.session_factory()
+        try:
+            tombstones = db.query(ErasureTombstone).filter(
+                ErasureTombstone.status != "done"
+            ).order_by(ErasureTombstone.requested_at).all()
+            for tombstone in tombstones:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.run(db, tombstone, remaining):
+                    completed += 1
+            if self._index_holds_erased(db):
+                similarity_index.rebuild_shared(db)
+        finally:
+            db.close()
+        if completed:
+            logger.info("Completed %d erasure requests", completed)
+        return completed
+
+    @staticmethod
+    def _index_holds_erased(db: Session) -> bool:
+        """True if an erasure that deleted rows completed after the saved similarity index was built."""
+        if not similarity_index.ensure_loaded():
+            return False
+        query = db.query(ErasureTombstone.id).filter(
+            ErasureTombstone.status == "done",
+            ErasureTombstone.rows_deleted > 0
+        )
+        if similarity_index.built_at is not None:
+            query = query.filter(ErasureTombstone.completed_at >= similarity_index.built_at)
+        return query.first() is not None
+
+
+erasure_service = ErasureService()
@@ -0,0 +1,289 @@
+"""Quota-bounded store for rendered PPTX exports with LRU eviction."""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import ExportFile, MicroModule, LFADesign, Cluster
+from app.services.pptx_generator import PPTXGenerator
+from app.services.compact_module import CompactModuleGenerator, COMPACT_SUFFIX
+from app.services.metrics import Family
+
+logger = logging.getLogger(__name__)
+
+
+class ExportStore:
+    """
+    Index of files in the exports directory.
+
+    Every rendered file is registered with its size, last access time and
+    owning record. When the resident total exceeds the quota, the least
+    recently accessed files are deleted from disk; their index rows are
+    kept so the file can be rendered again from the owning record.
+    """
+
+    def __init__(
+        self,
+        exports_path: str = settings.EXPORTS_PATH,
+        quota_bytes: int = settings.EXPORTS_QUOTA_BYTES
+    ):
+        """Initialize with exports directory and byte quota."""
+        self.exports_path = exports_path
+        self.quota_bytes = quota_bytes
+        self.pptx_generator = PPTXGenerator(exports_path=exports_path)
+        self.compact_generator = CompactModuleGenerator(exports_path=exports_path)
+        self._evict_lock = threading.Lock()
+        self._render_locks: Dict[str, threading.Lock] = {}
+        self._render_locks_guard = threading.Lock()
+
+    def path_for(self, filename: str) -> str:
+        """Full path of a file in the exports directory."""
+        return os.path.join(self.exports_path, filename)
+
+    def register(
+        self,
+        db: Session,
+        filename: str,
+        owner_type: str,
+        owner_id: str
+    ) -> ExportFile:
+        """
+        Index a file and enforce the quota.
+
+        The file does not have to exist yet: an entry registered before
+        rendering is non-resident and gets rendered on first download.
+
+        Args:
+            db: Database session
+            filename: File name inside the exports directory
+            owner_type: "module" or "lfa"
+            owner_id: Id of the MicroModule / LFADesign row
+
+        Returns:
+            The index entry
+        """
+        path = self.path_for(filename)
+        entry = db.get(ExportFile, filename)
+        if entry is None:
+            entry = ExportFile(filename=filename)
+            db.add(entry)
+        entry.owner_type = owner_type
+        entry.owner_id = owner_id
+        entry.size_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        entry.resident = os.path.exists(path)
+        entry.last_accessed_at = datetime.utcnow()
+        db.commit()
+
+        self.evict_to_quota(db, keep=filename)
+        return entry
+
+    def open(self, db: Session, filename: str) -> Optional[str]:
+        """
+        Resolve a file for download, re-rendering it if it was evicted.
+
+        Files that are not indexed (e.g. the bundled sample module) are
+        served as-is when present.
+
+        Returns:
+            Full path to the file, or None if it cannot be produced
+        """
+        path = self.path_for(filename)
+        entry = db.get(ExportFile, filename)
+
+        if entry is None:
+            return path if os.path.isfile(path) else None
+
+        if not os.path.isfile(path):
+            with self._render_lock(filename):
+                if not os.path.isfile(path):
+                    if not self._render(db, entry):
+                        return None
+
+        entry.size_bytes = os.path.getsize(path)
+        entry.resident = True
+        entry.last_accessed_at = datetime.utcnow()
+        db.commit()
+
+        self.evict_to_quota(db, keep=filename)
+        return path
+
+    def invalidate(self, db: Session, filename: str):
+        """
+        Drop the rendered copy of a file whose owning record changed.
+
+        The index entry is kept, so the next download renders it again.
+        """
+        with self._render_lock(filename):
+            try:
+                os.remove(self.path_for(filename))
+            except FileNotFoundError:
+                pass
+
+        entry = db.get(ExportFile, filename)
+        if entry is not None:
+            entry.resident = False
+            db.commit()
+
+    def usage_bytes(self, db: Session) -> int:
+        """Total size of indexed files currently on disk."""
+        total = db.query(func.sum(ExportFile.size_bytes)).filter(
+            ExportFile.resident == True  # noqa: E712
+        ).scalar()
+        return total or 0
+
+    def evict_to_quota(self, db: Session, keep: Optional[str] = None) -> List[str]:
+        """
+        Delete least recently accessed files until usage fits the quota.
+
+        Args:
+            db: Database session
+            keep: File name that must not be evicted (the one just served)
+
+        Returns:
+            List of evicted file names
+        """
+        evicted = []
+        with self._evict_lock:
+            usage = self.usage_bytes(db)
+            if usage <= self.quota_bytes:
+                return evicted
+
+            candidates = db.query(ExportFile).filter(
+                ExportFile.resident == True  # noqa: E712
+            ).order_by(ExportFile.last_accessed_at.asc())
+
+            for entry in candidates.all():
+                if usage <= self.quota_bytes:
+                    break
+                if entry.filename == keep:
+                    continue
+                try:
+                    os.remove(self.path_for(entry.filename))
+                except FileNotFoundError:
+                    pass
+                usage -= entry.size_bytes or 0
+                entry.resident = False
+                evicted.append(entry.filename)
+
+            db.commit()
+        return evicted
+
+    def compact(self, db: Session) -> Dict:
+        """
+        Reconcile the index with the disk and enforce the quota.
+
+        - Entries whose file vanished are marked non-resident
+        - Entries whose owning record was deleted are dropped with their file
+
+        Returns:
+            Dict with counts of fixed, dropped and evicted entries
+        """
+        fixed = 0
+        dropped = 0
+
+        for entry in db.query(ExportFile).all():
+            path = self.path_for(entry.filename)
+            if self._owner(db, entry) is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                db.delete(entry)
+                dropped += 1
+                continue
+
+            on_disk = os.path.isfile(path)
+            if entry.resident != on_disk:
+                entry.resident = on_disk
+                fixed += 1
+            if on_disk:
+                entry.size_bytes = os.path.getsize(path)
+
+        db.commit()
+        evicted = self.evict_to_quota(db)
+
+        return {
+            "fixed": fixed,
+            "dropped": dropped,
+            "evicted": len(evicted),
+            "usage_bytes": self.usage_bytes(db),
+            "quota_bytes": self.quota_bytes
+        }
+
+    def _owner(self, db: Session, entry: ExportFile):
+        """Load the record a file was rendered from."""
+        if entry.owner_type == "module":
+            return db.get(MicroModule, entry.owner_id)
+        if entry.owner_type == "lfa":
+            return db.get(LFADesign, entry.owner_id)
+        return None
+
+    def _render(self, db: Session, entry: ExportFile) -> bool:
+        """Render a file again from its owning record."""
+        owner = self._owner(db, entry)
+        if owner is None:
+            return False
+
+        if entry.owner_type == "module":
+            cluster = db.get(Cluster, owner.cluster_id)
+            try:
+                content = json.loads(owner.content_text or "{}")
+            except ValueError:
+                content = {"advice": owner.content_text}
+            generator = self.pptx_generator
+            if entry.filename.endswith(COMPACT_SUFFIX):
+                generator = self.compact_generator
+            generator.generate_micro_module(
+                title=owner.title,
+                topic=owner.topic_tag,
+                advice=content.get("advice", ""),
+                materials=content.get("materials", "varies"),
+                cluster=cluster.name if cluster else "",
+                output_filename=entry.filename
+            )
+        else:
+            self.pptx_generator.generate_lfa_export(
+                title=owner.title,
+                problem_statement=owner.problem_statement,
+                student_change=owner.student_change,
+                stakeholders=json.loads(owner.stakeholders_json or "[]"),
+                practice_changes=json.loads(owner.practice_changes_json or "[]"),
+                indicators=json.loads(owner.indicators_json or "[]"),
+                output_filename=entry.filename
+            )
+        return True
+
+    def _render_lock(self, filename: str) -> threading.Lock:
+        """Per-file lock so concurrent downloads render an evicted file once."""
+        with self._render_locks_guard:
+            return self._render_locks.setdefault(filename, threading.Lock())
+
+
+export_store = ExportStore()
+
+
+def run_compaction() -> Dict:
+    """Periodic job: compact the export store with a fresh session."""
+    db = SessionLocal()
+    try:
+        stats = export_store.compact(db)
+        logger.info("Export store compaction: %s", stats)
+        return stats
+    finally:
+        db.close()
+
+
+def usage_families() -> List[Family]:
+    """Metrics collector: bytes of exports on disk, against the quota."""
+    db = SessionLocal()
+    try:
+        used = export_store.usage_bytes(db)
+    finally:
+        db.close()
+    return [
+        Family("exports_resident_bytes", "gauge", "Bytes of rendered exports on disk", values={(): [used]}),
+        Family("exports_quota_bytes", "gauge", "Exports directory quota", values={(): [export_store.quota_bytes]})
+    ]
@@ -0,0 +1,275 @@
+"""Idempotency records: bounded in-memory LRU backed by a small table with TTL."""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+# response_body of a claimed key whose response is still being produced
+_PENDING = ""
+
+
+class IdempotencyCache:
+    """
+    Remember the response produced for a request key.
+
+    Lookups hit an in-memory LRU first and fall back to the
+    idempotency_records table, so replays are answered after a restart
+    too. Records older than the TTL are ignored and purged by cleanup().
+
+    A request that does work under a key claims it first: claim()
+    inserts a pending row, and the primary key lets exactly one request
+    (in any worker) win. A retry arriving while the winner is still
+    working wait()s for its response instead of doing the work again.
+    Only committed responses enter the in-memory LRU.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.IDEMPOTENCY_CACHE_SIZE,
+        ttl_seconds: int = settings.IDEMPOTENCY_TTL_SECONDS,
+        claim_timeout_seconds: int = settings.IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS
+    ):
+        """Initialize with LRU bound and record TTL."""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.claim_timeout_seconds = claim_timeout_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, key: str) -> Optional[str]:
+        """
+        Cached response for a key, or None.
+
+        Args:
+            db: Database session, only used on a memory miss
+            key: Scoped request key, e.g. "whatsapp:SM123"
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                response, stored_at = cached
+                if now - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+
+        record = db.get(IdempotencyRecord, key)
+        if (
+            record is None
+            or record.response_body == _PENDING
+            or record.created_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        ):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        stored_at = record.created_at.replace(tzinfo=timezone.utc).timestamp()
+        self._remember(key, record.response_body, stored_at)
+        return record.response_body
+
+    def get_many(self, db: Session, keys: Iterable[str]) -> Dict[str, str]:
+        """
+        Cached responses for several keys.
+
+        Memory misses are looked up with a single query.
+        """
+        found: Dict[str, str] = {}
+        missing = []
+        for key in keys:
+            cached = self.peek(key)
+            if cached is not None:
+                found[key] = cached
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        records = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key.in_(missing),
+            IdempotencyRecord.created_at >= cutoff,
+            IdempotencyRecord.response_body != _PENDING
+        )
+        for record in records:
+            found[record.key] = record.response_body
+            stored_at = record.created_at.replace(tzinfo=timezone.utc).timestamp()
+            self._remember(record.key, record.response_body, stored_at)
+        return found
+
+    def stage(self, db: Session, key: str, response: str):
+        """
+        Add a record to the caller's transaction without committing.
+
+        Call remember() once the transaction has committed.
+        """
+        db.add(IdempotencyRecord(key=key, response_body=response))
+
+    def remember(self, key: str, response: str):
+        """Put a committed response in the in-memory LRU."""
+        self._remember(key, response, time.time())
+
+    def peek(self, key: str) -> Optional[str]:
+        """Memory-only lookup that never touches the database."""
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is None or time.time() - cached[1] >= self.ttl_seconds:
+            return None
+        return cached[0]
+
+    def claim(self, db: Session, key: str) -> bool:
+        """
+        Take a key before producing its response.
+
+        A claim left pending past `claim_timeout_seconds` (its owner
+        crashed) is taken over.
+
+        Returns:
+            False if another request holds or has answered the key
+        """
+        for _ in range(2):
+            db.add(IdempotencyRecord(key=key, response_body=_PENDING))
+            try:
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+            abandoned = datetime.utcnow() - timedelta(seconds=self.claim_timeout_seconds)
+            taken_over = db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.response_body == _PENDING,
+                IdempotencyRecord.created_at < abandoned
+            ).delete(synchronize_session=False)
+            db.commit()
+            if not taken_over:
+                return False
+        return False
+
+    def release(self, db: Session, key: str):
+        """Give up a claim without a response, so a retry can claim the key again."""
+        db.rollback()
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key == key,
+            IdempotencyRecord.response_body == _PENDING
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    def wait(self, db: Session, key: str, timeout: float = settings.IDEMPOTENCY_WAIT_SECONDS) -> Optional[str]:
+        """
+        Response of a key claimed by another request, once it is stored.
+
+        Returns:
+            The response, or None if it did not arrive within the timeout
+            or the claim was released
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            cached = self.peek(key)
+            if cached is not None:
+                return cached
+            db.rollback()  # End the read snapshot so the owner's commit is visible
+            body = db.query(IdempotencyRecord.response_body).filter(IdempotencyRecord.key == key).scalar()
+            if body is None:
+                return None
+            if body != _PENDING:
+                self._remember(key, body, time.time())
+                return body
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    def put(self, db: Session, key: str, response: str) -> str:
+        """
+        Store the response for a key, completing this request's claim if it has one.
+
+        A concurrent request that stored the same key first wins; its
+        row is kept.
+
+        Returns:
+            The stored response (the winner's if this request lost)
+        """
+        updated = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key == key,
+            IdempotencyRecord.response_body == _PENDING
+        ).update({IdempotencyRecord.response_body: response}, synchronize_session=False)
+        if not updated:
+            db.add(IdempotencyRecord(key=key, response_body=response))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            stored = db.query(IdempotencyRecord.response_body).filter(IdempotencyRecord.key == key).scalar()
+            if not stored:
+                return response
+            response = stored
+        self._remember(key, response, time.time())
+        return response
+
+    def cleanup(self, db: Session) -> int:
+        """
+        Delete expired records.
+
+        Returns:
+            Number of rows deleted
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        deleted = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.created_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        expiry = time.time() - self.ttl_seconds
+        with self._lock:
+            for key in [k for k, (_, t) in self._entries.items() if t < expiry]:
+                del self._entries[key]
+        return deleted
+
+    def forget_prefix(self, db: Session, prefix: str) -> int:
+        """
+        Delete every record whose key starts with a prefix (e.g. one sender's sync scope).
+
+        Returns:
+            Number of rows deleted
+        """
+        deleted = db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key.startswith(prefix, autoescape=True)
+        ).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+        return deleted
+
+    def _remember(self, key: str, response: str, stored_at: float):
+        """Insert into the LRU, evicting the oldest entry past the bound."""
+        with self._lock:
+            self._entries[key] = (response, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+idempotency_cache = IdempotencyCache()
+
+
+def run_cleanup() -> int:
+    """Periodic job: purge expired idempotency records."""
+    db = SessionLocal()
+    try:
+        deleted = idempotency_cache.cleanup(db)
+        logger.info("Purged %d expired idempotency records", deleted)
+        return deleted
+    finally:
+        db.close()
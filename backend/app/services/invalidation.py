@@ -0,0 +1,126 @@
+"""Cross-worker cache invalidation through a shared SQLite log."""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Optional[str]], None]
+
+
+class InvalidationBus:
+    """
+    Tell every worker on the host to drop the same cache entries.
+
+    publish() appends (channel, key) to a small SQLite file shared by
+    the workers; every other worker runs its handlers on its next
+    poll(), which reads only rows past the last sequence number it saw.
+    The publisher has already updated its own caches, so its handlers
+    are not run. A key of None means the whole channel. The file is opened lazily and reopened after a fork, so a
+    preloading master never hands its connection to the workers.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = settings.INVALIDATION_PATH,
+        retention_seconds: int = settings.INVALIDATION_RETENTION_SECONDS
+    ):
+        """Initialize a bus backed by `path` (None: this process only)."""
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._origin = ""
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Run `handler(key)` whenever `channel` is invalidated."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, key: Optional[str] = None):
+        """Invalidate a key (or the whole channel) in every other worker."""
+        if not self.path:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO invalidations (channel, key, origin, created_at) VALUES (?, ?, ?, ?)",
+                (channel, key, self._origin, time.time())
+            )
+            conn.commit()
+        self.published += 1
+
+    def poll(self) -> int:
+        """
+        Apply invalidations published by other workers since the last poll.
+
+        Returns:
+            Number of invalidations applied
+        """
+        if not self.path:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT seq, channel, key, origin FROM invalidations WHERE seq > ? ORDER BY seq",
+                (self._last_seq,)
+            ).fetchall()
+            if rows:
+                self._last_seq = rows[-1][0]
+        applied = 0
+        for _, channel, key, origin in rows:
+            if origin != self._origin:  # Own rows: see publish
+                self._dispatch(channel, key)
+                applied += 1
+        self.received += applied
+        return applied
+
+    def trim(self) -> int:
+        """Delete log rows older than the retention (every worker has polled them by then)."""
+        if not self.path:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "DELETE FROM invalidations WHERE created_at < ?", (time.time() - self.retention_seconds,)
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def _dispatch(self, channel: str, key: Optional[str]):
+        """Run a channel's handlers; one failing handler does not stop the rest."""
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Invalidation handler for %s failed", channel)
+
+    def _connection(self) -> sqlite3.Connection:
+        """This process's connection (lock held), opened on first use and after a fork."""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invalidations ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, key TEXT, "
+                "origin TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+            self._origin = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+            # Start from now: older rows were published before this worker existed
+            self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+        return self._conn
+
+
+invalidation_bus = InvalidationBus()
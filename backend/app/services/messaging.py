@@ -0,0 +1,143 @@
+"""Outbound message transports (Twilio REST and a local stub)."""
+import logging
+import threading
+from typing import List, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TransportError(Exception):
+    """Raised when a message could not be handed to the provider."""
+
+
+class MessageTransport:
+    """Send one text message to one recipient address."""
+
+    def send(self, to: str, body: str) -> str:
+        """
+        Send a message.
+
+        Args:
+            to: Recipient address, e.g. "whatsapp:+919876543210"
+            body: Message text
+
+        Returns:
+            Provider message id
+        """
+        raise NotImplementedError
+
+    def send_batch(self, messages: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Send several messages; one failure does not stop the rest.
+
+        Gateways with a bulk API override this. The default sends one at
+        a time.
+
+        Args:
+            messages: (recipient address, body) pairs
+
+        Returns:
+            Provider message id per message, None where sending failed
+        """
+        ids: List[Optional[str]] = []
+        for to, body in messages:
+            try:
+                ids.append(self.send(to, body))
+            except TransportError:
+                ids.append(None)
+        return ids
+
+
+class TwilioTransport(MessageTransport):
+    """Send through the Twilio REST API using the TWILIO_* settings."""
+
+    def __init__(
+        self,
+        account_sid: Optional[str] = None,
+        auth_token: Optional[str] = None,
+        from_number: Optional[str] = None,
+        channel_prefix: str = "whatsapp:"
+    ):
+        """Initialize with credentials (default: from settings)."""
+        self.account_sid = account_sid or settings.TWILIO_ACCOUNT_SID
+        self.auth_token = auth_token or settings.TWILIO_AUTH_TOKEN
+        self.from_number = from_number or settings.TWILIO_PHONE_NUMBER
+        self.channel_prefix = channel_prefix
+        self._client = None
+
+    def send(self, to: str, body: str) -> str:
+        """Send via Twilio; any client error becomes a TransportError."""
+        if self._client is None:
+            from twilio.rest import Client
+            self._client = Client(self.account_sid, self.auth_token)
+
+        sender = self.from_number
+        if not sender.startswith(self.channel_prefix):
+            sender = f"{self.channel_prefix}{sender}"
+        try:
+            message = self._client.messages.create(to=to, from_=sender, body=body)
+        except Exception as e:
+            raise TransportError(str(e)) from e
+        return message.sid
+
+
+class StubTransport(MessageTransport):
+    """
+    In-process transport for local runs and tests.
+
+    Records every delivered message; `fail_times` makes the next N
+    sends fail to exercise retry paths.
+    """
+
+    def __init__(self, fail_times: int = 0):
+        """Initialize with an optional number of injected failures."""
+        self.fail_times = fail_times
+        self.sent: List[Tuple[str, str]] = []
+        self.attempts = 0
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str) -> str:
+        """Record the message (or fail while injected failures remain)."""
+        with self._lock:
+            self.attempts += 1
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise TransportError("stub transport failure")
+            self.sent.append((to, body))
+            return f"stub-{len(self.sent)}"
+
+
+def create_transport(kind: str = "auto", channel_prefix: str = "whatsapp:") -> MessageTransport:
+    """
+    Build the configured transport.
+
+    "auto" without Twilio credentials falls back to the stub only in
+    DEBUG mode, with a warning; otherwise messages would be silently
+    dropped, so it raises. Ask for "stub" explicitly to run without
+    Twilio outside DEBUG.
+
+    Args:
+        kind: "twilio", "stub" or "auto" (Twilio when credentials are set)
+        channel_prefix: Address prefix of the channel ("whatsapp:", or "" for SMS)
+
+    Raises:
+        RuntimeError: "auto" without Twilio credentials outside DEBUG mode
+    """
+    if kind == "auto":
+        has_credentials = all([
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_AUTH_TOKEN,
+            settings.TWILIO_PHONE_NUMBER
+        ])
+        if not has_credentials:
+            if not settings.DEBUG:
+                raise RuntimeError(
+                    "TWILIO_* credentials are not set: set them, or select the "
+                    "stub transport explicitly if messages may be dropped"
+                )
+            logger.warning("TWILIO_* credentials are not set; messages go to the stub transport and are not delivered")
+        kind = "twilio" if has_credentials else "stub"
+    if kind == "twilio":
+        return TwilioTransport(channel_prefix=channel_prefix)
+    return StubTransport()
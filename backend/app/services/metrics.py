@@ -0,0 +1,420 @@
+"""In-process metrics with a Prometheus text exposition at /metrics."""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi.exceptions import HTTPException, RequestValidationError
+from fastapi.routing import APIRoute
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+RENDER_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class Family:
+    """One metric with its samples: labels -> [value], or histogram bucket counts then sum."""
+    name: str
+    kind: str  # counter, gauge or histogram
+    help: str
+    labelnames: Tuple[str, ...] = ()
+    buckets: Tuple[float, ...] = ()
+    values: Dict[Labels, List[float]] = field(default_factory=dict)
+
+
+class _Metric:
+    """
+    Values kept in one shard per thread.
+
+    Only the owning thread writes its shard, so recording takes no lock;
+    collect() sums the shards. A shard is folded into the retired totals
+    when its thread ends, so threadpool turnover does not grow the list.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), width: int = 1):
+        """Initialize an empty metric with `width` numbers per label set."""
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[Dict[Labels, List[float]]] = []
+        self._retired: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _row(self, labels: Labels) -> List[float]:
+        """This thread's numbers for a label set."""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = [0] * self._width
+        return row
+
+    def _new_shard(self) -> Dict[Labels, List[float]]:
+        """Register a shard for the current thread."""
+        shard: Dict[Labels, List[float]] = {}
+        with self._lock:
+            self._shards.append(shard)
+        self._local.shard = shard
+        weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard: Dict[Labels, List[float]]):
+        """Fold a finished thread's shard into the retired totals."""
+        with self._lock:
+            self._shards = [s for s in self._shards if s is not shard]
+            _add_rows(self._retired, shard)
+
+    def family(self) -> Family:
+        """Current totals over every thread."""
+        values: Dict[Labels, List[float]] = {}
+        with self._lock:
+            _add_rows(values, self._retired)
+            for shard in self._shards:
+                _add_rows(values, shard.copy())
+        return Family(self.name, self.kind, self.help, self.labelnames, self._buckets(), values)
+
+    def _buckets(self) -> Tuple[float, ...]:
+        return ()
+
+
+class Counter(_Metric):
+    """Monotonic count."""
+
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        """Add to the count for a label set."""
+        self._row(labels)[0] += amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    kind = "gauge"
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        """Add to the value (negative amounts subtract); any thread may undo another's."""
+        self._row(labels)[0] += amount
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed upper bounds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        """Initialize with sorted bucket upper bounds (+Inf is implied)."""
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, the +Inf bucket, then the sum
+        super().__init__(name, help_text, labelnames, width=len(self.buckets) + 2)
+
+    def observe(self, value: float, labels: Labels = ()):
+        """Record one value."""
+        row = self._row(labels)
+        row[bisect.bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def _buckets(self) -> Tuple[float, ...]:
+        return self.buckets
+
+
+class MetricsRegistry:
+    """
+    Every metric of this process, rendered in the Prometheus text format.
+
+    Collectors are callables returning Families computed at scrape time
+    (pool usage, cache counters). With several workers (`directory`
+    set), each worker writes a snapshot of its metrics there and render()
+    adds the other workers' snapshots, so one scrape covers the host.
+    Collectors registered `shared` describe host-wide state (the exports
+    directory) and are only taken from the scraped worker.
+    """
+
+    def __init__(self, directory: Optional[str] = settings.METRICS_DIR):
+        """Initialize an empty registry, snapshotting to `directory` if given."""
+        self.directory = directory
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[Callable[[], List[Family]], bool]] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Register a counter."""
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Register a gauge."""
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Register a histogram."""
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], List[Family]], shared: bool = False):
+        """Compute Families at scrape time; shared ones are not summed over workers."""
+        self._collectors.append((collector, shared))
+
+    def collect(self, shared: bool = False) -> List[Family]:
+        """This process's Families (shared collectors only if asked)."""
+        families = [metric.family() for metric in self._metrics.values()]
+        for collector, is_shared in self._collectors:
+            if is_shared and not shared:
+                continue
+            try:
+                families.extend(collector())
+            except Exception as exc:
+                logger.warning("Metrics collector %s failed: %s", getattr(collector, "__name__", collector), exc)
+        return families
+
+    def write_snapshot(self):
+        """Periodic job: publish this worker's metrics for the others to render."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        data = [
+            [f.name, f.kind, f.help, f.labelnames, f.buckets, [[list(k), v] for k, v in f.values.items()]]
+            for f in self.collect()
+        ]
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def render(self) -> str:
+        """Prometheus text exposition of this worker plus the other workers' snapshots."""
+        merged: Dict[str, Family] = {}
+        for family in self.collect(shared=True) + self._other_workers():
+            target = merged.get(family.name)
+            if target is None:
+                target = merged[family.name] = Family(
+                    family.name, family.kind, family.help, family.labelnames, family.buckets
+                )
+            _add_rows(target.values, family.values)
+        _add_hit_ratios(merged)
+        return "".join(_format_family(f) for f in merged.values())
+
+    def _other_workers(self) -> List[Family]:
+        """
+        Families from the other workers' snapshots.
+
+        Counters and histograms of exited workers are kept, so totals do
+        not go backwards when gunicorn replaces a worker; their gauges
+        are dropped. The directory is emptied when the master starts.
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        families = []
+        for entry in os.listdir(self.directory):
+            pid, ext = os.path.splitext(entry)
+            if ext != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            alive = _alive(int(pid))
+            try:
+                with open(os.path.join(self.directory, entry)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, kind, help_text, labelnames, buckets, values in data:
+                if kind == "gauge" and not alive:
+                    continue
+                families.append(Family(
+                    name, kind, help_text, tuple(labelnames), tuple(buckets),
+                    {tuple(labels): row for labels, row in values}
+                ))
+        return families
+
+    def _register(self, metric: _Metric):
+        """Add a metric, refusing a second one under the same name."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+def _add_rows(target: Dict[Labels, List[float]], source: Dict[Labels, List[float]]):
+    """Sum rows of `source` into `target`."""
+    for labels, row in source.items():
+        existing = target.get(labels)
+        if existing is None:
+            target[labels] = list(row)
+        else:
+            for i, value in enumerate(row):
+                existing[i] += value
+
+
+def _alive(pid: int) -> bool:
+    """True if a process with this pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add_hit_ratios(families: Dict[str, Family]):
+    """Derive cache_hit_ratio from the summed hit and miss counters."""
+    requests = families.get("cache_requests_total")
+    if requests is None:
+        return
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), (count,) in requests.values.items():
+        totals.setdefault(cache, [0, 0])[result == "hit"] += count
+    families["cache_hit_ratio"] = Family(
+        "cache_hit_ratio", "gauge", "Share of cache lookups answered from the cache", ("cache",),
+        values={(cache,): [hits / (hits + misses)] for cache, (misses, hits) in totals.items() if hits + misses}
+    )
+
+
+def _format_family(family: Family) -> str:
+    """One family in the text format."""
+    lines = [f"# HELP {family.name} {family.help}", f"# TYPE {family.name} {family.kind}"]
+    for labels, row in sorted(family.values.items()):
+        pairs = list(zip(family.labelnames, labels))
+        if family.kind != "histogram":
+            lines.append(f"{family.name}{_format_labels(pairs)} {_format_value(row[0])}")
+            continue
+        cumulative = 0
+        bounds = [_format_value(b) for b in family.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, row):
+            cumulative += count
+            lines.append(f"{family.name}_bucket{_format_labels(pairs + [('le', bound)])} {_format_value(cumulative)}")
+        lines.append(f"{family.name}_sum{_format_labels(pairs)} {_format_value(row[-1])}")
+        lines.append(f"{family.name}_count{_format_labels(pairs)} {_format_value(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    """{name="value",...}, escaped; empty without labels."""
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    """Escape a label value (backslash, double quote, newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    """Integers without a decimal point, floats in full precision."""
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time spent in route handlers", ("method", "route")
+)
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    "http_requests_in_flight", "Requests being handled", ("method", "route")
+)
+RESPONSES = metrics.counter(
+    "http_responses_total", "Responses by status code", ("method", "route", "status")
+)
+# Both PPTX decks and the compact HTML modules
+RENDER_SECONDS = metrics.histogram(
+    "export_render_seconds", "Time to render an export file", ("kind",), RENDER_BUCKETS
+)
+
+
+def timed(histogram: Histogram, *labels: str):
+    """Decorator recording the duration of each call (a no-op with METRICS_ENABLED off)."""
+    def decorator(func):
+        if not settings.METRICS_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, labels)
+        return wrapper
+    return decorator
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute recording latency, in-flight requests and status codes under its path template."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not settings.METRICS_ENABLED:
+            return handler
+        labels = ("|".join(sorted(self.methods)), self.path)
+
+        async def instrumented(request):
+            REQUESTS_IN_FLIGHT.inc(labels)
+            start = time.perf_counter()
+            status = "500"
+            try:
+                response = await handler(request)
+                status = str(response.status_code)
+                return response
+            except HTTPException as exc:
+                status = str(exc.status_code)
+                raise
+            except RequestValidationError:
+                status = "422"
+                raise
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - start, labels)
+                REQUESTS_IN_FLIGHT.inc(labels, -1)
+                RESPONSES.inc(labels + (status,))
+        return instrumented
+
+
+def pool_families(engines: Dict[str, object]) -> List[Family]:
+    """Collector: connections in use and idle per engine (pools without counters are skipped)."""
+    in_use = Family("db_pool_connections_in_use", "gauge", "Connections checked out", ("engine",))
+    idle = Family("db_pool_connections_idle", "gauge", "Connections idle in the pool", ("engine",))
+    size = Family("db_pool_size", "gauge", "Configured pool size", ("engine",))
+    for name, engine in engines.items():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        in_use.values[(name,)] = [pool.checkedout()]
+        idle.values[(name,)] = [pool.checkedin()]
+        size.values[(name,)] = [pool.size()]
+    return [in_use, idle, size]
+
+
+def cache_families(caches: Dict[str, object]) -> List[Family]:
+    """Collector: hit and miss counts of caches exposing `hits` and `misses`."""
+    family = Family("cache_requests_total", "counter", "Cache lookups by result", ("cache", "result"))
+    for name, cache in caches.items():
+        family.values[(name, "hit")] = [cache.hits]
+        family.values[(name, "miss")] = [cache.misses]
+    return [family]
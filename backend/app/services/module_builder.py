@@ -0,0 +1,124 @@
+"""Create micro-module records and their export files."""
+import os
+import json
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import MicroModule, Cluster
+from app.services.export_store import ExportStore, export_store
+from app.services.compact_module import compact_filename
+from app.services.cluster_matcher import cluster_matcher
+
+
+class ModuleBuilder:
+    """Persist a MicroModule with its render inputs and index its files."""
+
+    def __init__(self, store: ExportStore = export_store):
+        """Initialize with the export store that owns the files."""
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="module-render")
+
+    @staticmethod
+    def module_content(topic: str) -> Dict:
+        """Render inputs for a topic's module."""
+        # Mock response data for demo
+        return {
+            "advice": f"Teaching strategies for {topic}:\n1. Start with concrete examples\n2. Use visual aids\n3. Practice with guided exercises",
+            "materials": ["Worksheets", "Visual charts", "Practice problems"]
+        }
+
+    def create(
+        self,
+        db: Session,
+        cluster_name: str,
+        topic: str,
+        render: bool = True
+    ) -> MicroModule:
+        """
+        Create a micro-module for a topic and cluster.
+        
+        Args:
+            db: Database session
+            cluster_name: Cluster name (created if unknown)
+            topic: Topic tag
+            render: Render the PPTX and compact HTML now; otherwise the
+                files are indexed as not yet rendered and the first
+                download (or queue_render) produces them
+        
+        Returns:
+            The MicroModule row; slides_pptx_path holds the PPTX path
+        """
+        # Generate title
+        title = f"{topic.replace('-', ' ').title()} - Micro Module"
+        
+        # Generate filename; it keys the export index, so two modules
+        # created in the same second must not share it
+        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        suffix = uuid.uuid4().hex[:8]
+        filename = f"module_{cluster_name.replace(' ', '_')}_{topic}_{timestamp}_{suffix}.pptx"
+        
+        response_data = self.module_content(topic)
+        
+        if render:
+            self.store.pptx_generator.generate_micro_module(
+                title=title,
+                topic=topic,
+                advice=response_data["advice"],
+                materials=response_data["materials"],
+                cluster=cluster_name,
+                output_filename=filename
+            )
+            # Compact HTML version for 2G/3G downloads, cached next to the PPTX
+            self.store.compact_generator.generate_micro_module(
+                title=title,
+                topic=topic,
+                advice=response_data["advice"],
+                materials=response_data["materials"],
+                cluster=cluster_name,
+                output_filename=compact_filename(filename)
+            )
+        
+        # Get or create cluster
+        cluster = db.query(Cluster).filter(Cluster.name == cluster_name).first()
+        if not cluster:
+            cluster = Cluster(name=cluster_name, region="Unknown")
+            db.add(cluster)
+            db.commit()
+            db.refresh(cluster)
+            cluster_matcher.add_created(cluster.name, cluster.id)
+        
+        # Persist module with its render inputs (JSON as text for SQLite compat)
+        module = MicroModule(
+            title=title,
+            cluster_id=cluster.id,
+            topic_tag=topic,
+            content_text=json.dumps(response_data),
+            slides_pptx_path=self.store.path_for(filename)
+        )
+        db.add(module)
+        db.commit()
+        db.refresh(module)
+        
+        self.store.register(db, filename, "module", module.id)
+        self.store.register(db, compact_filename(filename), "module", module.id)
+        return module
+
+    def queue_render(self, module: MicroModule) -> Future:
+        """Render a module's files in the background so downloads are instant."""
+        filename = os.path.basename(module.slides_pptx_path)
+        return self._executor.submit(self._render, filename)
+
+    def _render(self, filename: str):
+        """Background job: produce both files through the export store."""
+        db = SessionLocal()
+        try:
+            self.store.open(db, filename)
+            self.store.open(db, compact_filename(filename))
+        finally:
+            db.close()
+
+
+module_builder = ModuleBuilder()
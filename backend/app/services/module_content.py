@@ -0,0 +1,24 @@
+"""Shared text content for rendered micro-modules."""
+
+CLASSROOM_SCRIPTS = {
+    "subtraction-borrowing": (
+        '"Today we\'ll practice subtraction with borrowing. '
+        'Take out your pebbles. Let\'s show 13-7 together. '
+        'Count 13 pebbles. Now, can we take away 7 from the 3 we have? '
+        'No! So we need to borrow from the tens place..."'
+    ),
+    "fractions-conceptual": (
+        '"Let\'s explore fractions! Take your paper and fold it in half. '
+        'How many equal parts? That\'s right - 2 parts. Each part is 1/2. '
+        'Now fold again. How many parts now? 4 parts - each is 1/4..."'
+    ),
+    "multiplication-tables": (
+        '"Let\'s sing the 2s! 2, 4, 6, 8... Now let\'s show it with dots. '
+        'Draw 2 rows of 4 dots. How many total? Count with me: 2, 4, 6, 8!"'
+    ),
+}
+
+
+def generate_script(topic: str, first_step: str) -> str:
+    """Generate sample classroom script based on topic."""
+    return CLASSROOM_SCRIPTS.get(topic, f'"Let\'s start: {first_step}"')
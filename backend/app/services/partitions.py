@@ -0,0 +1,116 @@
+"""Monthly range partitions for teacher_queries (PostgreSQL only)."""
+import logging
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = "teacher_queries"
+
+
+def month_start(value: date) -> date:
+    """First day of the month containing `value`."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    """First day of the month `months` after the month of `value`."""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date, table: str = PARTITIONED_TABLE) -> str:
+    """Partition name for a month, e.g. teacher_queries_y2026m10."""
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_bounds(first: date, last: date) -> List[Tuple[str, date, date]]:
+    """(name, from, to) for every month from `first` through `last`."""
+    bounds = []
+    month = month_start(first)
+    while month <= last:
+        upper = add_months(month, 1)
+        bounds.append((partition_name(month), month, upper))
+        month = upper
+    return bounds
+
+
+def is_partitioned(conn: Connection, table: str = PARTITIONED_TABLE) -> bool:
+    """True if `table` is a declaratively partitioned Postgres table."""
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ),
+        {"table": table}
+    ).first() is not None
+
+
+def create_partitions(conn: Connection, first: date, last: date, table: str = PARTITIONED_TABLE) -> int:
+    """
+    Create any missing monthly partitions covering `first` through `last`.
+
+    Returns:
+        Number of partitions created
+    """
+    existing = {
+        row[0] for row in conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table"
+            ),
+            {"table": table}
+        )
+    }
+    created = 0
+    for name, lower, upper in partition_bounds(first, last):
+        if name in existing:
+            continue
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        ))
+        created += 1
+    return created
+
+
+def ensure_partitions(
+    engine: Engine,
+    months_ahead: int = settings.PARTITION_MONTHS_AHEAD,
+    today: Optional[date] = None
+) -> int:
+    """
+    Pre-create partitions for the current month and `months_ahead` more.
+
+    Inserts never wait on DDL, and rows do not pile up in the default
+    partition (which would block creating that month's partition later).
+    A no-op on SQLite and on an unpartitioned table.
+
+    Returns:
+        Number of partitions created
+    """
+    if engine.dialect.name != "postgresql":
+        return 0
+    current = month_start(today or datetime.utcnow().date())
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return 0
+        return create_partitions(conn, current, add_months(current, months_ahead))
+
+
+def run_maintenance() -> int:
+    """Scheduler entry point: pre-create upcoming partitions."""
+    from app.database import engine
+
+    created = ensure_partitions(engine)
+    if created:
+        logger.info("Created %d %s partitions", created, PARTITIONED_TABLE)
+    return created
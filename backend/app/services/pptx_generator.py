@@ -1,19 +1,23 @@
 """PPTX generation service for micro-modules and LFA exports."""
 import os
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
 from typing import List, Dict
+from app.services.module_content import generate_script
+from app.services.metrics import timed, RENDER_SECONDS
 
 
 class PPTXGenerator:
-    """Generate PowerPoint presentations for modules and LFA."""
+    """
+    Generate PowerPoint presentations for modules and LFA.
+    
+    python-pptx is imported on the first render, not with this module,
+    so processes that never render a deck do not pay for it.
+    """
     
     def __init__(self, exports_path: str = "exports"):
-        """Initialize with exports directory."""
+        """Initialize with exports directory (created on the first render)."""
         self.exports_path = exports_path
-        os.makedirs(exports_path, exist_ok=True)
     
+    @timed(RENDER_SECONDS, "module_pptx")
     def generate_micro_module(
         self,
         title: str,
@@ -37,6 +41,9 @@ class PPTXGenerator:
         Returns:
             Full path to generated file
         """
+        from pptx import Presentation
+        from pptx.util import Inches, Pt
+        
         prs = Presentation()
         prs.slide_width = Inches(10)
         prs.slide_height = Inches(7.5)
@@ -143,10 +150,9 @@ class PPTXGenerator:
         p.font.size = Pt(16)
         
         # Save
-        output_path = os.path.join(self.exports_path, output_filename)
-        prs.save(output_path)
-        return output_path
+        return self._save(prs, output_filename)
     
+    @timed(RENDER_SECONDS, "lfa_pptx")
     def generate_lfa_export(
         self,
         title: str,
@@ -163,6 +169,10 @@ class PPTXGenerator:
         Returns:
             Full path to generated file
         """
+        from pptx import Presentation
+        from pptx.enum.text import PP_ALIGN
+        from pptx.util import Inches, Pt
+        
         prs = Presentation()
         prs.slide_width = Inches(10)
         prs.slide_height = Inches(7.5)
@@ -247,12 +257,32 @@ class PPTXGenerator:
             p.space_after = Pt(10)
         
         # Save
+        return self._save(prs, output_filename)
+    
+    def _save(self, prs, output_filename: str) -> str:
+        """
+        Write a presentation to the exports directory.
+        
+        The deck is written to a temp file and renamed into place, so a
+        download racing a lazy render (in this or another worker) never
+        sees a partial file.
+        """
+        os.makedirs(self.exports_path, exist_ok=True)
         output_path = os.path.join(self.exports_path, output_filename)
-        prs.save(output_path)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"  # Other workers may render the same file
+        try:
+            prs.save(tmp_path)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
         return output_path
     
     def _add_lfa_section(self, text_frame, heading: str, content: str):
         """Add formatted section to LFA slide."""
+        from pptx.util import Pt
+        
         p = text_frame.paragraphs[0]
         p.text = heading
         p.font.size = Pt(18)
@@ -265,21 +295,4 @@ class PPTXGenerator:
     
     def _generate_script(self, topic: str, first_step: str) -> str:
         """Generate sample classroom script based on topic."""
-        scripts = {
-            "subtraction-borrowing": (
-                '"Today we\'ll practice subtraction with borrowing. '
-                'Take out your pebbles. Let\'s show 13-7 together. '
-                'Count 13 pebbles. Now, can we take away 7 from the 3 we have? '
-                'No! So we need to borrow from the tens place..."'
-            ),
-            "fractions-conceptual": (
-                '"Let\'s explore fractions! Take your paper and fold it in half. '
-                'How many equal parts? That\'s right - 2 parts. Each part is 1/2. '
-                'Now fold again. How many parts now? 4 parts - each is 1/4..."'
-            ),
-            "multiplication-tables": (
-                '"Let\'s sing the 2s! 2, 4, 6, 8... Now let\'s show it with dots. '
-                'Draw 2 rows of 4 dots. How many total? Count with me: 2, 4, 6, 8!"'
-            ),
-        }
-        return scripts.get(topic, f'"Let\'s start: {first_step}"')
\ No newline at end of file
+        return generate_script(topic, first_step)
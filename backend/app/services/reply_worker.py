@@ -0,0 +1,160 @@
+"""Asynchronous delivery of webhook replies through an outbound transport."""
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.database import SessionLocal
+from app.services.idempotency import idempotency_cache
+from app.services.messaging import MessageTransport, TransportError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplyJob:
+    """One inbound message waiting for its reply."""
+    sender: str
+    body: str
+    replay_key: Optional[str] = None
+
+
+class ReplyWorker:
+    """
+    Bounded pool of asyncio workers that build and send replies.
+
+    The handler runs in the threadpool with its own session; delivery is
+    retried with exponential backoff and jitter.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Session, str, str], str],
+        transport: MessageTransport,
+        session_factory: Callable[[], Session] = SessionLocal,
+        concurrency: int = settings.WEBHOOK_REPLY_CONCURRENCY,
+        queue_size: int = settings.WEBHOOK_REPLY_QUEUE_SIZE,
+        max_attempts: int = settings.WEBHOOK_REPLY_MAX_ATTEMPTS,
+        backoff_seconds: float = settings.WEBHOOK_REPLY_BACKOFF_SECONDS
+    ):
+        """Initialize with the reply handler and transport."""
+        self.handler = handler
+        self.transport = transport
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.delivered = 0
+        self.failed = 0
+
+    def submit(self, job: ReplyJob) -> bool:
+        """
+        Queue a job without blocking. Must be called from the event loop.
+
+        Returns:
+            False when the queue is full
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def join(self):
+        """Wait until every queued job has been processed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self, timeout: Optional[float] = None):
+        """
+        Let the workers finish the queued jobs, then cancel them.
+
+        Args:
+            timeout: Seconds to wait for the queue to drain; jobs still
+                queued after that are dropped (None waits until drained)
+        """
+        if self._queue is not None and any(not t.done() for t in self._tasks):
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping %d queued replies at shutdown", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+
+    def _ensure_started(self):
+        """Start workers on first use, bound to the running loop."""
+        if self._tasks and not all(t.done() for t in self._tasks):
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._run()) for _ in range(self.concurrency)
+        ]
+
+    async def _run(self):
+        """Worker loop."""
+        while True:
+            job = await self._queue.get()
+            try:
+                reply = await run_in_threadpool(self._build_reply, job)
+                if reply is not None:
+                    await self._deliver(job.sender, reply)
+            except Exception:
+                logger.exception("Reply job for %s failed", job.replay_key or "message")
+            finally:
+                self._queue.task_done()
+
+    def _build_reply(self, job: ReplyJob) -> Optional[str]:
+        """
+        Run the handler; None when this message was already answered.
+
+        The reply text is what the replay key stores, as on the
+        synchronous webhook path.
+        """
+        db = self.session_factory()
+        try:
+            if job.replay_key and (
+                idempotency_cache.get(db, job.replay_key) is not None
+                or not idempotency_cache.claim(db, job.replay_key)
+            ):
+                # Answered, or being answered by another delivery of the message
+                return None
+            try:
+                reply = self.handler(db, job.sender, job.body)
+            except Exception:
+                if job.replay_key:
+                    idempotency_cache.release(db, job.replay_key)
+                raise
+            if job.replay_key:
+                idempotency_cache.put(db, job.replay_key, reply)
+            return reply
+        finally:
+            db.close()
+
+    async def _deliver(self, to: str, body: str):
+        """Send with retry and exponential backoff."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await run_in_threadpool(self.transport.send, to, body)
+                self.delivered += 1
+                return
+            except TransportError as e:
+                if attempt == self.max_attempts:
+                    self.failed += 1
+                    logger.error("Giving up on reply after %d attempts: %s", attempt, e)
+                    return
+                delay = self.backoff_seconds * (2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
@@ -0,0 +1,167 @@
+"""Ahead-of-time rendering of sample micro-modules for every template topic."""
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+from app.services.template_engine import TemplateEngine
+
+# Bump when the PPTX layout changes so every sample is rebuilt
+RENDERER_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def template_hash(topic: str, template: Dict) -> str:
+    """
+    Hash of everything a sample deck is rendered from.
+
+    Args:
+        topic: Topic tag
+        template: Template entry from the registry
+
+    Returns:
+        16-character hex digest
+    """
+    payload = json.dumps(
+        {"topic": topic, "template": template, "renderer": RENDERER_VERSION},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _render_sample(samples_dir: str, topic: str, template: Dict, digest: str) -> str:
+    """Render one sample deck (runs in a worker process)."""
+    from app.services.pptx_generator import PPTXGenerator
+
+    filename = f"{topic}-module.{digest}.pptx"
+    PPTXGenerator(exports_path=samples_dir).generate_micro_module(
+        title=f"{topic.replace('-', ' ').title()} - Micro Module",
+        topic=topic,
+        advice=template["advice"],
+        materials=template.get("materials", "varies"),
+        cluster="Sample Cluster",
+        output_filename=filename
+    )
+    return filename
+
+
+class SamplePrebuilder:
+    """Build and look up prebuilt sample decks through a manifest."""
+
+    def __init__(self, samples_dir: str = "templates/samples"):
+        """Initialize with the samples output directory."""
+        self.samples_dir = samples_dir
+        self.manifest_path = os.path.join(samples_dir, MANIFEST_NAME)
+        self._manifest: Optional[Dict] = None
+        self._manifest_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load_manifest(self) -> Dict:
+        """Read the manifest, reusing the parsed copy until the file changes."""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return {"renderer": RENDERER_VERSION, "topics": {}}
+
+        with self._lock:
+            if self._manifest is None or mtime != self._manifest_mtime:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def prebuild(
+        self,
+        engine: TemplateEngine,
+        workers: Optional[int] = None,
+        force: bool = False
+    ) -> Dict[str, str]:
+        """
+        Render a sample deck for every topic whose template changed.
+
+        Args:
+            engine: Template registry to build from
+            workers: Worker processes (default: CPU count)
+            force: Rebuild every topic
+
+        Returns:
+            Dict of topic -> "built", "fresh" or "removed"
+        """
+        os.makedirs(self.samples_dir, exist_ok=True)
+        entries = dict(self.load_manifest().get("topics", {}))
+        status = {}
+
+        stale = {}
+        for topic, template in engine.templates.items():
+            digest = template_hash(topic, template)
+            entry = entries.get(topic)
+            fresh = (
+                entry is not None
+                and entry["template_hash"] == digest
+                and os.path.isfile(os.path.join(self.samples_dir, entry["filename"]))
+            )
+            if fresh and not force:
+                status[topic] = "fresh"
+            else:
+                stale[topic] = (template, digest)
+
+        if stale:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    topic: pool.submit(_render_sample, self.samples_dir, topic, template, digest)
+                    for topic, (template, digest) in stale.items()
+                }
+                for topic, future in futures.items():
+                    filename = future.result()
+                    previous = entries.get(topic)
+                    if previous and previous["filename"] != filename:
+                        self._remove(previous["filename"])
+                    entries[topic] = {
+                        "template_hash": stale[topic][1],
+                        "filename": filename,
+                        "size_bytes": os.path.getsize(os.path.join(self.samples_dir, filename)),
+                        "built_at": datetime.utcnow().isoformat()
+                    }
+                    status[topic] = "built"
+
+        # Topics dropped from the registry
+        for topic in set(entries) - set(engine.templates):
+            self._remove(entries.pop(topic)["filename"])
+            status[topic] = "removed"
+
+        self._write_manifest({"renderer": RENDERER_VERSION, "topics": entries})
+        return status
+
+    def lookup(self, topic: str, engine: TemplateEngine) -> Optional[str]:
+        """
+        Path of the prebuilt deck for a topic, if it matches the current template.
+
+        Returns:
+            Full path, or None when missing or stale
+        """
+        template = engine.templates.get(topic)
+        entry = self.load_manifest().get("topics", {}).get(topic)
+        if template is None or entry is None:
+            return None
+        if entry["template_hash"] != template_hash(topic, template):
+            return None
+
+        path = os.path.join(self.samples_dir, entry["filename"])
+        return path if os.path.isfile(path) else None
+
+    def _remove(self, filename: str):
+        """Delete a superseded deck."""
+        try:
+            os.remove(os.path.join(self.samples_dir, filename))
+        except FileNotFoundError:
+            pass
+
+    def _write_manifest(self, manifest: Dict):
+        """Write the manifest atomically."""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,99 @@
+"""Lightweight periodic job runner for in-process maintenance tasks."""
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker is the only mode
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTasks:
+    """
+    Run registered blocking jobs on a fixed interval in the event loop.
+
+    With several workers, jobs that maintain shared state (tables,
+    archives, files on disk) are registered leader_only: they run only
+    in the worker holding an exclusive lock on `leader_lock_path`. The
+    lock is released when that worker exits, and another worker takes
+    it over on its next tick.
+    """
+
+    def __init__(self, leader_lock_path: Optional[str] = settings.LEADER_LOCK_PATH):
+        """Initialize an empty registry."""
+        self.leader_lock_path = leader_lock_path
+        self._jobs: Dict[str, Tuple[float, Callable, bool]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._leader_fd: Optional[int] = None
+        self._leader_pid: Optional[int] = None
+
+    def add(self, name: str, interval_seconds: float, func: Callable, leader_only: bool = False):
+        """
+        Register a job. Re-registering a name replaces the previous job.
+
+        Args:
+            name: Unique job name
+            interval_seconds: Delay between runs
+            func: Blocking callable, executed in the threadpool
+            leader_only: Run in one worker only (see is_leader)
+        """
+        self._jobs[name] = (interval_seconds, func, leader_only)
+
+    def start(self):
+        """Start every registered job that is not already running."""
+        for name, (interval, func, leader_only) in self._jobs.items():
+            if name in self._tasks and not self._tasks[name].done():
+                continue
+            self._tasks[name] = asyncio.create_task(self._run(name, interval, func, leader_only))
+
+    def is_leader(self) -> bool:
+        """
+        True if this worker runs the leader-only jobs, taking the lock if it is free.
+
+        Without a lock path (or on Windows) every process is the leader.
+        """
+        if not self.leader_lock_path or fcntl is None:
+            return True
+        if self._leader_fd is not None and self._leader_pid == os.getpid():
+            return True
+        # A descriptor inherited across fork is not this worker's lock
+        fd = os.open(self.leader_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._leader_fd, self._leader_pid = fd, os.getpid()
+        logger.info("Worker %d is running the leader-only jobs", self._leader_pid)
+        return True
+
+    async def stop(self):
+        """Cancel all running jobs."""
+        for task in self._tasks.values():
+            task.cancel()
+        for task in self._tasks.values():
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+
+    async def _run(self, name: str, interval: float, func: Callable, leader_only: bool):
+        """Job loop: sleep, run, log failures and keep going."""
+        while True:
+            await asyncio.sleep(interval)
+            if leader_only and not self.is_leader():
+                continue
+            try:
+                await run_in_threadpool(func)
+            except Exception:
+                logger.exception("Periodic job %s failed", name)
+
+
+scheduler = PeriodicTasks()
@@ -0,0 +1,201 @@
+"""Ranked full-text search over teacher narratives."""
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.orm import Session
+from app.models import Cluster
+
+# Quoted phrases or single words
+_TERMS = re.compile(r'"([^"]*)"|(\w+)', re.UNICODE)
+
+SNIPPET_OPEN = "["
+SNIPPET_CLOSE = "]"
+
+
+def fts5_query(query: str) -> str:
+    """
+    Turn user input into a safe FTS5 MATCH expression.
+
+    Quoted text becomes a phrase, other words become terms; all are
+    required. FTS5 operators and syntax in the input are neutralised.
+
+    Raises:
+        ValueError: If the input has no searchable words
+    """
+    parts = []
+    for phrase, word in _TERMS.findall(query):
+        words = re.findall(r"\w+", phrase) if phrase else [word]
+        if words:
+            parts.append('"' + " ".join(words) + '"')
+    if not parts:
+        raise ValueError("Search query has no words")
+    return " ".join(parts)
+
+
+def encode_cursor(rank: float, query_id: str) -> str:
+    """Opaque keyset cursor for the row after (rank, id)."""
+    raw = json.dumps([rank, query_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """
+    Inverse of encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, query_id = json.loads(raw)
+        return float(rank), str(query_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+class SearchService:
+    """
+    Search narrative_text through the backend's full-text index.
+
+    SQLite uses the FTS5 table (BM25 rank, snippet()); Postgres the GIN
+    indexed tsvector (ts_rank_cd, ts_headline). Either way lower rank is
+    better, results are ordered by (rank, id) and pages continue from a
+    keyset cursor, so deep pages cost the same as the first.
+    """
+
+    def search(
+        self,
+        db: Session,
+        query: str,
+        cluster: Optional[str] = None,
+        topic: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """
+        Ranked matches with snippets.
+
+        Args:
+            db: Database session
+            query: Words, or "quoted phrases", that must all appear
+            cluster: Filter by cluster name
+            topic: Filter by topic tag
+            date_from: Only queries created at or after this time
+            date_to: Only queries created at or before this time
+            limit: Page size
+            cursor: next_cursor from the previous page
+
+        Returns:
+            Dict with results and next_cursor (None on the last page)
+
+        Raises:
+            ValueError: If the query has no words or the cursor is invalid
+        """
+        filters = []
+        params: Dict = {"limit": limit + 1}
+        if cluster:
+            cluster_obj = db.query(Cluster).filter(Cluster.name == cluster).first()
+            filters.append("q.cluster_id = :cluster_id")
+            params["cluster_id"] = cluster_obj.id if cluster_obj else ""
+        if topic:
+            filters.append("q.topic_tag = :topic")
+            params["topic"] = topic
+        if date_from:
+            filters.append("q.created_at >= :date_from")
+            params["date_from"] = date_from
+        if date_to:
+            filters.append("q.created_at <= :date_to")
+            params["date_to"] = date_to
+
+        if db.get_bind().dialect.name == "postgresql":
+            statement = self._postgres_statement(query, filters, params, cursor)
+        else:
+            statement = self._sqlite_statement(query, filters, params, cursor)
+
+        # Typed so dates bind and load the same way the ORM stores them
+        statement = text(statement).columns(created_at=DateTime)
+        for name in ("date_from", "date_to"):
+            if name in params:
+                statement = statement.bindparams(bindparam(name, type_=DateTime))
+        rows = db.execute(statement, params).all()
+        results = [
+            {
+                "id": row.id,
+                "cluster": row.cluster,
+                "topic": row.topic_tag,
+                "created_at": row.created_at,
+                "snippet": row.snippet,
+                "rank": row.rank
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = results[-1]
+            next_cursor = encode_cursor(last["rank"], last["id"])
+        return {"results": results, "next_cursor": next_cursor}
+
+    @staticmethod
+    def rebuild_index(db: Session):
+        """Re-index every narrative (SQLite, e.g. after VACUUM); no-op on Postgres."""
+        if db.get_bind().dialect.name == "sqlite":
+            db.execute(text("INSERT INTO teacher_queries_fts(teacher_queries_fts) VALUES ('rebuild')"))
+            db.commit()
+
+    @staticmethod
+    def _after(cursor: Optional[str], rank_expr: str, params: Dict) -> List[str]:
+        """Keyset condition for the page after the cursor."""
+        if not cursor:
+            return []
+        params["after_rank"], params["after_id"] = decode_cursor(cursor)
+        return [
+            f"({rank_expr} > :after_rank OR ({rank_expr} = :after_rank AND q.id > :after_id))"
+        ]
+
+    def _sqlite_statement(self, query: str, filters: List[str], params: Dict, cursor: Optional[str]) -> str:
+        """FTS5 MATCH joined back by rowid; snippets only for the rows on the page."""
+        params["match"] = fts5_query(query)
+        rank = "bm25(teacher_queries_fts)"
+        where = ["teacher_queries_fts MATCH :match"] + filters + self._after(cursor, rank, params)
+        return (
+            "SELECT page.id, page.cluster, page.topic_tag, page.created_at, page.rank, "
+            f"snippet(teacher_queries_fts, 0, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '...', 16) AS snippet "
+            f"FROM (SELECT q.rowid AS fts_rowid, q.id, c.name AS cluster, q.topic_tag, q.created_at, {rank} AS rank "
+            "FROM teacher_queries_fts "
+            "JOIN teacher_queries q ON q.rowid = teacher_queries_fts.rowid "
+            "JOIN clusters c ON c.id = q.cluster_id "
+            f"WHERE {' AND '.join(where)} "
+            "ORDER BY rank, q.id LIMIT :limit) page "
+            "JOIN teacher_queries_fts ON teacher_queries_fts.rowid = page.fts_rowid "
+            "WHERE teacher_queries_fts MATCH :match "
+            "ORDER BY page.rank, page.id"
+        )
+
+    def _postgres_statement(self, query: str, filters: List[str], params: Dict, cursor: Optional[str]) -> str:
+        """GIN lookup; headlines are only built for the rows on the page."""
+        if not re.search(r"\w", query):
+            raise ValueError("Search query has no words")
+        params["query"] = query
+        rank = "(-ts_rank_cd(q.narrative_tsv, websearch_to_tsquery('english', :query)))"
+        where = (
+            ["q.narrative_tsv @@ websearch_to_tsquery('english', :query)"]
+            + filters + self._after(cursor, rank, params)
+        )
+        return (
+            "SELECT page.id, page.cluster, page.topic_tag, page.created_at, page.rank, "
+            "ts_headline('english', page.narrative_text, websearch_to_tsquery('english', :query), "
+            f"'StartSel={SNIPPET_OPEN},StopSel={SNIPPET_CLOSE},MaxWords=16,MinWords=6') AS snippet "
+            f"FROM (SELECT q.id, c.name AS cluster, q.topic_tag, q.created_at, q.narrative_text, {rank} AS rank "
+            "FROM teacher_queries q JOIN clusters c ON c.id = q.cluster_id "
+            f"WHERE {' AND '.join(where)} "
+            "ORDER BY rank, q.id LIMIT :limit) page "
+            "ORDER BY page.rank, page.id"
+        )
+
+
+search_service = SearchService()
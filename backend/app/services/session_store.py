@@ -0,0 +1,219 @@
+"""Per-teacher conversation state for the WhatsApp channel."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from typing import Optional
+from app.config import settings
+from app.services.invalidation import invalidation_bus
+from app.utils.privacy import seal, unseal
+
+# Kept in memory as-is, encrypted with the app secret in the spill file
+_SEALED_FIELDS = ("address", "pending_text")
+
+
+@dataclass
+class ConversationSession:
+    """What the bot remembers about one phone hash between messages."""
+    phone_hash: str
+    cluster: Optional[str] = None
+    last_query_id: Optional[str] = None
+    last_topic: Optional[str] = None
+    consented: Optional[bool] = None  # None: not known yet, ask the DB once
+    pending_text: Optional[str] = None  # Question held until the teacher replies YES
+    address: Optional[str] = None  # Reply address ("whatsapp:+91..."), never stored in the clear
+    updated_at: float = field(default_factory=time.time)
+
+
+class SessionStore:
+    """
+    In-memory LRU of conversation sessions with a TTL.
+
+    When a spill path is configured, sessions evicted from memory are
+    written to a local SQLite file and read back on the next message,
+    so the memory bound does not make the bot forget active teachers.
+    The reply address and the text held for consent are encrypted in
+    that file, so it holds no raw number or pre-consent message.
+
+    With several workers, `write_through` makes the spill file the
+    shared copy: every update is written to it and published on the
+    invalidation bus, and the other workers drop their in-memory copy
+    (see evict), so the next message reads the current session whichever
+    worker receives it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.SESSION_CACHE_SIZE,
+        ttl_seconds: int = settings.SESSION_TTL_SECONDS,
+        spill_path: Optional[str] = settings.SESSION_SPILL_PATH,
+        write_through: bool = settings.SESSION_WRITE_THROUGH
+    ):
+        """Initialize with LRU bound, TTL and optional spill file."""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.spill_path = spill_path
+        self.write_through = bool(spill_path) and write_through
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _spill(self) -> Optional[sqlite3.Connection]:
+        """Spill file connection, opened on first use and again after a fork."""
+        if not self.spill_path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(self.spill_path, check_same_thread=False, timeout=5)
+            # Forgotten sessions are overwritten on disk, not just unlinked
+            conn.execute("PRAGMA secure_delete = ON")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "phone_hash TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, phone_hash: str) -> Optional[ConversationSession]:
+        """Live session for a phone hash, or None."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(phone_hash)
+            if session is not None:
+                if now - session.updated_at < self.ttl_seconds:
+                    self._sessions.move_to_end(phone_hash)
+                    self.hits += 1
+                    return session
+                del self._sessions[phone_hash]
+
+            session = self._load_spilled(phone_hash)
+            if session is None or now - session.updated_at >= self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(session)
+            return session
+
+    def get_or_create(self, phone_hash: str) -> ConversationSession:
+        """Live session for a phone hash, creating an empty one if needed."""
+        session = self.get(phone_hash)
+        if session is None:
+            session = ConversationSession(phone_hash=phone_hash)
+            with self._lock:
+                self._insert(session)
+        return session
+
+    def update(self, phone_hash: str, **fields) -> ConversationSession:
+        """Set fields on a session and refresh its TTL."""
+        session = self.get_or_create(phone_hash)
+        with self._lock:
+            for name, value in fields.items():
+                setattr(session, name, value)
+            session.updated_at = time.time()
+            self._sessions[phone_hash] = session
+            self._sessions.move_to_end(phone_hash)
+            if self.write_through:
+                self._write_spilled(session)
+                self._spill.commit()
+        if self.write_through:
+            invalidation_bus.publish("sessions", phone_hash)
+        return session
+
+    def evict(self, phone_hash: Optional[str] = None):
+        """Drop in-memory copies (one phone hash, or all) so the next get reads the spill file."""
+        with self._lock:
+            if phone_hash is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(phone_hash, None)
+
+    def forget(self, phone_hash: str):
+        """Drop every trace of a phone hash (memory and spill)."""
+        with self._lock:
+            self._sessions.pop(phone_hash, None)
+            if self._spill is not None:
+                self._spill.execute("DELETE FROM sessions WHERE phone_hash = ?", (phone_hash,))
+                self._spill.commit()
+        if self.write_through:
+            invalidation_bus.publish("sessions", phone_hash)
+
+    def purge_expired(self) -> int:
+        """Remove expired sessions; returns how many were dropped."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [h for h, s in self._sessions.items() if s.updated_at < cutoff]
+            for phone_hash in expired:
+                del self._sessions[phone_hash]
+            dropped = len(expired)
+            if self._spill is not None:
+                cursor = self._spill.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+                self._spill.commit()
+                dropped += cursor.rowcount
+        return dropped
+
+    def flush(self):
+        """Write every in-memory session to the spill file (e.g. at shutdown)."""
+        if self._spill is None or self.write_through:
+            return
+        with self._lock:
+            for session in self._sessions.values():
+                self._write_spilled(session)
+            self._spill.commit()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _insert(self, session: ConversationSession):
+        """Add to the LRU (lock held), spilling the oldest past the bound."""
+        self._sessions[session.phone_hash] = session
+        self._sessions.move_to_end(session.phone_hash)
+        spilled = False
+        while len(self._sessions) > self.max_entries:
+            _, oldest = self._sessions.popitem(last=False)
+            # Written through already; another worker may hold a newer copy
+            if self._spill is not None and not self.write_through:
+                self._write_spilled(oldest)
+                spilled = True
+        if spilled:
+            self._spill.commit()
+
+    def _load_spilled(self, phone_hash: str) -> Optional[ConversationSession]:
+        """Read a spilled session (lock held)."""
+        if self._spill is None:
+            return None
+        row = self._spill.execute(
+            "SELECT data FROM sessions WHERE phone_hash = ?", (phone_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        for name in _SEALED_FIELDS:
+            if data.get(name) is not None:
+                data[name] = unseal(data[name])
+        return ConversationSession(**data)
+
+    def _write_spilled(self, session: ConversationSession):
+        """Upsert a session into the spill file (lock held, caller commits)."""
+        self._spill.execute(
+            "INSERT OR REPLACE INTO sessions (phone_hash, data, updated_at) VALUES (?, ?, ?)",
+            (session.phone_hash, json.dumps(self._sealed(session)), session.updated_at)
+        )
+
+    @staticmethod
+    def _sealed(session: ConversationSession) -> dict:
+        """Session fields for the spill file, with the sensitive ones encrypted."""
+        data = asdict(session)
+        for name in _SEALED_FIELDS:
+            if data[name] is not None:
+                data[name] = seal(data[name])
+        return data
+
+
+session_store = SessionStore()
@@ -0,0 +1,513 @@
+"""Similar-query retrieval: hashed TF-IDF vectors with cosine top-k."""
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import TeacherQuery
+from app.services.invalidation import invalidation_bus
+from app.services.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+# Arrays of a built segment; the large ones are memory-mapped on load
+_ARRAYS = ("idf", "term_ptr", "postings_doc", "postings_w", "doc_ids", "sorted_ids", "sorted_pos")
+_POINTER = "CURRENT"
+
+# Terms in more than this share of documents carry no signal (and have
+# the longest posting lists); ignored once the corpus is big enough
+_MAX_DF = 0.5
+_MAX_DF_MIN_DOCS = 1000
+
+
+def hashed_features(text: str, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed word and word-bigram features of a text.
+
+    Returns:
+        (sorted feature indices, sublinear term frequencies 1 + log(tf))
+    """
+    words = _TOKEN.findall(text.lower())
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    counts = Counter(zlib.crc32(t.encode("utf-8")) % n_features for t in terms)
+    features = np.fromiter(sorted(counts), dtype=np.int32, count=len(counts))
+    tf = np.fromiter((1.0 + math.log(counts[f]) for f in features.tolist()), dtype=np.float32, count=len(counts))
+    return features, tf
+
+
+def _gather(term_ptr: np.ndarray, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Posting positions for several terms at once.
+
+    Returns:
+        (positions into the posting arrays, owning query-term index per position)
+    """
+    starts = term_ptr[features]
+    lengths = term_ptr[features + 1] - starts
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(features)), lengths)
+    # Position within each term's run, offset by the run's start
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts[owner] + offsets, owner
+
+
+class _Segment:
+    """An immutable, term-major (CSC) TF-IDF matrix; rows are L2-normalised."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], built_at: Optional[datetime]):
+        """Wrap built or memory-mapped arrays."""
+        self.idf = arrays["idf"]
+        self.term_ptr = arrays["term_ptr"]
+        self.postings_doc = arrays["postings_doc"]
+        self.postings_w = arrays["postings_w"]
+        self.doc_ids = arrays["doc_ids"]
+        self.sorted_ids = arrays["sorted_ids"]
+        self.sorted_pos = arrays["sorted_pos"]
+        self.n_docs = len(self.doc_ids)
+        self.built_at = built_at
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays by file name."""
+        return {name: getattr(self, name) for name in _ARRAYS}
+
+    def position(self, query_id: str) -> Optional[int]:
+        """Row of a query id, or None (binary search over the sorted ids)."""
+        key = query_id.encode("ascii", "ignore")
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < self.n_docs and self.sorted_ids[i] == key:
+            return int(self.sorted_pos[i])
+        return None
+
+    def scores(self, features: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Cosine similarity of a normalised query vector with every row."""
+        positions, owner = _gather(self.term_ptr, features)
+        return np.bincount(
+            self.postings_doc[positions],
+            weights=self.postings_w[positions] * weights[owner],
+            minlength=self.n_docs
+        )
+
+
+class SimilarityIndex:
+    """
+    Nearest past queries by TF-IDF cosine similarity.
+
+    Word and bigram features are hashed into `n_features` buckets, so the
+    index needs no vocabulary and new text never changes its shape. The
+    bulk of the corpus is a term-major sparse matrix: a lookup gathers
+    the posting lists of the query's terms and scores every candidate in
+    one vectorised bincount. Queries added since the last build sit in a
+    small delta, weighted with the same IDF and scored the same way;
+    a periodic rebuild folds them in and refreshes the IDF.
+
+    Built segments are saved as .npy files and memory-mapped on load, so
+    a restarted worker is ready without reading the table again.
+    """
+
+    def __init__(
+        self,
+        path: str = settings.SIMILARITY_INDEX_PATH,
+        n_features: int = settings.SIMILARITY_FEATURES,
+        max_delta: int = settings.SIMILARITY_MAX_DELTA
+    ):
+        """Initialize an empty index stored under `path`."""
+        self.path = path
+        self.n_features = n_features
+        self.max_delta = max_delta
+        self._segment = self._empty_segment()
+        self._removed_ids: Set[str] = set()
+        self._removed_rows: Set[int] = set()
+        self._delta: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._delta_arrays: Optional[Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]] = None
+        self._watermark: Optional[datetime] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    # Building
+
+    def build(self, rows: Iterable[Tuple[str, str]]) -> _Segment:
+        """
+        Build a segment from (query id, text) pairs.
+
+        Features are appended to flat typed arrays while streaming, then
+        weighted, normalised and sorted by term in a few array passes.
+        """
+        ids: List[str] = []
+        lengths = array("i")
+        features = array("i")
+        tfs = array("f")
+        for query_id, text in rows:
+            f, tf = hashed_features(text or "", self.n_features)
+            ids.append(query_id)
+            lengths.append(len(f))
+            features.frombytes(f.tobytes())
+            tfs.frombytes(tf.tobytes())
+
+        n_docs = len(ids)
+        doc = np.repeat(np.arange(n_docs, dtype=np.int32), np.frombuffer(lengths, dtype=np.int32))
+        feature = np.frombuffer(features, dtype=np.int32)
+        tf = np.frombuffer(tfs, dtype=np.float32)
+
+        df = np.bincount(feature, minlength=self.n_features)
+        idf = (np.log((1.0 + n_docs) / (1.0 + df)) + 1.0).astype(np.float32)
+        if n_docs >= _MAX_DF_MIN_DOCS:
+            idf[df > _MAX_DF * n_docs] = 0.0
+
+        weight = tf * idf[feature]
+        keep = weight > 0
+        doc, feature, weight = doc[keep], feature[keep], weight[keep]
+        norms = np.sqrt(np.bincount(doc, weights=weight.astype(np.float64) ** 2, minlength=n_docs))
+        norms[norms == 0] = 1.0
+        weight = (weight / norms[doc]).astype(np.float32)
+
+        order = np.argsort(feature, kind="stable")
+        term_ptr = np.zeros(self.n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(feature, minlength=self.n_features), out=term_ptr[1:])
+        doc_ids = np.array(ids, dtype="S36")
+        sorted_pos = np.argsort(doc_ids, kind="stable").astype(np.int32)
+        return _Segment(
+            {
+                "idf": idf,
+                "term_ptr": term_ptr,
+                "postings_doc": doc[order],
+                "postings_w": weight[order],
+                "doc_ids": doc_ids,
+                "sorted_ids": doc_ids[sorted_pos],
+                "sorted_pos": sorted_pos
+            },
+            built_at=None
+        )
+
+    def rebuild(self, db: Session) -> int:
+        """
+        Rebuild from the whole table, save it, and swap it in.
+
+        Queries inserted during the build are picked up by the next
+        refresh, since the watermark is taken before reading.
+
+        Returns:
+            Number of documents indexed
+        """
+        with self._build_lock:
+            started_at = datetime.utcnow()
+            rows = db.query(TeacherQuery.id, TeacherQuery.narrative_text).yield_per(5000)
+            segment = self.build(rows)
+            segment.built_at = started_at
+            self.save(segment)
+            with self._lock:
+                # Rows deleted while the build was reading still apply
+                self._removed_ids = {q for q in self._removed_ids if segment.position(q) is not None}
+                self._removed_rows = {segment.position(q) for q in self._removed_ids}
+                self._segment = segment
+                # The next refresh re-adds anything inserted during the build
+                self._delta = {}
+                self._delta_arrays = None
+                self._watermark = started_at
+                self._loaded = True
+            return segment.n_docs
+
+    def rebuild_shared(self, db: Session) -> int:
+        """Rebuild, then have the other workers map the new segment instead of building their own."""
+        n_docs = self.rebuild(db)
+        invalidation_bus.publish("similarity")
+        return n_docs
+
+    # Incremental updates
+
+    def refresh(self, db: Session) -> int:
+        """
+        Add queries created since the last refresh to the delta.
+
+        Maps the saved index first if this worker has none. Building is
+        left to the leader, which also rebuilds once the delta outgrows
+        `max_delta`; the other workers map its segment when the
+        "similarity" invalidation arrives.
+
+        Returns:
+            Number of queries added
+        """
+        if not self._loaded and not self.load():
+            if not scheduler.is_leader():
+                return 0
+            return self.rebuild_shared(db)
+        query = db.query(TeacherQuery.id, TeacherQuery.narrative_text, TeacherQuery.created_at)
+        if self._watermark is not None:
+            query = query.filter(TeacherQuery.created_at >= self._watermark)
+        added = 0
+        for query_id, text, created_at in query.yield_per(1000):
+            if self.add(query_id, text):
+                added += 1
+            if created_at and (self._watermark is None or created_at > self._watermark):
+                self._watermark = created_at
+        if len(self._delta) > self.max_delta and scheduler.is_leader():
+            self.rebuild_shared(db)
+        return added
+
+    def add(self, query_id: str, text: str) -> bool:
+        """Index one query in the delta; False if it is already indexed."""
+        segment = self._segment
+        if query_id in self._delta or segment.position(query_id) is not None:
+            return False
+        features, weights = self._vector(segment, text or "")
+        with self._lock:
+            self._delta[query_id] = (features, weights)
+            self._delta_arrays = None
+        return True
+
+    def remove(self, query_ids: Iterable[str]) -> int:
+        """
+        Drop queries from results (deleted or erased rows).
+
+        Returns:
+            Number of indexed queries removed
+        """
+        removed = 0
+        with self._lock:
+            for query_id in query_ids:
+                self._removed_ids.add(query_id)
+                if self._delta.pop(query_id, None) is not None:
+                    removed += 1
+                    self._delta_arrays = None
+                row = self._segment.position(query_id)
+                if row is not None and row not in self._removed_rows:
+                    self._removed_rows.add(row)
+                    removed += 1
+        return removed
+
+    # Retrieval
+
+    def similar(self, text: str, k: int = 10, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        The k indexed queries most similar to a text.
+
+        Args:
+            text: Narrative to compare
+            k: Number of results
+            exclude: Query id to leave out (the query itself)
+
+        Returns:
+            (query id, cosine similarity) pairs, most similar first
+        """
+        with self._lock:
+            segment = self._segment
+            removed = np.fromiter(self._removed_rows, dtype=np.int64, count=len(self._removed_rows))
+            delta = self._delta_snapshot()
+        features, weights = self._vector(segment, text)
+        if not len(features):
+            return []
+
+        candidates: List[Tuple[str, float]] = []
+        if segment.n_docs:
+            scores = segment.scores(features, weights)
+            scores[removed] = 0.0
+            candidates += self._top(scores, k + 1, lambda i: segment.doc_ids[i].decode())
+
+        delta_ids, delta_doc, delta_feature, delta_weight = delta
+        if delta_ids:
+            pos = np.clip(np.searchsorted(features, delta_feature), 0, len(features) - 1)
+            hit = features[pos] == delta_feature
+            scores = np.bincount(
+                delta_doc[hit], weights=delta_weight[hit] * weights[pos[hit]], minlength=len(delta_ids)
+            )
+            candidates += self._top(scores, k + 1, lambda i: delta_ids[i])
+
+        candidates = [c for c in candidates if c[0] != exclude]
+        candidates.sort(key=lambda c: (-c[1], c[0]))
+        return candidates[:k]
+
+    @staticmethod
+    def topic_vote(neighbours: List[Tuple[str, float]], topics: Dict[str, str]) -> Dict[str, float]:
+        """Share of similarity mass per topic among the neighbours."""
+        votes: Dict[str, float] = {}
+        for query_id, score in neighbours:
+            topic = topics.get(query_id)
+            if topic:
+                votes[topic] = votes.get(topic, 0.0) + score
+        total = sum(votes.values()) or 1.0
+        return {topic: round(score / total, 3) for topic, score in sorted(votes.items(), key=lambda v: -v[1])}
+
+    # Persistence
+
+    def save(self, segment: _Segment):
+        """
+        Write a segment to a new directory and point CURRENT at it.
+
+        The directory is written under a ".partial" name and renamed when
+        complete, so the cleanup of older builds never touches one that is
+        still being written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        build_id = f"build-{int(time.time() * 1000)}"
+        target = os.path.join(self.path, build_id + ".partial")
+        os.makedirs(target)
+        for name, values in segment.arrays.items():
+            np.save(os.path.join(target, f"{name}.npy"), values)
+        with open(os.path.join(target, "meta.json"), "w") as f:
+            json.dump({
+                "n_features": self.n_features,
+                "n_docs": segment.n_docs,
+                "built_at": segment.built_at.isoformat() if segment.built_at else None
+            }, f)
+        os.rename(target, os.path.join(self.path, build_id))
+
+        pointer = os.path.join(self.path, _POINTER)
+        with open(pointer + ".tmp", "w") as f:
+            f.write(build_id)
+        os.replace(pointer + ".tmp", pointer)
+        # Older builds; readers that mapped them keep their open files
+        for entry in os.listdir(self.path):
+            if entry.startswith("build-") and not entry.endswith(".partial") and entry != build_id:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    def load(self) -> bool:
+        """
+        Memory-map the current saved segment.
+
+        Returns:
+            False if there is no usable saved index
+        """
+        try:
+            with open(os.path.join(self.path, _POINTER)) as f:
+                target = os.path.join(self.path, f.read().strip())
+            with open(os.path.join(target, "meta.json")) as f:
+                meta = json.load(f)
+            if meta["n_features"] != self.n_features:
+                return False
+            arrays = {
+                name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r")
+                for name in _ARRAYS
+            }
+        except (OSError, ValueError, KeyError):
+            return False
+
+        built_at = datetime.fromisoformat(meta["built_at"]) if meta.get("built_at") else None
+        with self._lock:
+            self._segment = _Segment(arrays, built_at)
+            self._removed_ids = set()
+            self._removed_rows = set()
+            self._delta = {}
+            self._delta_arrays = None
+            self._watermark = built_at
+            self._loaded = True
+        return True
+
+    def ensure_loaded(self) -> bool:
+        """
+        Map the saved index on first use.
+
+        Never builds: that is too slow for a request and is left to the
+        leader's refresh job.
+
+        Returns:
+            False if no index has been built yet
+        """
+        return self._loaded or self.load()
+
+    @property
+    def built_at(self) -> Optional[datetime]:
+        """When the build of the current segment started (None if unknown or never built)."""
+        return self._segment.built_at
+
+    def stats(self) -> Dict[str, int]:
+        """Indexed, pending and removed document counts."""
+        return {
+            "documents": self._segment.n_docs,
+            "delta": len(self._delta),
+            "removed": len(self._removed_rows)
+        }
+
+    # Internals
+
+    def _empty_segment(self) -> _Segment:
+        """Segment with no documents."""
+        return _Segment(
+            {
+                "idf": np.ones(self.n_features, dtype=np.float32),
+                "term_ptr": np.zeros(self.n_features + 1, dtype=np.int64),
+                "postings_doc": np.zeros(0, dtype=np.int32),
+                "postings_w": np.zeros(0, dtype=np.float32),
+                "doc_ids": np.zeros(0, dtype="S36"),
+                "sorted_ids": np.zeros(0, dtype="S36"),
+                "sorted_pos": np.zeros(0, dtype=np.int32)
+            },
+            built_at=None
+        )
+
+    @staticmethod
+    def _vector(segment: _Segment, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """L2-normalised TF-IDF vector of a text under a segment's IDF."""
+        features, tf = hashed_features(text, len(segment.idf))
+        weights = tf * segment.idf[features]
+        keep = weights > 0
+        features, weights = features[keep], weights[keep]
+        norm = float(np.sqrt(np.dot(weights, weights)))
+        if norm:
+            weights = weights / norm
+        return features, weights
+
+    def _delta_snapshot(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Delta documents as flat arrays (rebuilt only after a change; call under the lock)."""
+        if self._delta_arrays is None:
+            ids = list(self._delta)
+            vectors = [self._delta[q] for q in ids]
+            lengths = [len(f) for f, _ in vectors]
+            self._delta_arrays = (
+                ids,
+                np.repeat(np.arange(len(ids)), lengths),
+                np.concatenate([f for f, _ in vectors]) if ids else np.zeros(0, dtype=np.int32),
+                np.concatenate([w for _, w in vectors]) if ids else np.zeros(0, dtype=np.float32)
+            )
+        return self._delta_arrays
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int, id_of) -> List[Tuple[str, float]]:
+        """Ids and scores of the k best non-zero scores."""
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        return [(id_of(int(i)), round(float(scores[i]), 4)) for i in candidates]
+
+
+similarity_index = SimilarityIndex()
+
+
+def run_refresh() -> int:
+    """Periodic job: index queries added since the last refresh."""
+    db = SessionLocal()
+    try:
+        return similarity_index.refresh(db)
+    finally:
+        db.close()
+
+
+def run_rebuild() -> int:
+    """Periodic job: rebuild the index, refreshing IDF and compacting the delta."""
+    db = SessionLocal()
+    try:
+        return similarity_index.rebuild_shared(db)
+    finally:
+        db.close()
+
+
+def apply_invalidation(key: Optional[str]):
+    """Invalidation handler: reload the saved index, or hide comma-separated query ids."""
+    if key is None:
+        similarity_index.load()
+    else:
+        similarity_index.remove(key.split(","))
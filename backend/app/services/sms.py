@@ -0,0 +1,124 @@
+"""SMS channel: GSM-7 compact replies within a segment budget."""
+import logging
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.messaging import MessageTransport, create_transport
+from app.services.template_engine import TemplateEngine, get_template_engine
+from app.utils.gsm7 import segment_count, to_gsm7
+
+logger = logging.getLogger(__name__)
+
+SMS_FOOTER = "Reply CRP for a classroom visit, MODULE for training material."
+
+
+class SmsRenderer:
+    """
+    Render replies for basic phones.
+
+    Text is folded to GSM-7 (no emoji, so no UCS-2) and cut to fit
+    `max_segments`. Optional parts (materials, footer) are only added
+    while they fit. Text that folding would mostly erase, such as a
+    Hindi override, is sent as UCS-2 instead and cut to the same budget.
+    Advice goes through the template engine's cluster and language
+    overrides; each distinct template text is compacted once, so
+    answering a query is an engine lookup and a dict lookup.
+    """
+
+    def __init__(self, engine: Optional[TemplateEngine] = None, max_segments: int = settings.SMS_MAX_SEGMENTS):
+        """Initialize with a template engine (default: the shared one, loaded on first use)."""
+        self._engine = engine
+        self.max_segments = max_segments
+        # (advice, materials) -> compact text; bounded by the number of templates and overrides
+        self._advice: Dict[Tuple[str, str], str] = {}
+
+    @property
+    def engine(self) -> TemplateEngine:
+        """Template engine the advice is rendered from."""
+        if self._engine is None:
+            self._engine = get_template_engine()
+        return self._engine
+
+    def advice(self, topic: str, cluster: str = "", language: Optional[str] = None) -> str:
+        """
+        Compact advice for a topic (the general advice if unknown).
+
+        Args:
+            topic: Topic tag
+            cluster: Cluster name, for its overrides and default language
+            language: Language code; defaults to the cluster's language
+        """
+        response = self.engine.generate_response(topic, cluster, language)
+        key = (response["advice"], response["materials"])
+        cached = self._advice.get(key)
+        if cached is None:
+            cached = self._advice[key] = self.compact(
+                response["advice"],
+                optional=(f"Materials: {response['materials']}", SMS_FOOTER)
+            )
+        return cached
+
+    def compact(self, text: str, optional: Tuple[str, ...] = ()) -> str:
+        """
+        Fold text to GSM-7 and fit it in the segment budget.
+
+        If folding would drop most of the text's letters (another
+        script), the text is kept as is and sent as UCS-2.
+
+        Args:
+            text: Required text; trimmed line by line, then word by word
+            optional: Extra lines appended, in order, only if they still fit
+        """
+        fold = to_gsm7
+        if _letter_count(to_gsm7(text)) * 2 < _letter_count(text):
+            fold = _tidy
+        body = self._fit(fold(text))
+        for extra in optional:
+            candidate = f"{body}\n{fold(extra)}"
+            if segment_count(candidate) <= self.max_segments:
+                body = candidate
+        return body
+
+    def _fit(self, text: str) -> str:
+        """Drop trailing lines, then trailing words, until the text fits."""
+        if segment_count(text) <= self.max_segments:
+            return text
+        lines = text.split("\n")
+        while len(lines) > 1 and segment_count("\n".join(lines)) > self.max_segments:
+            lines.pop()
+        words = "\n".join(lines).split(" ")
+        while len(words) > 1 and segment_count(" ".join(words) + "...") > self.max_segments:
+            words.pop()
+        return " ".join(words) + "..."
+
+
+def _letter_count(text: str) -> int:
+    """Letters and digits in a text."""
+    return sum(ch.isalnum() for ch in text)
+
+
+def _tidy(text: str) -> str:
+    """Collapse runs of spaces and drop blank lines, keeping every character."""
+    lines = (" ".join(line.split()) for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+class SmsChannel:
+    """Outbound SMS through a pluggable gateway (Twilio SMS or the stub)."""
+
+    def __init__(self, renderer: SmsRenderer, gateway: MessageTransport):
+        """Initialize with a renderer and gateway."""
+        self.renderer = renderer
+        self.gateway = gateway
+
+    def send_batch(self, messages: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Compact and send several messages in one gateway call.
+
+        Args:
+            messages: (phone number, text) pairs
+
+        Returns:
+            Provider message id per message, None where sending failed
+        """
+        compacted = [(to, self.renderer.compact(text)) for to, text in messages]
+        return self.gateway.send_batch(compacted)
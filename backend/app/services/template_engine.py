@@ -1,20 +1,46 @@
 """Template engine for generating teacher responses."""
-import yaml
 import os
-from typing import Dict, Optional
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from app.services.metrics import metrics, timed, FAST_BUCKETS
+
+# Fields an override may replace
+OVERRIDABLE_FIELDS = ("advice", "materials", "demo_video", "duration")
+
+TEMPLATE_SECONDS = metrics.histogram(
+    "template_engine_seconds", "Topic detection and response generation time", ("operation",), FAST_BUCKETS
+)
 
 
 class TemplateEngine:
     """Deterministic template-based response generator."""
     
-    def __init__(self, templates_path: str = "templates/response_templates.yaml"):
-        """Initialize with templates file."""
+    def __init__(
+        self,
+        templates_path: str = "templates/response_templates.yaml",
+        overrides_path: str = "templates/template_overrides.yaml",
+        cache_size: int = 10000
+    ):
+        """Initialize with templates file and optional cluster/language overrides."""
         self.templates_path = templates_path
+        self.overrides_path = overrides_path
+        self.cache_size = cache_size
         self.templates = self._load_templates()
         self.keyword_map = self._build_keyword_map()
+        self.overrides = self._load_overrides()
+        self._resolved: "OrderedDict[Tuple[str, str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._precompute()
+        self.hits = self.misses = 0  # Warm-up lookups are not counted
     
     def _load_templates(self) -> Dict:
         """Load templates from YAML file."""
+        import yaml
+        
         try:
             with open(self.templates_path, 'r', encoding='utf-8') as f:
                 return yaml.safe_load(f)
@@ -22,6 +48,27 @@ class TemplateEngine:
             # Fallback templates if file doesn't exist
             return self._get_default_templates()
     
+    def _load_overrides(self) -> Dict:
+        """
+        Load per-cluster and per-language overrides.
+        
+        Layout:
+            languages: {<lang>: {<topic>: {advice: ..., ...}}}
+            clusters: {<cluster name>: {language: <lang>,
+                                        all: {materials: ...},
+                                        topics: {<topic>: {...}}}}
+        """
+        import yaml
+        
+        try:
+            with open(self.overrides_path, 'r', encoding='utf-8') as f:
+                overrides = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            overrides = {}
+        overrides.setdefault("languages", {})
+        overrides.setdefault("clusters", {})
+        return overrides
+    
     def _get_default_templates(self) -> Dict:
         """Default templates for immediate use."""
         return {
@@ -171,6 +218,7 @@ class TemplateEngine:
             "slow learner": "differentiation",
         }
     
+    @timed(TEMPLATE_SECONDS, "detect_topic")
     def detect_topic(self, text: str, provided_topic: Optional[str] = None) -> str:
         """
         Detect topic from text using keyword matching.
@@ -196,18 +244,57 @@ class TemplateEngine:
         # Default fallback
         return "general"
     
-    def generate_response(self, topic: str, cluster: str = "") -> Dict:
+    @timed(TEMPLATE_SECONDS, "generate_response")
+    def generate_response(self, topic: str, cluster: str = "", language: Optional[str] = None) -> Dict:
         """
         Generate templated response for topic.
         
+        Clusters without overrides share one cached entry per topic and
+        language, so the lookup stays a dict hit however many clusters
+        exist.
+        
         Args:
             topic: Topic tag
             cluster: Cluster name (for personalization)
+            language: Language code; defaults to the cluster's language
         
         Returns:
             Dict with advice, materials, demo_link, duration
         """
-        template = self.templates.get(topic, self.templates.get("general"))
+        cluster_overrides = self.overrides["clusters"].get(cluster)
+        cluster_key = cluster if cluster_overrides else ""
+        if language is None:
+            language = (cluster_overrides or {}).get("language", "")
+        if language not in self.overrides["languages"]:
+            language = ""
+        if topic not in self.templates:
+            topic = "general"
+        
+        key = (topic, cluster_key, language)
+        with self._lock:
+            cached = self._resolved.get(key)
+            if cached is not None:
+                self._resolved.move_to_end(key)
+                self.hits += 1
+                return dict(cached)
+        
+        resolved = self._resolve(topic, cluster_key, language)
+        with self._lock:
+            self.misses += 1
+            self._resolved[key] = resolved
+            while len(self._resolved) > self.cache_size:
+                self._resolved.popitem(last=False)
+        return dict(resolved)
+    
+    def _resolve(self, topic: str, cluster: str, language: str) -> Dict:
+        """Layer base template < language < cluster-wide < cluster topic."""
+        template = dict(self.templates.get(topic, self.templates.get("general")))
+        layers = [self.overrides["languages"].get(language, {}).get(topic, {})]
+        cluster_overrides = self.overrides["clusters"].get(cluster, {}) if cluster else {}
+        layers.append(cluster_overrides.get("all", {}))
+        layers.append(cluster_overrides.get("topics", {}).get(topic, {}))
+        for layer in layers:
+            template.update({k: v for k, v in layer.items() if k in OVERRIDABLE_FIELDS})
         
         return {
             "advice": template["advice"],
@@ -216,6 +303,21 @@ class TemplateEngine:
             "duration": template.get("duration", "varies")
         }
     
+    def _precompute(self):
+        """Resolve every topic for the base, each language and each overridden cluster."""
+        languages = [""] + list(self.overrides["languages"])
+        for topic in self.templates:
+            for language in languages:
+                self.generate_response(topic, "", language or None)
+            for cluster in self.overrides["clusters"]:
+                self.generate_response(topic, cluster)
+    
     def get_all_topics(self) -> list:
         """Get list of all available topics."""
-        return list(self.templates.keys())
\ No newline at end of file
+        return list(self.templates.keys())
+
+
+@lru_cache(maxsize=None)
+def get_template_engine() -> TemplateEngine:
+    """Engine shared by the API and channels, loaded on first use rather than at import."""
+    return TemplateEngine()
@@ -0,0 +1,160 @@
+"""Write-behind persistence for teacher queries answered in degraded mode."""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Cluster, TeacherQuery
+from app.services.cluster_matcher import cluster_matcher
+
+logger = logging.getLogger(__name__)
+
+
+class QueryWriteQueue:
+    """
+    Bounded queue of teacher queries drained by one background thread.
+
+    Each drained batch is written in a single transaction, so a backlog
+    built up during a surge costs one connection instead of one per
+    request. If the batch fails, its rows are retried one per
+    transaction, so one bad row does not lose the others.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_size: int = settings.WRITE_QUEUE_SIZE,
+        batch_size: int = settings.WRITE_QUEUE_BATCH_SIZE
+    ):
+        """Initialize with the session factory and bounds."""
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def submit(self, row: Dict) -> bool:
+        """
+        Queue one query for insertion.
+
+        Args:
+            row: TeacherQuery fields plus "cluster" (the cluster name)
+
+        Returns:
+            False when the queue is full
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            return False
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far has been written.
+
+        Returns:
+            False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def discard(self, phone_hash: str) -> int:
+        """
+        Remove queued, not yet written rows from a phone hash.
+
+        Returns:
+            Number of rows removed
+        """
+        q = self._queue
+        with q.mutex:
+            kept = [row for row in q.queue if row.get("phone_hash") != phone_hash]
+            removed = len(q.queue) - len(kept)
+            if removed:
+                q.queue.clear()
+                q.queue.extend(kept)
+                q.unfinished_tasks -= removed
+                if not q.unfinished_tasks:
+                    q.all_tasks_done.notify_all()
+                q.not_full.notify(removed)
+        return removed
+
+    def pending(self) -> int:
+        """Rows waiting to be written."""
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        """Start the writer thread on first use."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Writer loop: block for one row, then take whatever else is queued."""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.written += len(batch)
+            except Exception:
+                logger.warning("Batch of %d deferred queries failed; retrying row by row", len(batch))
+                self._write_rows(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_rows(self, batch: List[Dict]):
+        """Insert a failed batch one row per transaction, skipping only the rows that fail."""
+        for row in batch:
+            try:
+                self._write([row])
+                self.written += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Could not persist deferred query %s", row.get("id"))
+
+    def _write(self, batch: List[Dict]):
+        """Insert a batch, creating missing clusters."""
+        db = self.session_factory()
+        try:
+            names = {row["cluster"] for row in batch}
+            clusters = {
+                c.name: c for c in db.query(Cluster).filter(Cluster.name.in_(names))
+            }
+            created = [Cluster(name=name, region="Unknown") for name in names - clusters.keys()]
+            for cluster in created:
+                clusters[cluster.name] = cluster
+                db.add(cluster)
+            db.flush()
+
+            for row in batch:
+                fields = {k: v for k, v in row.items() if k != "cluster"}
+                db.add(TeacherQuery(cluster_id=clusters[row["cluster"]].id, **fields))
+            db.commit()
+
+            for cluster in created:
+                cluster_matcher.add_created(cluster.name, cluster.id)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+query_write_queue = QueryWriteQueue()
@@ -0,0 +1,80 @@
+"""GSM 03.38 (GSM-7) helpers: charset folding and SMS segment counting."""
+import re
+import unicodedata
+
+# Basic character set (one septet each)
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Extension table (escape + character: two septets each)
+GSM7_EXTENDED = "^{}\\[~]|€\f"
+
+_BASIC = frozenset(GSM7_BASIC)
+_EXTENDED = frozenset(GSM7_EXTENDED)
+
+# Common characters outside GSM-7 with a readable substitute
+_SUBSTITUTES = {
+    "‘": "'", "’": "'", "‚": "'", "“": '"', "”": '"', "„": '"',
+    "–": "-", "—": "-", "−": "-", "…": "...", "•": "-", "·": "-",
+    "\t": " ", " ": " ", "₹": "Rs", "×": "x", "÷": "/",
+    "½": "1/2", "¼": "1/4", "¾": "3/4",
+}
+
+_SPACES = re.compile(r"[ ]{2,}")
+
+SINGLE_SEGMENT_SEPTETS = 160
+MULTI_SEGMENT_SEPTETS = 153
+SINGLE_SEGMENT_UCS2 = 70
+MULTI_SEGMENT_UCS2 = 67
+
+
+def is_gsm7(text: str) -> bool:
+    """True if every character can be sent in GSM-7."""
+    return all(ch in _BASIC or ch in _EXTENDED for ch in text)
+
+
+def septet_length(text: str) -> int:
+    """Length in septets (extension characters count twice)."""
+    return sum(2 if ch in _EXTENDED else 1 for ch in text)
+
+
+def segment_count(text: str) -> int:
+    """
+    Number of SMS segments needed for a text.
+
+    GSM-7 fits 160 septets in one segment and 153 per segment when
+    concatenated; anything else is sent as UCS-2 (70 / 67 characters).
+    """
+    if is_gsm7(text):
+        length, single, multi = septet_length(text), SINGLE_SEGMENT_SEPTETS, MULTI_SEGMENT_SEPTETS
+    else:
+        # UTF-16 code units: characters outside the BMP (most emoji) take two
+        length = len(text.encode("utf-16-le")) // 2
+        single, multi = SINGLE_SEGMENT_UCS2, MULTI_SEGMENT_UCS2
+    if length <= single:
+        return 1
+    return -(-length // multi)
+
+
+def to_gsm7(text: str) -> str:
+    """
+    Fold text into the GSM-7 alphabet.
+
+    Typographic punctuation is replaced, accents outside the charset are
+    stripped, and anything else (emoji, other scripts) is dropped.
+    """
+    out = []
+    for ch in text:
+        if ch in _BASIC or ch in _EXTENDED:
+            out.append(ch)
+            continue
+        if ch in _SUBSTITUTES:
+            out.append(_SUBSTITUTES[ch])
+            continue
+        for base in unicodedata.normalize("NFKD", ch):
+            if base in _BASIC or base in _EXTENDED:
+                out.append(base)
+
+    lines = [_SPACES.sub(" ", line).strip() for line in "".join(out).split("\n")]
+    return "\n".join(line for line in lines if line)
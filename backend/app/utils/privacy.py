@@ -1,6 +1,9 @@
 """Privacy utilities for phone number hashing and consent management."""
+import base64
 import hashlib
 import os
+from functools import lru_cache
+from typing import Optional
 from sqlalchemy.orm import Session
 from app.models import TeacherQuery
 from app.config import settings
@@ -25,6 +28,38 @@ def hash_phone_number(phone: str) -> str:
     return hash_obj.hexdigest()
 
 
+@lru_cache(maxsize=1)
+def _fernet():
+    """Fernet cipher keyed from SECRET_KEY (cryptography is imported on first use)."""
+    from cryptography.fernet import Fernet
+
+    key = hashlib.sha256(("edupulse-seal:" + settings.SECRET_KEY).encode("utf-8")).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def seal(text: str) -> str:
+    """
+    Encrypt text that must not be stored in the clear (e.g. a reply address).
+    
+    Args:
+        text: Plain text
+    
+    Returns:
+        Authenticated ciphertext token
+    """
+    return _fernet().encrypt(text.encode("utf-8")).decode("ascii")
+
+
+def unseal(token: str) -> Optional[str]:
+    """Decrypt a token from seal(); None if it was sealed under another key or altered."""
+    from cryptography.fernet import InvalidToken
+
+    try:
+        return _fernet().decrypt(token.encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        return None
+
+
 def check_consent_required(phone_hash: str, db: Session) -> bool:
     """
     Check if consent is required for a phone hash.
@@ -0,0 +1,241 @@
+"""Cache-friendly file responses with Range, strong ETags and precompressed variants."""
+import os
+import re
+import stat
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import partial
+from typing import Iterator, Optional, Tuple
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+CHUNK_SIZE = 64 * 1024
+
+# Files whose name embeds a content hash (e.g. "intro.3f2a9c1d0b7e4f66.mp4")
+# never change under the same URL and can be cached forever.
+CONTENT_ADDRESSED = re.compile(r"\.[0-9a-f]{16,64}\.[^/]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_hash_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_hash_cache_lock = threading.Lock()
+_HASH_CACHE_SIZE = 1024
+
+
+def content_hash(path: str, stat_result: os.stat_result) -> str:
+    """
+    SHA-256 of a file, memoized by (path, size, mtime).
+
+    Args:
+        path: File path
+        stat_result: os.stat() of the file
+
+    Returns:
+        First 32 hex characters of the digest
+    """
+    key = (path, stat_result.st_size, stat_result.st_mtime_ns)
+    with _hash_cache_lock:
+        if key in _hash_cache:
+            _hash_cache.move_to_end(key)
+            return _hash_cache[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()[:32]
+
+    with _hash_cache_lock:
+        _hash_cache[key] = value
+        if len(_hash_cache) > _HASH_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+    return value
+
+
+def accepts_gzip(headers: Headers) -> bool:
+    """Whether Accept-Encoding allows gzip (q=0 counts as refusal)."""
+    for part in headers.get("accept-encoding", "").split(","):
+        fields = [f.strip().lower() for f in part.split(";")]
+        if fields[0] not in ("gzip", "*"):
+            continue
+        quality = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into an inclusive (start, end) pair.
+
+    Returns None for multi-range or malformed headers (the caller serves
+    the full file) and raises 416 for unsatisfiable ranges.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            # Suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    """Stream `length` bytes of a file from `start`."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(
+    request_headers: Headers,
+    path: str,
+    method: str = "GET",
+    cache_control: str = "no-cache",
+    media_type: Optional[str] = None,
+    content_addressed: Optional[bool] = None
+) -> Response:
+    """
+    Build a response for a file on disk.
+
+    - Strong ETag from the content hash; If-None-Match answers 304
+    - Single byte ranges answered with 206 (If-Range honoured) so
+      interrupted downloads can resume
+    - A sibling "<file>.gz" is served instead when the client accepts gzip
+    - Content-addressed file names get an immutable Cache-Control
+
+    Args:
+        request_headers: Incoming request headers
+        path: File to serve
+        method: GET or HEAD
+        cache_control: Cache-Control for names that are not content-addressed
+        media_type: Override the type guessed from the file name
+        content_addressed: Whether the URL changes with the content
+            (default: inferred from the file name)
+
+    Returns:
+        Starlette response
+    """
+    guessed_type, encoding = mimetypes.guess_type(path)
+    if media_type is None:
+        media_type = guessed_type or "application/octet-stream"
+
+    served_path = path
+    headers = {"Accept-Ranges": "bytes", "Vary": "Accept-Encoding"}
+    gzip_ok = accepts_gzip(request_headers)
+
+    gz_path = path + ".gz"
+    if encoding == "gzip":
+        # Stored compressed (e.g. compact modules): decode only if the client can
+        if gzip_ok:
+            headers["Content-Encoding"] = "gzip"
+        else:
+            media_type = "application/gzip"
+    elif gzip_ok and os.path.isfile(gz_path):
+        if os.path.getmtime(gz_path) >= os.path.getmtime(path):
+            served_path = gz_path
+            headers["Content-Encoding"] = "gzip"
+
+    stat_result = os.stat(served_path)
+    size = stat_result.st_size
+    etag = f'"{content_hash(served_path, stat_result)}"'
+
+    headers["ETag"] = etag
+    headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+    if content_addressed is None:
+        content_addressed = bool(CONTENT_ADDRESSED.search(os.path.basename(path)))
+    headers["Cache-Control"] = IMMUTABLE if content_addressed else cache_control
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if "*" in tags or etag in tags or f"W/{etag}" in tags:
+            return Response(status_code=304, headers=headers)
+
+    start, end = 0, size - 1
+    status_code = 200
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and size > 0 and (if_range is None or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1 if size > 0 else 0
+    headers["Content-Length"] = str(length)
+
+    if method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    return StreamingResponse(
+        _iter_file(served_path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type
+    )
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles serving through file_response (Range, ETag, .gz variants)."""
+
+    def __init__(self, *args, cache_control: str = "no-cache", **kwargs):
+        """Initialize with the Cache-Control for non content-addressed files."""
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """Resolve the path inside the directory and serve it."""
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404)
+
+        return await anyio.to_thread.run_sync(
+            partial(
+                file_response,
+                Headers(scope=scope),
+                full_path,
+                scope["method"],
+                self.cache_control
+            )
+        )
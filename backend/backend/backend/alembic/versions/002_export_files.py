@@ -0,0 +1,38 @@
+"""Export file index
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create export file index table."""
+    op.create_table(
+        'export_files',
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('owner_type', sa.String(20), nullable=False),
+        sa.Column('owner_id', sa.String(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=True),
+        sa.Column('resident', sa.Boolean(), nullable=True),
+        sa.Column('last_accessed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('filename')
+    )
+    op.create_index('ix_export_files_owner_id', 'export_files', ['owner_id'])
+    op.create_index('ix_export_files_last_accessed_at', 'export_files', ['last_accessed_at'])
+
+
+def downgrade() -> None:
+    """Drop export file index table."""
+    op.drop_index('ix_export_files_last_accessed_at', 'export_files')
+    op.drop_index('ix_export_files_owner_id', 'export_files')
+    op.drop_table('export_files')
@@ -0,0 +1,32 @@
+"""Idempotency records
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create idempotency records table."""
+    op.create_table(
+        'idempotency_records',
+        sa.Column('key', sa.String(100), nullable=False),
+        sa.Column('response_body', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_idempotency_records_created_at', 'idempotency_records', ['created_at'])
+
+
+def downgrade() -> None:
+    """Drop idempotency records table."""
+    op.drop_index('ix_idempotency_records_created_at', 'idempotency_records')
+    op.drop_table('idempotency_records')
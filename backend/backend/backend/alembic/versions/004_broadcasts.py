@@ -0,0 +1,61 @@
+"""Broadcasts
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create broadcast tables and the recipient selection index."""
+    op.create_table(
+        'broadcasts',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('cluster_id', sa.String(), nullable=False),
+        sa.Column('topic_tag', sa.String(100), nullable=False),
+        sa.Column('module_id', sa.String(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['cluster_id'], ['clusters.id']),
+        sa.ForeignKeyConstraint(['module_id'], ['micro_modules.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_broadcasts_status', 'broadcasts', ['status'])
+    
+    op.create_table(
+        'broadcast_recipients',
+        sa.Column('broadcast_id', sa.String(), nullable=False),
+        sa.Column('phone_hash', sa.String(64), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('provider_id', sa.String(100), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['broadcast_id'], ['broadcasts.id']),
+        sa.PrimaryKeyConstraint('broadcast_id', 'phone_hash')
+    )
+    op.create_index('ix_broadcast_recipients_status', 'broadcast_recipients', ['broadcast_id', 'status'])
+    
+    op.create_index(
+        'ix_teacher_queries_broadcast',
+        'teacher_queries',
+        ['cluster_id', 'topic_tag', 'consent_given', 'phone_hash']
+    )
+
+
+def downgrade() -> None:
+    """Drop broadcast tables and the recipient selection index."""
+    op.drop_index('ix_teacher_queries_broadcast', 'teacher_queries')
+    op.drop_index('ix_broadcast_recipients_status', 'broadcast_recipients')
+    op.drop_table('broadcast_recipients')
+    op.drop_index('ix_broadcasts_status', 'broadcasts')
+    op.drop_table('broadcasts')
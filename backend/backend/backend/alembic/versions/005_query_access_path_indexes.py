@@ -0,0 +1,48 @@
+"""Composite and partial indexes on teacher_queries
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create indexes matching the dashboard and CRP access paths."""
+    op.create_index(
+        'ix_teacher_queries_cluster_topic_created',
+        'teacher_queries',
+        ['cluster_id', 'topic_tag', 'created_at']
+    )
+    op.create_index(
+        'ix_teacher_queries_topic_created',
+        'teacher_queries',
+        ['topic_tag', 'created_at']
+    )
+    op.create_index(
+        'ix_teacher_queries_crp_open',
+        'teacher_queries',
+        ['created_at', 'cluster_id'],
+        sqlite_where=sa.text('flagged_for_crp = 1 AND resolved = 0'),
+        postgresql_where=sa.text('flagged_for_crp AND NOT resolved')
+    )
+    
+    # Prefixes of the composite indexes
+    op.drop_index('ix_teacher_queries_cluster_id', 'teacher_queries')
+    op.drop_index('ix_teacher_queries_topic_tag', 'teacher_queries')
+
+
+def downgrade() -> None:
+    """Restore the single-column indexes."""
+    op.create_index('ix_teacher_queries_topic_tag', 'teacher_queries', ['topic_tag'])
+    op.create_index('ix_teacher_queries_cluster_id', 'teacher_queries', ['cluster_id'])
+    op.drop_index('ix_teacher_queries_crp_open', 'teacher_queries')
+    op.drop_index('ix_teacher_queries_topic_created', 'teacher_queries')
+    op.drop_index('ix_teacher_queries_cluster_topic_created', 'teacher_queries')
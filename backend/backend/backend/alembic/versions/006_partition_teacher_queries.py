@@ -0,0 +1,126 @@
+"""Monthly range partitions for teacher_queries (PostgreSQL)
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+"""
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+LEGACY = 'teacher_queries_unpartitioned'
+MONTHS_AHEAD = 3
+
+# (name, columns, postgresql_where) as left by revisions 001-005
+INDEXES = [
+    ('ix_teacher_queries_phone_hash', ['phone_hash'], None),
+    ('ix_teacher_queries_created_at', ['created_at'], None),
+    ('ix_teacher_queries_broadcast', ['cluster_id', 'topic_tag', 'consent_given', 'phone_hash'], None),
+    ('ix_teacher_queries_cluster_topic_created', ['cluster_id', 'topic_tag', 'created_at'], None),
+    ('ix_teacher_queries_topic_created', ['topic_tag', 'created_at'], None),
+    ('ix_teacher_queries_crp_open', ['created_at', 'cluster_id'], 'flagged_for_crp AND NOT resolved'),
+]
+
+
+def _add_months(value: date, months: int) -> date:
+    """First day of the month `months` after the month of `value`."""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _move_indexes(source: str, target: str) -> None:
+    """Drop the named indexes from `source` and create them on `target`."""
+    for name, columns, where in INDEXES:
+        op.drop_index(name, source)
+    for name, columns, where in INDEXES:
+        op.create_index(
+            name, target, columns,
+            postgresql_where=sa.text(where) if where else None
+        )
+
+
+def upgrade() -> None:
+    """
+    Rebuild teacher_queries as a table partitioned by month of created_at.
+
+    Postgres requires the partition key in the primary key, so the key
+    becomes (id, created_at); ids stay unique because they are UUIDs.
+    Partitions cover the existing data through MONTHS_AHEAD months from
+    now, with a default partition as a safety net; the maintenance job
+    (app.services.partitions) keeps creating months ahead. SQLite keeps
+    the single table.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("UPDATE teacher_queries SET created_at = now() WHERE created_at IS NULL")
+    op.rename_table('teacher_queries', LEGACY)
+    op.execute(f"ALTER TABLE {LEGACY} RENAME CONSTRAINT teacher_queries_pkey TO {LEGACY}_pkey")
+
+    op.execute(
+        f"CREATE TABLE teacher_queries (LIKE {LEGACY} INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.alter_column('teacher_queries', 'created_at', nullable=False)
+    op.create_primary_key('teacher_queries_pkey', 'teacher_queries', ['id', 'created_at'])
+    op.create_foreign_key(
+        'teacher_queries_cluster_id_fkey', 'teacher_queries', 'clusters', ['cluster_id'], ['id']
+    )
+    _move_indexes(LEGACY, 'teacher_queries')
+
+    oldest = bind.execute(sa.text(f"SELECT min(created_at) FROM {LEGACY}")).scalar()
+    month = date.today().replace(day=1)
+    if oldest is not None:
+        month = min(month, oldest.date().replace(day=1))
+    last = _add_months(date.today().replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE teacher_queries_y{month.year:04d}m{month.month:02d} "
+            f"PARTITION OF teacher_queries FOR VALUES FROM ('{month}') TO ('{upper}')"
+        )
+        month = upper
+    op.execute("CREATE TABLE teacher_queries_default PARTITION OF teacher_queries DEFAULT")
+
+    op.execute(f"INSERT INTO teacher_queries SELECT * FROM {LEGACY}")
+    op.drop_table(LEGACY)
+
+
+def downgrade() -> None:
+    """Copy rows back into a single unpartitioned table."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.create_table(
+        LEGACY,
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('phone_hash', sa.String(64), nullable=True),
+        sa.Column('cluster_id', sa.String(), nullable=False),
+        sa.Column('topic_tag', sa.String(100), nullable=False),
+        sa.Column('narrative_text', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('resolved', sa.Boolean(), nullable=True),
+        sa.Column('flagged_for_crp', sa.Boolean(), nullable=True),
+        sa.Column('consent_given', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['cluster_id'], ['clusters.id']),
+        sa.PrimaryKeyConstraint('id', name=f'{LEGACY}_pkey')
+    )
+    op.execute(
+        f"INSERT INTO {LEGACY} (id, phone_hash, cluster_id, topic_tag, narrative_text, "
+        "created_at, resolved, flagged_for_crp, consent_given) "
+        "SELECT id, phone_hash, cluster_id, topic_tag, narrative_text, "
+        "created_at, resolved, flagged_for_crp, consent_given FROM teacher_queries"
+    )
+    _move_indexes('teacher_queries', LEGACY)
+    # Drops every partition with it
+    op.drop_table('teacher_queries')
+    op.rename_table(LEGACY, 'teacher_queries')
+    op.execute(f"ALTER TABLE teacher_queries RENAME CONSTRAINT {LEGACY}_pkey TO teacher_queries_pkey")
@@ -0,0 +1,59 @@
+"""Full-text search index over teacher narratives
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+# revision identifiers
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE teacher_queries_fts USING fts5("
+    "narrative_text, content='teacher_queries', content_rowid='rowid', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER teacher_queries_fts_ai AFTER INSERT ON teacher_queries BEGIN "
+    "INSERT INTO teacher_queries_fts(rowid, narrative_text) VALUES (new.rowid, new.narrative_text); END",
+    "CREATE TRIGGER teacher_queries_fts_ad AFTER DELETE ON teacher_queries BEGIN "
+    "INSERT INTO teacher_queries_fts(teacher_queries_fts, rowid, narrative_text) "
+    "VALUES ('delete', old.rowid, old.narrative_text); END",
+    "CREATE TRIGGER teacher_queries_fts_au AFTER UPDATE OF narrative_text ON teacher_queries BEGIN "
+    "INSERT INTO teacher_queries_fts(teacher_queries_fts, rowid, narrative_text) "
+    "VALUES ('delete', old.rowid, old.narrative_text); "
+    "INSERT INTO teacher_queries_fts(rowid, narrative_text) VALUES (new.rowid, new.narrative_text); END",
+    # Index the rows that already exist
+    "INSERT INTO teacher_queries_fts(teacher_queries_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    """FTS5 table + sync triggers on SQLite; generated tsvector + GIN on Postgres."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE teacher_queries ADD COLUMN narrative_tsv tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', coalesce(narrative_text, ''))) STORED"
+        )
+        op.execute(
+            "CREATE INDEX ix_teacher_queries_narrative_tsv ON teacher_queries USING gin (narrative_tsv)"
+        )
+
+
+def downgrade() -> None:
+    """Drop the search index."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('teacher_queries_fts_au', 'teacher_queries_fts_ad', 'teacher_queries_fts_ai'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS teacher_queries_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_teacher_queries_narrative_tsv")
+        op.execute("ALTER TABLE teacher_queries DROP COLUMN IF EXISTS narrative_tsv")
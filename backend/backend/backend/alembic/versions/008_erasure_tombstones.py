@@ -0,0 +1,37 @@
+"""Right-to-erasure tombstones
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create erasure tombstones table."""
+    op.create_table(
+        'erasure_tombstones',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('phone_hash', sa.String(64), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('rows_deleted', sa.Integer(), nullable=False),
+        sa.Column('requested_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_erasure_tombstones_phone_hash', 'erasure_tombstones', ['phone_hash'])
+    op.create_index('ix_erasure_tombstones_status', 'erasure_tombstones', ['status'])
+
+
+def downgrade() -> None:
+    """Drop erasure tombstones table."""
+    op.drop_index('ix_erasure_tombstones_status', 'erasure_tombstones')
+    op.drop_index('ix_erasure_tombstones_phone_hash', 'erasure_tombstones')
+    op.drop_table('erasure_tombstones')
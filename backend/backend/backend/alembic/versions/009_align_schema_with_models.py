@@ -0,0 +1,37 @@
+"""Align the migrated schema with the models
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Unique cluster-name index and the micro_modules -> clusters foreign key (both create_all had)."""
+    inspector = sa.inspect(op.get_bind())
+    index = next((i for i in inspector.get_indexes('clusters') if i['name'] == 'ix_clusters_name'), None)
+    if index is not None and not index['unique']:
+        op.drop_index('ix_clusters_name', 'clusters')
+        op.create_index('ix_clusters_name', 'clusters', ['name'], unique=True)
+
+    foreign_keys = inspector.get_foreign_keys('micro_modules')
+    if not any(fk['referred_table'] == 'clusters' for fk in foreign_keys):
+        # SQLite cannot add a constraint in place; batch mode copies the table
+        with op.batch_alter_table('micro_modules') as batch:
+            batch.create_foreign_key('fk_micro_modules_cluster_id_clusters', 'clusters', ['cluster_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Restore the revision 001 cluster-name index and drop the foreign key."""
+    with op.batch_alter_table('micro_modules') as batch:
+        batch.drop_constraint('fk_micro_modules_cluster_id_clusters', type_='foreignkey')
+    op.drop_index('ix_clusters_name', 'clusters')
+    op.create_index('ix_clusters_name', 'clusters', ['name'])
@@ -0,0 +1,25 @@
+"""Sealed reply address on broadcast recipients
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Add the encrypted address a recipient is sent to, so a restart does not lose it."""
+    op.add_column('broadcast_recipients', sa.Column('address', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Drop the recipient address."""
+    with op.batch_alter_table('broadcast_recipients') as batch:
+        batch.drop_column('address')
@@ -0,0 +1,53 @@
+"""
+Production launch: preforked uvicorn workers behind gunicorn.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once in the master (preload_app) and the workers
+are forked from it, sharing the imported code copy-on-write. Each
+worker keeps its own in-memory caches; the invalidation bus keeps
+them consistent and the leader lock gives maintenance jobs to one
+worker (see app/services/invalidation.py and scheduler.py).
+"""
+import multiprocessing
+import os
+import shutil
+
+# Read by app.config, so set before the app is preloaded below
+os.environ.setdefault("INVALIDATION_PATH", "invalidation.sqlite")
+os.environ.setdefault("LEADER_LOCK_PATH", "scheduler.lock")
+# Sessions must be visible to whichever worker gets a teacher's next message.
+# Every message is then written to the spill file, which is why the reply
+# address and pre-consent text are encrypted there (see session_store.py).
+os.environ.setdefault("SESSION_SPILL_PATH", "sessions.sqlite")
+os.environ.setdefault("SESSION_WRITE_THROUGH", "true")
+# /metrics on any worker reports every worker
+os.environ.setdefault("METRICS_DIR", "metrics")
+# Refuse to start with "auto" transports but no Twilio credentials
+os.environ.setdefault("DEBUG", "false")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = os.environ.get("ACCESS_LOG")  # e.g. "-" for stdout
+
+
+def on_starting(server):
+    """Migrate once in the master and clear the last run's metric snapshots."""
+    from app.database import engine, init_db
+
+    init_db()
+    engine.dispose()
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    """Drop pooled connections inherited from the master without closing them."""
+    from app.database import engine, read_engine
+
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
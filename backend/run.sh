@@ -22,15 +22,24 @@ mkdir -p exports
 mkdir -p media
 mkdir -p templates/samples
 
+# Prebuild sample decks (only topics whose template changed are rendered)
+python scripts/prebuild_sample_modules.py
+
 # Load environment variables from .env if it exists
 if [ -f ".env" ]; then
     echo "Loading .env file..."
     export $(cat .env | grep -v '^#' | xargs)
 fi
 
-# Start uvicorn
 echo ""
 echo "Backend will be available at: http://127.0.0.1:8000"
 echo "API docs available at: http://127.0.0.1:8000/docs"
 echo ""
+
+# ./run.sh prod: preforked workers (WEB_CONCURRENCY, default one per CPU)
+if [ "$1" = "prod" ]; then
+    exec gunicorn -c gunicorn.conf.py app.main:app
+fi
+
+# Start uvicorn
 python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
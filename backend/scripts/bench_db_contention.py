@@ -0,0 +1,141 @@
+"""Benchmark concurrent teacher inserts against dashboard aggregates on SQLite.
+
+Compares a plain engine (rollback journal, one engine for everything) with
+the tuned profile from app.database (WAL + pragmas, separate read-only
+engine for analytics).
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_engine_for
+from app.models import Cluster, TeacherQuery
+from app.services.aggregator import AggregationService
+
+TOPICS = ["subtraction-borrowing", "fractions-conceptual", "reading-fluency", "absenteeism"]
+
+
+def seed(session_factory, rows: int):
+    """Create clusters and a base of historical queries."""
+    db = session_factory()
+    clusters = [Cluster(name=f"Bench Cluster {i}", region="Bench") for i in range(20)]
+    db.add_all(clusters)
+    db.flush()
+    db.add_all(
+        TeacherQuery(
+            phone_hash=f"{i:064x}",
+            cluster_id=clusters[i % 20].id,
+            topic_tag=TOPICS[i % len(TOPICS)],
+            narrative_text="Benchmark query",
+            consent_given=True
+        )
+        for i in range(rows)
+    )
+    db.commit()
+    cluster_ids = [c.id for c in clusters]
+    db.close()
+    return cluster_ids
+
+
+def run(label: str, write_factory, read_factory, cluster_ids, writers: int, readers: int, seconds: float):
+    """Insert and aggregate concurrently for a fixed time; print throughput."""
+    stop = time.monotonic() + seconds
+    inserts, aggregates, errors = [0], [0], [0]
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(n):
+        db = write_factory()
+        i = 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                db.add(TeacherQuery(
+                    phone_hash=f"w{n}-{i}",
+                    cluster_id=cluster_ids[i % len(cluster_ids)],
+                    topic_tag=TOPICS[i % len(TOPICS)],
+                    narrative_text="Benchmark insert",
+                    consent_given=True
+                ))
+                db.commit()
+                with lock:
+                    inserts[0] += 1
+                    latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                db.rollback()
+                with lock:
+                    errors[0] += 1
+            i += 1
+        db.close()
+
+    def reader():
+        db = read_factory()
+        while time.monotonic() < stop:
+            try:
+                AggregationService.get_aggregated_stats(db, topic=TOPICS[0])
+                with lock:
+                    aggregates[0] += 1
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+            db.rollback()
+        db.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float("nan")
+    print(
+        f"{label:8s} inserts/s {inserts[0] / seconds:8.1f}   aggregates/s {aggregates[0] / seconds:6.1f}"
+        f"   insert p95 {p95:7.1f} ms   lock errors {errors[0]}"
+    )
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite insert/aggregate contention benchmark")
+    parser.add_argument("--rows", type=int, default=50000, help="Seed rows")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'plain.db')}"
+        plain = create_engine(url, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(plain)
+        factory = sessionmaker(bind=plain)
+        cluster_ids = seed(factory, args.rows)
+        run("plain", factory, factory, cluster_ids, args.writers, args.readers, args.seconds)
+        plain.dispose()
+
+        url = f"sqlite:///{os.path.join(tmp, 'tuned.db')}"
+        write_engine = create_engine_for(url)
+        read_engine = create_engine_for(url, read_only=True)
+        Base.metadata.create_all(write_engine)
+        write_factory = sessionmaker(bind=write_engine)
+        cluster_ids = seed(write_factory, args.rows)
+        run("tuned", write_factory, sessionmaker(bind=read_engine), cluster_ids,
+            args.writers, args.readers, args.seconds)
+        write_engine.dispose()
+        read_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark the cost of metrics collection on the teacher query path.
+
+Runs POST /api/teacher/query in-process (through the full ASGI stack)
+with METRICS_ENABLED on and off, in separate interpreters since the
+instrumentation is applied at import. The two modes alternate over
+several rounds; each round reports its median request time (robust to
+GC pauses and WAL checkpoints) and the medians of the rounds are
+compared against the 2% budget. Also prints the raw cost of the
+recording calls made per request, which is the part the mode switch
+actually adds.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+TOPICS = ["borrowing in subtraction", "fractions", "reading fluency", "absent students"]
+BUDGET = 0.02
+
+
+def child(requests: int):
+    """Time `requests` teacher queries in this interpreter; print the median in microseconds."""
+    from fastapi.testclient import TestClient
+    from app.database import init_db
+    from app.main import app
+
+    init_db()
+    client = TestClient(app)
+
+    def post(i: int):
+        response = client.post("/api/teacher/query", json={
+            "phone": f"+9191{os.getpid() % 10000:04d}{i:05d}",
+            "cluster": f"Bench Cluster {i % 8}",
+            "topic": "",
+            "text": f"Query {i}: my class struggles with {TOPICS[i % len(TOPICS)]}"
+        })
+        assert response.status_code == 200, response.text
+
+    for i in range(200):  # Warm up: clusters, pools, caches
+        post(i)
+    durations = []
+    for i in range(200, 200 + requests):
+        start = time.perf_counter()
+        post(i)
+        durations.append(time.perf_counter() - start)
+    print(json.dumps({"us": statistics.median(durations) * 1e6}))
+
+
+def run_round(enabled: bool, requests: int) -> float:
+    """One child run on a fresh database; median microseconds per request."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            METRICS_ENABLED=str(enabled).lower(),
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            EXPORTS_PATH=os.path.join(tmp, "exports"),
+            MEDIA_PATH=os.path.join(tmp, "media"),
+            ADMISSION_GLOBAL_RATE="100000",
+            ADMISSION_GLOBAL_BURST="100000",
+        )
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", "--requests", str(requests)],
+            env=env, cwd=str(Path(__file__).parent.parent), capture_output=True, text=True, check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])["us"]
+
+
+def recording_cost(calls: int = 200000) -> float:
+    """Microseconds for the recording done per teacher query (route + two template timers)."""
+    from app.services.metrics import MetricsRegistry
+
+    registry = MetricsRegistry(directory=None)
+    latency = registry.histogram("latency", "", ("method", "route"))
+    in_flight = registry.gauge("in_flight", "", ("method", "route"))
+    responses = registry.counter("responses", "", ("method", "route", "status"))
+    template = registry.histogram("template", "", ("operation",))
+    labels = ("POST", "/api/teacher/query")
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        in_flight.inc(labels)
+        t0 = time.perf_counter()
+        template.observe(time.perf_counter() - t0, ("detect_topic",))
+        template.observe(time.perf_counter() - t0, ("generate_response",))
+        latency.observe(time.perf_counter() - t0, labels)
+        in_flight.inc(labels, -1)
+        responses.inc(labels + ("200",))
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Metrics overhead benchmark")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=1000, help="Timed requests per round")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.requests)
+        return
+
+    timings = {True: [], False: []}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            timings[enabled].append(run_round(enabled, args.requests))
+    off, on = statistics.median(timings[False]), statistics.median(timings[True])
+    overhead = (on - off) / off
+    print(f"metrics off  {off:8.1f} us/request   (rounds: {', '.join(f'{t:.0f}' for t in timings[False])})")
+    print(f"metrics on   {on:8.1f} us/request   (rounds: {', '.join(f'{t:.0f}' for t in timings[True])})")
+    print(f"overhead     {overhead * 100:+7.2f} %   (budget {BUDGET * 100:.0f} %)")
+    cost = recording_cost()
+    print(f"recording    {cost:8.2f} us/request   ({cost / off * 100:.2f} % of a request)")
+
+
+if __name__ == "__main__":
+    main()
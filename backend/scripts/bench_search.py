@@ -0,0 +1,120 @@
+"""Benchmark narrative search: LIKE scan vs the FTS5 index on SQLite.
+
+Seeds a temporary database with synthetic teacher narratives (the
+default is 5M rows; the triggers index them as they are inserted). It
+times the LIKE scan a ranked search would need (every match) against
+the first page, ten pages and a cluster-filtered page of the FTS search.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_engine_for
+from app.models import Cluster, TeacherQuery, generate_uuid
+from app.services.search import search_service
+
+TOPICS = ["subtraction-borrowing", "fractions-conceptual", "reading-fluency", "absenteeism", "place-value"]
+WORDS = (
+    "students children class teacher grade number numbers digit digits carry borrow subtract add "
+    "fraction half quarter read reading letters words sentences slow fast attendance harvest "
+    "season home work homework chart charts blocks sticks zero tens ones hundreds confused "
+    "mistake mistakes practice group activity worksheet board story book mother tongue"
+).split()
+PHRASES = ["place value", "mother tongue", "harvest season", "number line"]
+
+
+def narrative(rng: random.Random) -> str:
+    """A random 12-30 word narrative; about 1 in 20 mentions a benchmark phrase."""
+    words = rng.choices(WORDS, k=rng.randint(12, 30))
+    if rng.random() < 0.05:
+        words.insert(rng.randrange(len(words)), rng.choice(PHRASES))
+    return " ".join(words)
+
+
+def seed(session_factory, rows: int, batch: int = 50000):
+    """Insert clusters and `rows` narratives in batches."""
+    rng = random.Random(42)
+    db = session_factory()
+    clusters = [Cluster(name=f"Bench Cluster {i}", region="Bench") for i in range(50)]
+    db.add_all(clusters)
+    db.commit()
+    cluster_ids = [c.id for c in clusters]
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        db.execute(insert(TeacherQuery), [
+            {
+                "id": generate_uuid(),
+                "phone_hash": f"{rng.getrandbits(64):064x}",
+                "cluster_id": rng.choice(cluster_ids),
+                "topic_tag": rng.choice(TOPICS),
+                "narrative_text": narrative(rng),
+                "consent_given": True
+            }
+            for _ in range(min(batch, rows - offset))
+        ])
+        db.commit()
+    print(f"seeded {rows} rows in {time.perf_counter() - start:.1f}s")
+    db.close()
+
+
+def timed(func, repeat: int) -> float:
+    """Median wall time of `func` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Narrative search benchmark")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Seed rows")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=10, help="Depth of the deep-page measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine_for(f"sqlite:///{os.path.join(tmp, 'search.db')}")
+        Base.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        seed(session_factory, args.rows)
+
+        db = session_factory()
+
+        def like_scan():
+            db.execute(text(
+                "SELECT id, narrative_text FROM teacher_queries WHERE narrative_text LIKE '%place value%'"
+            )).all()
+
+        def first_page(cluster=None):
+            return search_service.search(db, '"place value"', cluster=cluster)
+
+        def deep_page(cluster=None):
+            cursor = None
+            for _ in range(args.pages):
+                cursor = search_service.search(db, '"place value"', cluster=cluster, cursor=cursor)["next_cursor"]
+
+        print(f"LIKE, all matches         {timed(like_scan, args.repeat):9.1f} ms")
+        print(f"FTS page 1                {timed(first_page, args.repeat):9.1f} ms")
+        print(f"FTS pages 1-{args.pages:<3d}          {timed(deep_page, args.repeat):9.1f} ms")
+        print(f"FTS page 1, cluster       {timed(lambda: first_page('Bench Cluster 7'), args.repeat):9.1f} ms")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark similar-query retrieval at scale.
+
+Builds the hashed TF-IDF index over synthetic narratives (default 1M,
+drawn from a Zipf-distributed vocabulary), saves it, memory-maps it
+back, and reports top-10 query latency for the in-memory and the
+memory-mapped index, then again with a delta of fresh queries.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.similarity import SimilarityIndex
+
+BASE_WORDS = (
+    "students children class teacher grade number numbers digit digits carry borrow subtract add "
+    "fraction half quarter read reading letters words sentences slow fast attendance harvest "
+    "season home work homework chart charts blocks sticks zero tens ones hundreds confused "
+    "mistake mistakes practice group activity worksheet board story book mother tongue place "
+    "value table tables multiply divide remainder parents meeting notebook exam test marks"
+).split()
+
+
+def vocabulary(size: int):
+    """The base words plus synthetic ones, with Zipf-like weights."""
+    words = BASE_WORDS + [f"w{i}" for i in range(max(0, size - len(BASE_WORDS)))]
+    return words, [1.0 / (rank + 1) for rank in range(len(words))]
+
+
+def narrative(rng: random.Random, words, weights) -> str:
+    """A random 12-30 word narrative."""
+    return " ".join(rng.choices(words, weights, k=rng.randint(12, 30)))
+
+
+def latency(index: SimilarityIndex, texts, k: int = 10):
+    """p50 and p95 of similar() in milliseconds."""
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        index.similar(text, k)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Similar-query index benchmark")
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--delta", type=int, default=5000, help="Queries added after the build")
+    parser.add_argument("--vocab", type=int, default=5000, help="Vocabulary size (Zipf-distributed)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    words, weights = vocabulary(args.vocab)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SimilarityIndex(path=tmp)
+        start = time.perf_counter()
+        segment = index.build((f"{i:036d}", narrative(rng, words, weights)) for i in range(args.docs))
+        print(f"build {args.docs} docs        {time.perf_counter() - start:8.1f} s "
+              f"({len(segment.postings_doc)} postings)")
+
+        start = time.perf_counter()
+        index.save(segment)
+        print(f"save                     {time.perf_counter() - start:8.1f} s")
+
+        mapped = SimilarityIndex(path=tmp)
+        start = time.perf_counter()
+        mapped.load()
+        print(f"mmap load                {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        index._segment = segment
+        index._loaded = True
+        texts = [narrative(rng, words, weights) for _ in range(args.queries)]
+        print("in-memory   p50 %7.1f ms  p95 %7.1f ms" % latency(index, texts))
+        print("memory-map  p50 %7.1f ms  p95 %7.1f ms" % latency(mapped, texts))
+
+        for i in range(args.delta):
+            mapped.add(f"delta-{i:030d}", narrative(rng, words, weights))
+        print("with delta  p50 %7.1f ms  p95 %7.1f ms" % latency(mapped, texts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark concurrent large downloads from the media mount.
+
+Serves a random file through CachedStaticFiles in-process (the full
+ASGI stack, no network) and downloads it from several threads at once.
+Prints the aggregate throughput and checks that every body arrived
+complete.
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.static_files import CachedStaticFiles
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Static file download throughput benchmark")
+    parser.add_argument("--size-mb", type=int, default=8, help="Size of the served file")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        large = os.urandom(args.size_mb * 1024 * 1024)
+        Path(tmp, "demo.mp4").write_bytes(large)
+        app = FastAPI()
+        app.mount("/media", CachedStaticFiles(directory=tmp), name="media")
+        client = TestClient(app)
+
+        def download(_):
+            return client.get("/media/demo.mp4").content
+
+        for round_number in range(1, args.rounds + 1):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                bodies = list(pool.map(download, range(args.workers)))
+            elapsed = time.perf_counter() - start
+            complete = sum(body == large for body in bodies)
+            throughput = args.workers * args.size_mb / elapsed
+            print(
+                f"round {round_number}   {args.workers} downloads of {args.size_mb} MB"
+                f"   {throughput:8.1f} MB/s   complete {complete}/{args.workers}"
+            )
+
+
+if __name__ == "__main__":
+    main()
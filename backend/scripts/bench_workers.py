@@ -0,0 +1,144 @@
+"""Benchmark request throughput with 1, 2, 4 and 8 gunicorn workers.
+
+Starts the production launch (gunicorn.conf.py) against a throwaway
+database for each worker count, drives it with concurrent clients and
+prints requests/s with p50/p95 latency. The mix is mostly cheap reads
+(templated sample responses) with a share of teacher query inserts,
+which all go through the one SQLite writer. Scaling stops at the
+number of CPU cores, and earlier for the insert share.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent.parent
+TOPICS = ["subtraction-borrowing", "fractions-conceptual", "reading-fluency", "absenteeism"]
+
+
+def free_port() -> int:
+    """An unused local TCP port."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, workdir: str, port: int) -> subprocess.Popen:
+    """Launch gunicorn with every writable path inside `workdir`."""
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(BACKEND_DIR),
+        WEB_CONCURRENCY=str(workers),
+        BIND=f"127.0.0.1:{port}",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        INVALIDATION_PATH=os.path.join(workdir, "invalidation.sqlite"),
+        LEADER_LOCK_PATH=os.path.join(workdir, "scheduler.lock"),
+        SESSION_SPILL_PATH=os.path.join(workdir, "sessions.sqlite"),
+        EXPORTS_PATH=os.path.join(workdir, "exports"),
+        MEDIA_PATH=os.path.join(workdir, "media"),
+        # One bench client sends everything; keep admission control out of the way
+        ADMISSION_GLOBAL_RATE="100000",
+        ADMISSION_GLOBAL_BURST="100000",
+        DEDUPE_ENABLED="false",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", str(BACKEND_DIR / "gunicorn.conf.py"), "app.main:app"],
+        cwd=str(BACKEND_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_healthy(base_url: str, timeout: float = 60.0):
+    """Block until /health answers."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become healthy")
+
+
+async def drive(base_url: str, clients: int, seconds: float, write_every: int):
+    """Run `clients` request loops for a fixed time; return latencies and errors."""
+    latencies, errors = [], [0]
+    stop = time.monotonic() + seconds
+
+    async def client(n: int):
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+            i = 0
+            while time.monotonic() < stop:
+                i += 1
+                start = time.perf_counter()
+                try:
+                    if i % write_every == 0:
+                        response = await http.post("/api/teacher/query", json={
+                            "phone": f"+9190{n:04d}{i:04d}",
+                            "cluster": f"Bench Cluster {n % 8}",
+                            "topic": "",
+                            "text": f"Bench query {n}-{i}: students struggle with {TOPICS[i % len(TOPICS)]}"
+                        })
+                    else:
+                        response = await http.get(
+                            "/api/teacher/sample-response", params={"topic": TOPICS[i % len(TOPICS)]}
+                        )
+                except httpx.HTTPError:
+                    errors[0] += 1
+                    continue
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[0] += 1
+
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return latencies, errors[0]
+
+
+def run(workers: int, clients: int, seconds: float, write_every: int):
+    """Benchmark one worker count; print throughput and latency."""
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(workers, workdir, port)
+        try:
+            wait_healthy(base_url)
+            asyncio.run(drive(base_url, clients, 1.0, write_every))  # Warm up every worker
+            latencies, errors = asyncio.run(drive(base_url, clients, seconds, write_every))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else float("nan")
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float("nan")
+    print(
+        f"workers {workers}   req/s {len(latencies) / seconds:8.1f}"
+        f"   p50 {p50:7.1f} ms   p95 {p95:7.1f} ms   errors {errors}"
+    )
+
+
+def main():
+    """Main function."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Multi-worker throughput benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent connections")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--write-every", type=int, default=10, help="Every Nth request is an insert")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU cores, {args.clients} clients, 1 in {args.write_every} requests inserts")
+    for workers in args.workers:
+        run(workers, args.clients, args.seconds, args.write_every)
+
+
+if __name__ == "__main__":
+    main()
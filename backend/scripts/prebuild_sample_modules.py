@@ -0,0 +1,41 @@
+"""Prebuild sample PPTX modules for every topic in the template registry."""
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.services.sample_prebuild import SamplePrebuilder
+from app.services.template_engine import TemplateEngine
+
+
+def main():
+    """Main function."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Prebuild sample PPTX modules")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parallel render processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every topic even if its template is unchanged"
+    )
+    args = parser.parse_args()
+    
+    prebuilder = SamplePrebuilder(samples_dir=settings.SAMPLES_PATH)
+    status = prebuilder.prebuild(TemplateEngine(settings.TEMPLATES_PATH), args.workers, args.force)
+    
+    for topic, state in sorted(status.items()):
+        print(f"   {state:8s} {topic}")
+    built = sum(1 for s in status.values() if s == "built")
+    print(f"✅ {built} built, {len(status) - built} unchanged/removed → {prebuilder.manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,9 @@ if not exist "exports" mkdir exports
 if not exist "media" mkdir media
 if not exist "templates\samples" mkdir templates\samples
 
+REM Prebuild sample decks (only topics whose template changed are rendered)
+python scripts\prebuild_sample_modules.py
+
 REM Load environment variables from .env if it exists
 if exist ".env" (
     echo Loading .env file...
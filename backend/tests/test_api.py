@@ -4,8 +4,9 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, get_db, get_read_db
 from app.models import Cluster
+from app.services.dedupe import duplicate_detector
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -23,6 +24,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 client = TestClient(app)
 
 
@@ -31,6 +33,7 @@ def db_session():
     """Create a fresh database session for each test."""
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    duplicate_detector.clear()  # Indexed query ids belong to the dropped DB
     db = TestingSessionLocal()
     
     # Add default cluster
@@ -163,6 +166,40 @@ def test_get_aggregated_data(db_session):
     assert "by_cluster" in data
 
 
+def test_modules_created_in_the_same_second_get_their_own_files(db_session):
+    """Test that module filenames (the export index key) never collide."""
+    from app.models import ExportFile
+    from app.services.module_builder import module_builder
+    
+    modules = [
+        module_builder.create(db_session, "Test Cluster A", "fractions", render=False)
+        for _ in range(3)
+    ]
+    paths = {module.slides_pptx_path for module in modules}
+    assert len(paths) == 3
+    owners = db_session.query(ExportFile.owner_id).filter(ExportFile.owner_id.in_([m.id for m in modules]))
+    assert {owner for (owner,) in owners} == {m.id for m in modules}
+
+
+def test_lfa_export_filename_is_sanitized(db_session):
+    """Test that path separators and other characters never reach the filename."""
+    import re
+    
+    payload = {
+        "title": "../../Plan: Q1/2026 ?#%\\ café",
+        "problem_statement": "40% students below grade level",
+        "student_change": "80% achieve grade-level numeracy",
+        "stakeholders": ["Teachers"],
+        "practice_changes": ["Daily number talks"],
+        "indicators": ["Pre/post test scores"]
+    }
+    
+    data = client.post("/api/lfa/export", json=payload).json()
+    filename = data["export_url"].rsplit("/exports/", 1)[-1]
+    assert re.fullmatch(r"lfa_[A-Za-z0-9_-]+_\d{8}_\d{6}\.pptx", filename)
+    assert client.get(f"/exports/{filename}").status_code == 200
+
+
 def test_generate_module(db_session):
     """Test micro-module generation."""
     payload = {
@@ -396,4 +433,1252 @@ def test_aggregate_returns_counts(db_session):
     assert data["total_queries"] >= 3
     assert "by_topic" in data
     assert "by_cluster" in data
-    assert "sample_queries" in data
\ No newline at end of file
+    assert "sample_queries" in data
+
+def test_export_store_evicts_lru_and_regenerates(db_session):
+    """Test that exports over quota are evicted and re-rendered on download."""
+    import os
+    from app.models import ExportFile
+    from app.services.export_store import export_store
+    from app.services.compact_module import compact_filename
+    
+    names = []
+    for topic in ["fractions-conceptual", "multiplication-tables"]:
+        payload = {"cluster": "Test Cluster A", "topic": topic, "template": "default"}
+        response = client.post("/api/diet/generate-module", json=payload)
+        names.append(response.json()["pptx_link"].rsplit("/", 1)[-1])
+    
+    oldest, newest = names
+    original_quota = export_store.quota_bytes
+    export_store.quota_bytes = (
+        os.path.getsize(export_store.path_for(newest))
+        + os.path.getsize(export_store.path_for(compact_filename(newest)))
+    )
+    try:
+        evicted = export_store.evict_to_quota(db_session)
+        assert oldest in evicted
+        assert not os.path.exists(export_store.path_for(oldest))
+        assert os.path.exists(export_store.path_for(newest))
+        
+        # Download re-renders the evicted file and evicts the other one
+        response = client.get(f"/exports/{oldest}")
+        assert response.status_code == 200
+        assert len(response.content) > 0
+        assert os.path.exists(export_store.path_for(oldest))
+        
+        db_session.expire_all()
+        assert db_session.get(ExportFile, oldest).resident
+        assert not db_session.get(ExportFile, newest).resident
+    finally:
+        export_store.quota_bytes = original_quota
+
+
+def test_lfa_export_renders_on_first_download(db_session):
+    """Test that saving an LFA is cheap and the PPTX is rendered on download."""
+    import os
+    from app.services.export_store import export_store
+    
+    payload = {
+        "title": "Lazy Render Plan",
+        "problem_statement": "40% students below grade level",
+        "student_change": "80% achieve grade-level numeracy",
+        "stakeholders": ["Teachers"],
+        "practice_changes": ["Daily number talks"],
+        "indicators": ["Pre/post test scores"]
+    }
+    
+    data = client.post("/api/lfa/export", json=payload).json()
+    filename = data["export_url"].rsplit("/", 1)[-1]
+    path = export_store.path_for(filename)
+    assert not os.path.exists(path)
+    
+    response = client.get(f"/exports/{filename}")
+    assert response.status_code == 200
+    assert os.path.exists(path)
+    
+    # Editing drops the cached render; the link stays the same
+    payload["indicators"].append("Attendance")
+    update = client.put(f"/api/lfa/{data['lfa_id']}", json=payload)
+    assert update.status_code == 200
+    assert update.json()["export_url"] == data["export_url"]
+    assert not os.path.exists(path)
+    
+    assert client.get(f"/exports/{filename}").status_code == 200
+    assert os.path.exists(path)
+
+
+def test_pptx_render_is_never_visible_half_written(tmp_path, monkeypatch):
+    """Test that a deck appears at its final path only once completely written."""
+    import os
+    from pptx.presentation import Presentation
+    from app.services.pptx_generator import PPTXGenerator
+    
+    final = tmp_path / "Plan.pptx"
+    seen_during_save = []
+    save = Presentation.save
+    
+    def watching_save(self, file):
+        seen_during_save.append(final.exists())
+        save(self, file)
+    
+    monkeypatch.setattr(Presentation, "save", watching_save)
+    path = PPTXGenerator(str(tmp_path)).generate_lfa_export(
+        "Plan", "Problem", "Change", ["Teachers"], ["Practice"], ["Indicator"], "Plan.pptx"
+    )
+    assert seen_during_save == [False]
+    assert path == str(final) and os.path.getsize(path) > 0
+    assert os.listdir(tmp_path) == ["Plan.pptx"]
+
+
+def test_module_download_negotiates_compact_html(db_session):
+    """Test that modules are served as compact HTML to clients asking for it."""
+    import os
+    from app.services.export_store import export_store
+    from app.services.compact_module import compact_filename
+    
+    payload = {"cluster": "Test Cluster A", "topic": "reading-fluency", "template": "default"}
+    data = client.post("/api/diet/generate-module", json=payload).json()
+    assert data["compact_link"]
+    
+    url = f"/api/diet/modules/{data['module_id']}/download"
+    
+    html_response = client.get(url, headers={"Accept": "text/html"})
+    assert html_response.status_code == 200
+    assert html_response.headers["content-type"].startswith("text/html")
+    assert html_response.headers["content-encoding"] == "gzip"
+    assert data["title"] in html_response.text
+    
+    pptx_response = client.get(url, headers={"Accept": "*/*"})
+    assert pptx_response.status_code == 200
+    assert "presentationml" in pptx_response.headers["content-type"]
+    
+    # At least an order of magnitude smaller on the wire
+    pptx_name = data["pptx_link"].rsplit("/", 1)[-1]
+    pptx_size = os.path.getsize(export_store.path_for(pptx_name))
+    compact_size = os.path.getsize(export_store.path_for(compact_filename(pptx_name)))
+    assert compact_size * 10 <= pptx_size
+
+
+def test_sample_prebuild_rebuilds_only_changed_topics(tmp_path):
+    """Test that prebuilt samples are rebuilt only when their template changes."""
+    from app.services.sample_prebuild import SamplePrebuilder
+    from app.services.template_engine import TemplateEngine
+    
+    engine = TemplateEngine()
+    prebuilder = SamplePrebuilder(samples_dir=str(tmp_path))
+    
+    status = prebuilder.prebuild(engine, workers=2)
+    assert set(status.values()) == {"built"}
+    assert set(status) == set(engine.get_all_topics())
+    assert prebuilder.lookup("fractions-conceptual", engine) is not None
+    
+    engine.templates["fractions-conceptual"]["advice"] += "\n4. Use fraction strips."
+    assert prebuilder.lookup("fractions-conceptual", engine) is None
+    
+    status = prebuilder.prebuild(engine, workers=2)
+    assert status["fractions-conceptual"] == "built"
+    assert all(s == "fresh" for t, s in status.items() if t != "fractions-conceptual")
+    assert len(list(tmp_path.glob("fractions-conceptual-module.*.pptx"))) == 1
+
+
+def test_sample_module_endpoint_serves_prebuilt_deck(tmp_path):
+    """Test that the API serves a prebuilt deck for a topic."""
+    from app.api import diet
+    from app.services.sample_prebuild import SamplePrebuilder
+    from app.services.template_engine import get_template_engine
+    
+    original = diet.sample_prebuilder
+    diet.sample_prebuilder = SamplePrebuilder(samples_dir=str(tmp_path))
+    try:
+        assert client.get("/api/diet/sample-module/reading-fluency.pptx").status_code == 404
+        
+        diet.sample_prebuilder.prebuild(get_template_engine(), workers=2)
+        response = client.get("/api/diet/sample-module/reading-fluency.pptx")
+        assert response.status_code == 200
+        assert "presentationml" in response.headers["content-type"]
+        assert "immutable" not in response.headers["cache-control"]
+    finally:
+        diet.sample_prebuilder = original
+
+
+def _opt_in_whatsapp(phone):
+    """Mark a WhatsApp number as having given consent."""
+    from app.services.session_store import session_store
+    from app.utils.privacy import hash_phone_number
+    
+    session_store.update(hash_phone_number(phone), consented=True)
+
+
+def test_whatsapp_webhook_replay_is_idempotent(db_session):
+    """Test that a Twilio retry with the same MessageSid creates no duplicate."""
+    from app.models import TeacherQuery
+    from app.services.idempotency import idempotency_cache
+    
+    _opt_in_whatsapp("+919812345678")
+    form = {
+        "From": "whatsapp:+919812345678",
+        "Body": "Students confused about fractions in cluster a",
+        "MessageSid": "SM-test-replay-1"
+    }
+    
+    first = client.post("/api/webhook/whatsapp", data=form)
+    second = client.post("/api/webhook/whatsapp", data=form)
+    assert first.status_code == 200
+    assert second.text == first.text
+    assert db_session.query(TeacherQuery).count() == 1
+    
+    # Still deduplicated after the in-memory LRU is lost (e.g. restart)
+    idempotency_cache._entries.clear()
+    third = client.post("/api/webhook/whatsapp", data=form)
+    assert third.text == first.text
+    assert db_session.query(TeacherQuery).count() == 1
+    
+    # The key holds the reply text, the same format the async worker stores
+    stored = idempotency_cache.get(db_session, "whatsapp:SM-test-replay-1")
+    assert not stored.startswith("<") and "Reply 'CRP'" in stored
+    
+    form["MessageSid"] = "SM-test-replay-2"
+    form["Body"] = "How can I get parents to help with homework?"
+    client.post("/api/webhook/whatsapp", data=form)
+    assert db_session.query(TeacherQuery).count() == 2
+
+
+def test_whatsapp_retry_during_first_delivery_waits_for_its_reply(db_session):
+    """Test that a retry racing the first delivery neither stores a query nor keeps its own reply."""
+    import threading
+    from app.models import TeacherQuery
+    from app.services.idempotency import IdempotencyCache, idempotency_cache
+    
+    _opt_in_whatsapp("+919812345677")
+    key = "whatsapp:SM-test-inflight"
+    # The first delivery has claimed the key and is still answering
+    assert idempotency_cache.claim(db_session, key)
+    assert not idempotency_cache.claim(db_session, key)
+    
+    def finish_first():
+        db = TestingSessionLocal()
+        try:
+            idempotency_cache.put(db, key, "First reply")
+        finally:
+            db.close()
+    
+    timer = threading.Timer(0.3, finish_first)
+    timer.start()
+    retry = client.post("/api/webhook/whatsapp", data={
+        "From": "whatsapp:+919812345677", "Body": "How do I teach division?", "MessageSid": "SM-test-inflight"
+    })
+    timer.join()
+    assert retry.status_code == 200 and "First reply" in retry.text
+    assert db_session.query(TeacherQuery).count() == 0
+    
+    # A request that loses the race keeps the winner's reply, in the DB and in memory
+    other_worker = IdempotencyCache()
+    assert other_worker.put(db_session, "whatsapp:SM-test-race", "winner") == "winner"
+    assert idempotency_cache.put(db_session, "whatsapp:SM-test-race", "loser") == "winner"
+    assert idempotency_cache.peek("whatsapp:SM-test-race") == "winner"
+
+
+def test_reply_worker_drains_queue_on_stop():
+    """Test that stopping the reply worker delivers the replies already queued."""
+    import asyncio
+    from app.services.messaging import StubTransport
+    from app.services.reply_worker import ReplyWorker, ReplyJob
+    
+    transport = StubTransport()
+    worker = ReplyWorker(
+        handler=lambda db, sender, body: f"re: {body}", transport=transport,
+        session_factory=TestingSessionLocal, concurrency=1
+    )
+    
+    async def run():
+        for i in range(5):
+            assert worker.submit(ReplyJob(f"+91{i}", f"message {i}"))
+        await worker.stop(timeout=5)
+    
+    asyncio.run(run())
+    assert sorted(transport.sent) == [(f"+91{i}", f"re: message {i}") for i in range(5)]
+
+
+def test_whatsapp_webhook_async_reply(db_session):
+    """Test that async mode acks with empty TwiML and delivers the reply later."""
+    import time
+    from app.api import webhook
+    from app.config import settings
+    from app.models import TeacherQuery
+    from app.services.messaging import StubTransport
+    
+    transport = StubTransport(fail_times=2)
+    original = (settings.WEBHOOK_ASYNC_REPLY, webhook.reply_worker.transport,
+                webhook.reply_worker.session_factory, webhook.reply_worker.backoff_seconds)
+    settings.WEBHOOK_ASYNC_REPLY = True
+    webhook.reply_worker.transport = transport
+    webhook.reply_worker.session_factory = TestingSessionLocal
+    webhook.reply_worker.backoff_seconds = 0.01
+    _opt_in_whatsapp("+919812345679")
+    try:
+        with TestClient(app) as async_client:
+            form = {
+                "From": "whatsapp:+919812345679",
+                "Body": "How do I teach multiplication tables?",
+                "MessageSid": "SM-test-async-1"
+            }
+            ack = async_client.post("/api/webhook/whatsapp", data=form)
+            assert ack.status_code == 200
+            assert "<Message>" not in ack.text
+            
+            deadline = time.time() + 5
+            while not transport.sent and time.time() < deadline:
+                time.sleep(0.02)
+            
+            # Delivered after two failed attempts
+            assert transport.attempts == 3
+            assert transport.sent[0][0] == form["From"]
+            assert "Reply 'CRP'" in transport.sent[0][1]
+            assert db_session.query(TeacherQuery).count() == 1
+    finally:
+        (settings.WEBHOOK_ASYNC_REPLY, webhook.reply_worker.transport,
+         webhook.reply_worker.session_factory, webhook.reply_worker.backoff_seconds) = original
+
+
+def test_whatsapp_session_consent_crp_and_module(db_session):
+    """Test that the WhatsApp session drives consent, CRP and MODULE keywords."""
+    from app.models import TeacherQuery, MicroModule, Cluster
+    from app.services.cluster_matcher import cluster_matcher
+    
+    db_session.add(Cluster(name="Cluster B", region="Test Region"))
+    db_session.commit()
+    cluster_matcher.refresh(db_session)
+    sender = "whatsapp:+919800000033"
+    
+    def send(body):
+        return client.post("/api/webhook/whatsapp", data={"From": sender, "Body": body}).text
+    
+    # First contact: question is held until the teacher opts in
+    assert "consent" in send("Class is too noisy in cluster b").lower()
+    assert db_session.query(TeacherQuery).count() == 0
+    
+    # YES answers the held question
+    assert "Reply 'CRP'" in send("YES")
+    query = db_session.query(TeacherQuery).one()
+    assert query.topic_tag == "classroom-management"
+    
+    # Cluster is remembered for later messages
+    send("Students keep missing school")
+    assert db_session.query(TeacherQuery).count() == 2
+    clusters = {q.cluster.name for q in db_session.query(TeacherQuery).all()}
+    assert clusters == {"Cluster B"}
+    
+    assert "flagged" in send("CRP")
+    db_session.expire_all()
+    flagged = db_session.query(TeacherQuery).filter(TeacherQuery.flagged_for_crp == True).one()
+    assert flagged.topic_tag == "absenteeism"
+    
+    reply = send("MODULE")
+    module = db_session.query(MicroModule).one()
+    assert module.topic_tag == "absenteeism"
+    assert module.id in reply
+    
+    download = client.get(f"/api/diet/modules/{module.id}/download?format=html")
+    assert download.status_code == 200
+
+
+def test_cluster_matcher_tolerates_spelling_variants(db_session):
+    """Test cluster matching with misspellings, transliterations and incremental refresh."""
+    from app.models import Cluster
+    from app.services.cluster_matcher import ClusterMatcher
+    
+    matcher = ClusterMatcher()
+    matcher.refresh(db_session)
+    assert len(matcher) == 1
+    
+    db_session.add_all([
+        Cluster(name="Hoskote North", region="Bengaluru Rural"),
+        Cluster(name="Bagalkot Cluster", region="Bagalkot"),
+        Cluster(name="Cluster A", region="Test Region"),
+    ])
+    db_session.commit()
+    assert matcher.refresh(db_session) == 3
+    assert matcher.refresh(db_session) == 0
+    
+    assert matcher.match("noisy class in HOSAKOTE north school") == "Hoskote North"
+    assert matcher.match("hoskte nort students absent") == "Hoskote North"
+    assert matcher.match("I teach in bagalkote") == "Bagalkot Cluster"
+    assert matcher.match("Students confused in test cluster a") == "Test Cluster A"
+    assert matcher.match("our cluster a school") == "Cluster A"
+    # Short names never match inside unrelated text
+    assert matcher.match("a student has a problem") is None
+    
+    # Lookups stay safe while another thread indexes new clusters
+    import string
+    import sys
+    import threading
+    # Names one edit from "vilag": each one grows the entry match("vilag") iterates
+    names = ["vilag"[:p] + c + "vilag"[p:] for p in range(6) for c in string.ascii_lowercase + string.digits]
+    errors = []
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(100):
+            racing = ClusterMatcher()
+            writer = threading.Thread(target=lambda: [racing.add(name) for name in names])
+            writer.start()
+            while writer.is_alive():
+                try:
+                    racing.match("vilag school")
+                except RuntimeError as e:
+                    errors.append(e)
+            writer.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+
+
+def test_broadcast_sends_rate_limited_and_resumes(db_session):
+    """Test broadcast recipient selection, delivery status and resume."""
+    from app.models import Cluster, TeacherQuery, Broadcast, BroadcastRecipient
+    from app.services.broadcast import BroadcastEngine
+    from app.services.messaging import StubTransport
+    
+    cluster = db_session.query(Cluster).filter(Cluster.name == "Test Cluster A").one()
+    for i in range(5):
+        db_session.add(TeacherQuery(
+            phone_hash=f"hash-{i}", cluster_id=cluster.id, topic_tag="fractions",
+            narrative_text="Fractions question", consent_given=i != 4
+        ))
+    # Same teacher twice, other topic: neither adds a recipient
+    db_session.add(TeacherQuery(
+        phone_hash="hash-0", cluster_id=cluster.id, topic_tag="fractions",
+        narrative_text="Again", consent_given=True
+    ))
+    db_session.add(TeacherQuery(
+        phone_hash="hash-9", cluster_id=cluster.id, topic_tag="reading-fluency",
+        narrative_text="Reading question", consent_given=True
+    ))
+    db_session.commit()
+    
+    addresses = {f"hash-{i}": f"whatsapp:+9190000000{i}" for i in range(3)}
+    transport = StubTransport(fail_times=1)
+    
+    def engine(resolve_address):
+        return BroadcastEngine(
+            transport=transport, session_factory=TestingSessionLocal,
+            resolve_address=resolve_address, rate_per_second=1000, burst=10,
+            batch_size=2, backoff_seconds=0.001
+        )
+    
+    broadcast = engine(addresses.get).create(db_session, cluster.id, "fractions", "New module")
+    assert engine(addresses.get).stats(db_session, broadcast.id) == {"queued": 4}
+    stored = [r.address for r in db_session.query(BroadcastRecipient) if r.address]
+    assert len(stored) == 3 and not any("+9190" in address for address in stored)
+    
+    # A fresh engine (as after a restart) picks up the running broadcast,
+    # although the restart emptied the session store
+    resumed = engine(lambda phone_hash: None)
+    assert resumed.resume() == 1
+    resumed.start(broadcast.id).result(timeout=10)
+    
+    db_session.expire_all()
+    assert db_session.get(Broadcast, broadcast.id).status == "done"
+    assert resumed.stats(db_session, broadcast.id) == {"sent": 3, "unreachable": 1}
+    assert sorted(to for to, _ in transport.sent) == sorted(addresses.values())
+    assert transport.attempts == 4
+
+
+def test_token_bucket_limits_rate():
+    """Test that the token bucket allows a burst, then refills at the rate."""
+    from app.utils.rate_limit import TokenBucket
+    
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=3, clock=lambda: now[0])
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    now[0] += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert not bucket.acquire(timeout=0)
+
+
+def test_admission_degrades_when_saturated(db_session):
+    """Test that a saturated teacher path answers from templates and persists later."""
+    import asyncio
+    import time
+    from app.api import teacher
+    from app.models import TeacherQuery
+    from app.services.admission import AdmissionController, ADMIT, DEGRADE, REJECT
+    from app.services.write_queue import QueryWriteQueue
+    
+    controller = AdmissionController(
+        global_rate=1000, global_burst=1000, phone_rate=0.001, phone_burst=2,
+        max_concurrency=1, wait_seconds=0
+    )
+    with controller.admit("busy-phone") as first:
+        with controller.admit("other-phone") as second:
+            assert (first, second) == (ADMIT, DEGRADE)
+    with controller.admit("busy-phone") as third:
+        assert third == ADMIT
+    with controller.admit("busy-phone") as fourth:
+        assert fourth == REJECT
+    
+    # Never waits for a slot on the event loop
+    patient = AdmissionController(max_concurrency=1, wait_seconds=5)
+    
+    async def admit_on_loop():
+        with patient.admit("loop-phone") as decision:
+            return decision
+    
+    with patient.admit("holder"):
+        started = time.monotonic()
+        assert asyncio.run(admit_on_loop()) == DEGRADE
+        assert time.monotonic() - started < 1
+    
+    original = (teacher.admission_controller, teacher.query_write_queue)
+    teacher.admission_controller = AdmissionController(max_concurrency=1, wait_seconds=0)
+    teacher.query_write_queue = QueryWriteQueue(session_factory=TestingSessionLocal)
+    try:
+        # Hold the only slot so the request is degraded
+        with teacher.admission_controller.admit("someone-else"):
+            response = client.post("/api/teacher/query", json={
+                "phone": "+919800000036",
+                "cluster": "Exam Season Cluster",
+                "topic": "",
+                "text": "Students struggle with fractions before the exam",
+                "consent_given": True
+            })
+        assert response.status_code == 200
+        data = response.json()
+        assert "fraction" in data["advice"].lower()
+        
+        assert teacher.query_write_queue.join(timeout=5)
+        stored = db_session.get(TeacherQuery, data["id"])
+        assert stored.topic_tag == "fractions-conceptual"
+        assert stored.cluster.name == "Exam Season Cluster"
+    finally:
+        teacher.admission_controller, teacher.query_write_queue = original
+
+
+def test_write_queue_keeps_good_rows_of_a_failed_batch(db_session):
+    """Test that one bad row does not lose the rest of its batch."""
+    from app.models import TeacherQuery
+    from app.services.write_queue import QueryWriteQueue
+    
+    writer = QueryWriteQueue(session_factory=TestingSessionLocal)
+    rows = [
+        {"id": f"wq-{i}", "cluster": "Write Queue Cluster", "phone_hash": "h", "topic_tag": "fractions-conceptual",
+         "narrative_text": f"Deferred query {i}", "consent_given": True}
+        for i in range(3)
+    ]
+    rows[1]["narrative_text"] = None  # NOT NULL violation
+    for row in rows:  # Queued before the writer starts, so they form one batch
+        writer._queue.put_nowait(row)
+    writer._ensure_started()
+    
+    assert writer.join(timeout=5)
+    assert {q.id for q in db_session.query(TeacherQuery)} == {"wq-0", "wq-2"}
+    assert (writer.written, writer.failed) == (2, 1)
+
+
+def test_near_duplicate_queries_are_not_stored_twice(db_session):
+    """Test resend suppression, chain-message detection and dedupe stats."""
+    from app.models import TeacherQuery
+    
+    def submit(phone, text):
+        response = client.post("/api/teacher/query", json={
+            "phone": phone, "cluster": "Test Cluster A", "topic": "", "text": text,
+            "consent_given": True
+        })
+        assert response.status_code == 200
+        return response.json()["id"]
+    
+    before = client.get("/api/diet/dedupe-stats").json()
+    
+    original = submit("+919800000371", "My students cannot subtract with borrowing from zero")
+    assert submit("+919800000371", "my students cannot subtract with borrowing from zero!!") == original
+    # Short common questions from another teacher are kept
+    assert submit("+919800000372", "My students cannot subtract with borrowing from zero") != original
+    
+    chain = (
+        "URGENT forward to all teachers in the district the new circular says "
+        "every school must submit attendance registers by friday evening"
+    )
+    first = submit("+919800000373", chain)
+    # Another sender never gets the first sender's id back
+    forwarded = submit("+919800000374", "Fwd: " + chain)
+    assert forwarded != first
+    assert submit("+919800000374", "Fwd: " + chain + "!") == forwarded
+    
+    assert db_session.query(TeacherQuery).count() == 4
+    stats = client.get("/api/diet/dedupe-stats").json()
+    assert stats["suppressed"] - before["suppressed"] == 2
+    assert stats["cross_sender"] - before["cross_sender"] == 1
+    assert stats["entries"] == 4
+
+
+def test_duplicate_detector_memory_is_bounded():
+    """Test that the detector evicts by entry bound and time window."""
+    from app.services.dedupe import NearDuplicateDetector
+    
+    detector = NearDuplicateDetector(max_entries=10, window_seconds=3600)
+    for i in range(50):
+        detector.add(f"q{i}", f"question number {i} about fractions and decimals", "phone")
+    assert detector.stats()["entries"] == 10
+    assert detector.find("question number 49 about fractions and decimals", "phone").query_id == "q49"
+    assert detector.find("question number 3 about fractions and decimals", "phone") is None
+    
+    detector.window_seconds = 0
+    detector.find("anything", "phone")
+    assert detector.stats()["entries"] == 0
+    assert sum(len(b) for b in detector._buckets.values()) == 0
+
+
+def test_sms_channel_replies_in_gsm7_within_budget(db_session):
+    """Test that SMS replies avoid UCS-2 and stay within the segment budget."""
+    from app.models import TeacherQuery
+    from app.utils.gsm7 import is_gsm7, segment_count
+    
+    def send(body, sid):
+        response = client.post("/api/webhook/sms", data={
+            "From": "+919800000038", "Body": body, "MessageSid": sid
+        })
+        assert response.status_code == 200
+        reply = response.json().split("<Body>")[1].split("</Body>")[0]
+        assert is_gsm7(reply)
+        assert segment_count(reply) <= 2
+        return reply
+    
+    assert "YES" in send("Students cannot subtract with borrowing", "SM-sms-1")
+    reply = send("YES", "SM-sms-2")
+    assert "pebble" in reply
+    assert db_session.query(TeacherQuery).one().topic_tag == "subtraction-borrowing"
+    assert "flagged" in send("CRP", "SM-sms-3")
+
+
+def test_gsm7_segments_and_folding():
+    """Test GSM-7 folding, segment counting and batched SMS sending."""
+    from app.api.webhook import sms_renderer
+    from app.services.messaging import StubTransport
+    from app.services.sms import SmsChannel
+    from app.utils.gsm7 import segment_count, to_gsm7
+    
+    assert segment_count("a" * 160) == 1
+    assert segment_count("a" * 161) == 2
+    assert segment_count("[" * 80) == 1  # Extension characters take two septets
+    assert segment_count("🎓 " + "a" * 70) == 2  # One emoji forces UCS-2
+    assert to_gsm7("🎓 “Use pebbles” — 10×2 café\n\n📹 Demo") == '"Use pebbles" - 10x2 café\nDemo'
+    
+    topics = sms_renderer.engine.get_all_topics()
+    assert all(segment_count(sms_renderer.advice(topic)) <= 2 for topic in topics)
+    assert sms_renderer.compact("word " * 200).endswith("...")
+    
+    channel = SmsChannel(sms_renderer, StubTransport(fail_times=1))
+    ids = channel.send_batch([("+911", "first 🎓"), ("+912", "second 🎓")])
+    assert ids[0] is None and ids[1] is not None
+    assert channel.gateway.sent == [("+912", "second")]
+
+
+def test_auto_transport_without_credentials_is_refused_outside_debug(monkeypatch, caplog):
+    """Test that "auto" only falls back to the stub, loudly, in DEBUG mode."""
+    from app.config import settings
+    from app.services.messaging import StubTransport, create_transport
+    
+    monkeypatch.setattr(settings, "TWILIO_ACCOUNT_SID", None)
+    monkeypatch.setattr(settings, "DEBUG", True)
+    assert isinstance(create_transport("auto"), StubTransport)
+    assert "not delivered" in caplog.text
+    
+    monkeypatch.setattr(settings, "DEBUG", False)
+    with pytest.raises(RuntimeError):
+        create_transport("auto")
+    assert isinstance(create_transport("stub"), StubTransport)
+
+
+def test_sms_advice_uses_cluster_and_language_overrides():
+    """Test that SMS advice keeps overrides and sends other scripts as UCS-2."""
+    from app.services.sms import SmsRenderer
+    from app.services.template_engine import TemplateEngine
+    from app.utils.gsm7 import is_gsm7, segment_count
+    
+    engine = TemplateEngine()
+    engine.overrides["clusters"]["SMS Cluster"] = {
+        "all": {"materials": "tamarind seeds, chalk slate"}
+    }
+    renderer = SmsRenderer(engine, max_segments=3)
+    
+    english = renderer.advice("subtraction-borrowing", "SMS Cluster")
+    assert is_gsm7(english) and "tamarind" in english
+    
+    hindi = renderer.advice("subtraction-borrowing", language="hi")
+    assert "कंकड़" in hindi  # Not folded away to punctuation and digits
+    assert segment_count(hindi) <= 3
+    assert renderer.advice("subtraction-borrowing", language="hi") is hindi
+
+
+def test_offline_batch_sync_is_idempotent(db_session):
+    """Test gzip batch sync: one transaction, per-item results, safe resend."""
+    import gzip
+    import json
+    from app.models import TeacherQuery, Cluster
+    
+    def sync(items):
+        body = gzip.compress(json.dumps({"phone": "+919800000039", "items": items}).encode())
+        response = client.post(
+            "/api/teacher/sync", content=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        return response.json()["results"]
+    
+    items = [
+        {"key": "k1", "cluster": "Offline Cluster", "text": "Students cannot read fluently", "consent_given": True},
+        {"key": "k2", "cluster": "Offline Cluster", "text": "Many children are absent during harvest"},
+        {"key": "k3", "cluster": "Offline Cluster", "text": "  "},
+    ]
+    first = sync(items)
+    assert [r["status"] for r in first] == ["created", "created", "invalid"]
+    assert first[0]["topic"] == "reading-fluency"
+    assert "id" not in first[2]
+    
+    # Connection dropped: the app resends everything plus a new query
+    items[2]["text"] = "How do I teach fractions with paper folding?"
+    second = sync(items + [{"key": "k4", "cluster": "Test Cluster A", "text": "Parents do not help at home"}])
+    assert second[:2] == first[:2]
+    assert [r["status"] for r in second[2:]] == ["created", "created"]
+    
+    assert db_session.query(TeacherQuery).count() == 4
+    assert db_session.query(Cluster).filter(Cluster.name == "Offline Cluster").count() == 1
+    
+    bomb = gzip.compress(b" " * (2 * 1024 * 1024))
+    response = client.post("/api/teacher/sync", content=bomb, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+
+
+def test_template_overrides_per_cluster_and_language(tmp_path):
+    """Test that cluster and language overrides layer over the base templates."""
+    from app.services.template_engine import TemplateEngine
+    
+    overrides = tmp_path / "overrides.yaml"
+    overrides.write_text(
+        "languages:\n"
+        "  hi:\n"
+        "    absenteeism:\n"
+        "      advice: 'Hindi advice'\n"
+        "clusters:\n"
+        "  Hoskote:\n"
+        "    language: hi\n"
+        "    all:\n"
+        "      materials: 'local materials'\n"
+        "    topics:\n"
+        "      absenteeism:\n"
+        "        demo_video: 'hoskote-attendance.mp4'\n",
+        encoding="utf-8"
+    )
+    engine = TemplateEngine(overrides_path=str(overrides), cache_size=100)
+    base = engine.generate_response("absenteeism")
+    
+    local = engine.generate_response("absenteeism", "Hoskote")
+    assert local["advice"] == "Hindi advice"
+    assert local["materials"] == "local materials"
+    assert local["demo_link"] == "/media/hoskote-attendance.mp4"
+    assert local["duration"] == base["duration"]
+    
+    assert engine.generate_response("absenteeism", "Hoskote", language="en")["advice"] == base["advice"]
+    assert engine.generate_response("absenteeism", "Other", language="hi")["advice"] == "Hindi advice"
+    assert engine.generate_response("fractions-conceptual", "Hoskote")["materials"] == "local materials"
+    
+    # Clusters without overrides share the base entries: the cache does not grow
+    size = len(engine._resolved)
+    for i in range(500):
+        assert engine.generate_response("absenteeism", f"Cluster {i}") == base
+    assert len(engine._resolved) == size
+    
+    # Returned dicts are copies
+    engine.generate_response("absenteeism")["advice"] = "changed"
+    assert engine.generate_response("absenteeism") == base
+
+
+def test_engine_profiles_wal_and_read_only(tmp_path):
+    """Test SQLite pragmas and that the analytics engine cannot write."""
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app.database import create_engine_for
+    
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    write_engine = create_engine_for(url)
+    read_engine = create_engine_for(url, read_only=True)
+    try:
+        with write_engine.begin() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+        
+        with read_engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            with pytest.raises(OperationalError):
+                conn.execute(text("INSERT INTO t VALUES (2)"))
+    finally:
+        write_engine.dispose()
+        read_engine.dispose()
+
+
+def test_aggregate_unknown_cluster_is_empty(db_session):
+    """Test that filtering by an unknown cluster returns no rows."""
+    client.post("/api/teacher/query", json={
+        "phone": "+919800000041", "cluster": "Test Cluster A", "text": "Reading is slow"
+    })
+    data = client.get("/api/diet/aggregate", params={"cluster": "No Such Cluster"}).json()
+    assert data["total_queries"] == 0
+    assert data["by_topic"] == {}
+
+
+def test_session_store_spills_evicted_sessions(tmp_path):
+    """Test that sessions evicted from memory are recovered from the spill file."""
+    from app.services.session_store import SessionStore
+    
+    store = SessionStore(max_entries=1, ttl_seconds=60, spill_path=str(tmp_path / "sessions.sqlite"))
+    store.update("hash-a", cluster="Cluster A", last_query_id="q-a")
+    store.update("hash-b", cluster="Cluster B")
+    assert len(store) == 1
+    
+    session = store.get("hash-a")
+    assert session.cluster == "Cluster A"
+    assert session.last_query_id == "q-a"
+    
+    store.forget("hash-b")
+    assert store.get("hash-b") is None
+
+
+def test_session_spill_file_holds_no_raw_number(tmp_path):
+    """Test that the reply address and pre-consent text are encrypted in the spill file."""
+    from app.services.session_store import SessionStore
+    
+    spill = tmp_path / "sessions.sqlite"
+    store = SessionStore(max_entries=1, ttl_seconds=60, spill_path=str(spill))
+    store.update("hash-a", address="whatsapp:+919812345678", pending_text="My class is weak in fractions")
+    store.update("hash-b", cluster="Cluster B")  # Spills hash-a
+    store.flush()
+    
+    raw = spill.read_bytes()
+    assert b"919812345678" not in raw
+    assert b"fractions" not in raw
+    session = store.get("hash-a")
+    assert session.address == "whatsapp:+919812345678"
+    assert session.pending_text == "My class is weak in fractions"
+
+
+def test_partition_bounds_and_sqlite_fallback():
+    """Test monthly partition ranges and that SQLite keeps a single table."""
+    from datetime import date
+    from app.database import engine
+    from app.services.partitions import partition_bounds, ensure_partitions
+    
+    bounds = partition_bounds(date(2026, 11, 17), date(2027, 1, 1))
+    assert bounds == [
+        ("teacher_queries_y2026m11", date(2026, 11, 1), date(2026, 12, 1)),
+        ("teacher_queries_y2026m12", date(2026, 12, 1), date(2027, 1, 1)),
+        ("teacher_queries_y2027m01", date(2027, 1, 1), date(2027, 2, 1)),
+    ]
+    assert ensure_partitions(engine) == 0
+
+
+def test_search_ranks_filters_and_pages(db_session):
+    """Test full-text search with snippets, filters, cursors and deletes."""
+    db_session.add(Cluster(name="Test Cluster B", region="Test Region"))
+    db_session.commit()
+    texts = [
+        ("Test Cluster A", "Children mix up place value when writing 305"),
+        ("Test Cluster A", "Place value charts help, but place value with zero is still hard"),
+        ("Test Cluster B", "My class struggles with place value in three digit numbers"),
+        ("Test Cluster B", "Attendance drops during harvest season"),
+    ]
+    ids = []
+    for i, (cluster, text) in enumerate(texts):
+        response = client.post("/api/teacher/query", json={
+            "phone": f"+91980000010{i}", "cluster": cluster, "text": text, "consent_given": True
+        })
+        ids.append(response.json()["id"])
+    
+    data = client.get("/api/diet/search", params={"q": '"place value"'}).json()
+    assert [hit["id"] for hit in data["results"]][0] == ids[1]
+    assert set(hit["id"] for hit in data["results"]) == set(ids[:3])
+    assert "[place value]" in data["results"][-1]["snippet"].lower()
+    
+    data = client.get("/api/diet/search", params={"q": "place value", "cluster": "Test Cluster B"}).json()
+    assert [hit["id"] for hit in data["results"]] == [ids[2]]
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "place value", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/diet/search", params=params).json()
+        seen += [hit["id"] for hit in page["results"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(ids[:3])
+    
+    client.delete(f"/api/teacher/query/{ids[0]}")
+    data = client.get("/api/diet/search", params={"q": "305"}).json()
+    assert data["results"] == []
+    
+    assert client.get("/api/diet/search", params={"q": "place", "cursor": "bogus"}).status_code == 400
+    assert client.get("/api/diet/search", params={"q": "+++"}).status_code == 400
+
+
+def test_similar_queries_and_topic_suggestion(db_session, tmp_path, monkeypatch):
+    """Test TF-IDF neighbours, the mislabel hint, deletes and the mmap reload."""
+    from app.services.scheduler import scheduler
+    from app.services.similarity import SimilarityIndex, similarity_index
+    
+    monkeypatch.setattr(similarity_index, "path", str(tmp_path / "index"))
+    monkeypatch.setattr(similarity_index, "_loaded", False)
+    posts = [
+        ("subtraction-borrowing", "Students cannot borrow from the tens column when subtracting"),
+        ("subtraction-borrowing", "My class forgets to borrow from tens in two digit subtraction"),
+        ("subtraction-borrowing", "Borrowing across a zero in the tens column confuses everyone"),
+        ("absenteeism", "Children attend only twice a week during the harvest"),
+        ("absenteeism", "Half the children forget how to borrow from the tens column"),
+    ]
+    ids = []
+    for i, (topic, text) in enumerate(posts):
+        response = client.post("/api/teacher/query", json={
+            "phone": f"+91980000020{i}", "cluster": "Test Cluster A", "topic": topic,
+            "text": text, "consent_given": True
+        })
+        ids.append(response.json()["id"])
+    
+    # Requests never build; a worker that is not the leader waits for the leader's segment
+    assert client.get(f"/api/diet/queries/{ids[4]}/similar").status_code == 503
+    monkeypatch.setattr(scheduler, "is_leader", lambda: False)
+    assert similarity_index.refresh(db_session) == 0 and not similarity_index.ensure_loaded()
+    monkeypatch.setattr(scheduler, "is_leader", lambda: True)
+    (tmp_path / "index" / "build-1.partial").mkdir(parents=True)  # Another worker's build in progress
+    assert similarity_index.refresh(db_session) == 5
+    assert (tmp_path / "index" / "build-1.partial").is_dir()
+    
+    data = client.get(f"/api/diet/queries/{ids[4]}/similar", params={"k": 3}).json()
+    assert [hit["id"] for hit in data["results"]] and set(hit["id"] for hit in data["results"]) <= set(ids[:3])
+    assert data["topic"] == "absenteeism"
+    assert data["suggested_topic"] == "subtraction-borrowing"
+    assert client.get("/api/diet/queries/missing/similar").status_code == 404
+    
+    # New queries reach the index through refresh; deletes drop out at once
+    new_id = client.post("/api/teacher/query", json={
+        "phone": "+919800000210", "cluster": "Test Cluster A", "topic": "subtraction-borrowing",
+        "text": "How do I teach borrowing from the tens place with bundles of sticks", "consent_given": True
+    }).json()["id"]
+    assert similarity_index.refresh(db_session) == 1
+    client.delete(f"/api/teacher/query/{ids[0]}")
+    found = [hit["id"] for hit in client.get(f"/api/diet/queries/{ids[4]}/similar").json()["results"]]
+    assert new_id in found and ids[0] not in found
+    
+    similarity_index.rebuild(db_session)
+    reloaded = SimilarityIndex(path=str(tmp_path / "index"))
+    assert reloaded.load()
+    assert reloaded.similar(posts[4][1], 3, exclude=ids[4]) == similarity_index.similar(posts[4][1], 3, exclude=ids[4])
+
+
+def test_archive_moves_old_queries_and_keeps_counts(db_session, tmp_path, monkeypatch):
+    """Test archival to gzip NDJSON, rollup-backed aggregates and the export stream."""
+    import json
+    from datetime import datetime
+    from app.models import TeacherQuery
+    from app.services.archive import query_archive
+    
+    monkeypatch.setattr(query_archive, "path", str(tmp_path / "archive"))
+    monkeypatch.setattr(query_archive, "batch_size", 2)
+    ids = []
+    for i, text in enumerate(["Old borrowing question", "Old reading question", "Old flagged case", "New question"]):
+        response = client.post("/api/teacher/query", json={
+            "phone": f"+91980000030{i}", "cluster": "Test Cluster A", "text": text, "consent_given": True
+        })
+        ids.append(response.json()["id"])
+    for query_id, created_at in zip(ids, [datetime(2024, 7, 3), datetime(2024, 8, 9), datetime(2024, 8, 10)]):
+        db_session.query(TeacherQuery).filter(TeacherQuery.id == query_id).update({"created_at": created_at})
+    db_session.query(TeacherQuery).filter(TeacherQuery.id == ids[2]).update({"flagged_for_crp": True})
+    db_session.commit()
+    before = client.get("/api/diet/aggregate").json()
+    
+    assert query_archive.archive(db_session, before=datetime(2025, 6, 1)) == 2
+    remaining = {q.id for q in db_session.query(TeacherQuery)}
+    assert remaining == {ids[2], ids[3]}  # The open CRP case stays hot
+    assert query_archive.months() == ["2024-07", "2024-08"]
+    
+    after = client.get("/api/diet/aggregate").json()
+    assert after["total_queries"] == before["total_queries"] == 4
+    assert after["by_topic"] == before["by_topic"]
+    assert after["by_cluster"] == before["by_cluster"]
+    hot_only = client.get("/api/diet/aggregate", params={"include_archived": False}).json()
+    assert hot_only["total_queries"] == 2
+    august = client.get("/api/diet/aggregate", params={
+        "date_from": "2024-08-01", "date_to": "2024-08-31"
+    }).json()
+    assert august["total_queries"] == 2
+    assert sum(august["by_topic"].values()) == sum(august["by_cluster"].values()) == 2
+    
+    response = client.get("/exports/archive/queries", params={"date_from": "2024-08-01"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["id"] for r in records] == [ids[1]]
+    assert "phone_hash" not in records[0]
+    assert len(client.get("/exports/archive/queries").text.splitlines()) == 2
+
+
+def test_archive_resumes_an_interrupted_batch(db_session, tmp_path):
+    """Test that a crash between appending months neither loses nor duplicates rows."""
+    from datetime import datetime
+    from app.models import TeacherQuery
+    from app.services.archive import QueryArchive
+    
+    archive = QueryArchive(path=str(tmp_path / "archive"))
+    cluster = db_session.query(Cluster).first()
+    for i, created_at in enumerate([datetime(2024, 7, 3), datetime(2024, 8, 9), datetime(2024, 9, 1)]):
+        db_session.add(TeacherQuery(
+            id=f"old-{i}", phone_hash=f"hash-{i}", cluster_id=cluster.id, topic_tag="fractions-conceptual",
+            narrative_text=f"Old question {i}", created_at=created_at, consent_given=True
+        ))
+    db_session.commit()
+    
+    append = archive._append
+    calls = []
+    
+    def crash_on_second_month(month, records, batch=None):
+        calls.append(month)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        append(month, records, batch)
+    
+    archive._append = crash_on_second_month
+    with pytest.raises(OSError):
+        archive.archive(db_session, before=datetime(2025, 6, 1))
+    archive._append = append
+    assert db_session.query(TeacherQuery).count() == 3
+    
+    assert archive.archive(db_session, before=datetime(2025, 6, 1)) == 0  # Finished as recovery
+    assert db_session.query(TeacherQuery).count() == 0
+    ids = sorted(r["id"] for r in archive.iter_records())
+    assert ids == ["old-0", "old-1", "old-2"]
+
+
+def test_archive_writers_exclude_other_processes(tmp_path):
+    """Test that erasure waits for an archive lock held through another open file (as another worker would)."""
+    import fcntl
+    import os
+    import threading
+    from app.services.archive import QueryArchive
+    
+    archive = QueryArchive(path=str(tmp_path / "archive"))
+    os.makedirs(archive.path)
+    fd = os.open(os.path.join(archive.path, "archive.lock"), os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    eraser = threading.Thread(target=archive.erase, args=("hash-a",))
+    eraser.start()
+    eraser.join(0.3)
+    assert eraser.is_alive()
+    os.close(fd)
+    eraser.join(5)
+    assert not eraser.is_alive()
+
+
+def test_archive_reader_survives_an_erasure_rewrite(tmp_path):
+    """Test that a stream started before an erasure finishes on the old file."""
+    from app.services.archive import QueryArchive
+    
+    archive = QueryArchive(path=str(tmp_path / "archive"))
+    
+    def record(i, phone_hash):
+        return {
+            "id": f"old-{i}", "phone_hash": phone_hash, "cluster_id": "c1", "topic_tag": "fractions",
+            "narrative_text": f"Old question {i}", "created_at": f"2024-07-0{i + 1}T10:00:00",
+            "resolved": False, "flagged_for_crp": False, "consent_given": True
+        }
+    
+    archive._append("2024-07", [record(0, "hash-a"), record(1, "hash-b")])
+    archive._append("2024-07", [record(2, "hash-b"), record(3, "hash-a")])
+    
+    stream = archive.iter_records()
+    assert next(stream)["id"] == "old-0"
+    # The rewrite replaces the index and unlinks the file being read
+    assert archive.erase("hash-a") == 2
+    assert [r["id"] for r in stream] == ["old-1", "old-2", "old-3"]
+    
+    assert [r["id"] for r in archive.iter_records()] == ["old-1", "old-2"]
+    assert sum(archive.rollup().values()) == archive.stats()["rows"] == 2
+
+
+def test_erasure_removes_phone_everywhere(db_session, tmp_path, monkeypatch):
+    """Test chunked erasure across the table, caches and archive, resumed by the job."""
+    from datetime import datetime
+    from app.models import TeacherQuery
+    from app.services.archive import query_archive
+    from app.services.erasure import erasure_service
+    from app.services.session_store import session_store
+    from app.services.similarity import SimilarityIndex, similarity_index
+    from app.utils.privacy import hash_phone_number
+    
+    monkeypatch.setattr(query_archive, "path", str(tmp_path / "archive"))
+    monkeypatch.setattr(similarity_index, "path", str(tmp_path / "index"))
+    monkeypatch.setattr(erasure_service, "chunk_size", 2)
+    monkeypatch.setattr(erasure_service, "session_factory", TestingSessionLocal)
+    phone, other = "+919800000401", "+919800000402"
+    texts = ["Erase borrowing question", "Erase reading question", "Erase fractions question",
+             "Erase attendance question", "Erase place value question"]
+    ids = [
+        client.post("/api/teacher/query", json={
+            "phone": phone, "cluster": "Test Cluster A", "text": text, "consent_given": True
+        }).json()["id"]
+        for text in texts
+    ]
+    kept = client.post("/api/teacher/query", json={
+        "phone": other, "cluster": "Test Cluster A", "text": "Keep this question", "consent_given": True
+    }).json()["id"]
+    phone_hash = hash_phone_number(phone)
+    db_session.query(TeacherQuery).filter(TeacherQuery.id.in_([ids[0], kept])).update(
+        {"created_at": datetime(2024, 7, 3)}, synchronize_session=False
+    )
+    db_session.commit()
+    assert query_archive.archive(db_session, before=datetime(2025, 6, 1)) == 2
+    assert similarity_index.rebuild(db_session) == 4
+    session_store.update(phone_hash, cluster="Test Cluster A")
+    
+    # No budget: one chunk inline, then the job finishes
+    tombstone = erasure_service.request(db_session, phone_hash)
+    assert erasure_service.run(db_session, tombstone, 0) is False
+    assert tombstone.status == "running" and tombstone.rows_deleted == 2
+    assert erasure_service.request(db_session, phone_hash).id == tombstone.id
+    assert erasure_service.run_pending() == 1
+    
+    status = client.get(f"/api/teacher/erasure/{tombstone.id}").json()
+    assert status["status"] == "done"
+    assert status["rows_deleted"] == 5  # 4 hot rows + 1 archived record
+    assert db_session.query(TeacherQuery).filter(TeacherQuery.phone_hash == phone_hash).count() == 0
+    assert [r["id"] for r in query_archive.iter_records()] == [kept]
+    assert session_store.get(phone_hash) is None
+    duplicate = client.post("/api/teacher/query", json={
+        "phone": phone, "cluster": "Test Cluster A", "text": texts[1], "consent_given": True
+    }).json()
+    assert duplicate["id"] not in ids  # Stored again, not matched to an erased query
+    
+    # The saved index is rebuilt without the erased queries
+    saved = SimilarityIndex(path=str(tmp_path / "index"))
+    assert saved.load() and saved.stats()["documents"] == 0
+    
+    # Finished inline (e.g. by another worker): the leader's job still rebuilds once
+    assert similarity_index.refresh(db_session) == 1
+    similarity_index.rebuild(db_session)
+    built_at = similarity_index.built_at
+    response = client.post("/api/teacher/erasure", json={"phone": phone})
+    assert response.json()["status"] == "done"
+    assert response.json()["rows_deleted"] == 1
+    assert erasure_service.run_pending() == 0
+    assert similarity_index.built_at > built_at and similarity_index.stats()["documents"] == 0
+    built_at = similarity_index.built_at
+    erasure_service.run_pending()
+    assert similarity_index.built_at == built_at
+    assert client.get("/api/teacher/erasure/missing").status_code == 404
+
+
+def test_invalidation_bus_reaches_other_workers(tmp_path):
+    """Test that an invalidation reaches other subscribers once, but not the publisher."""
+    from app.services.invalidation import InvalidationBus
+    
+    path = str(tmp_path / "invalidation.sqlite")
+    worker_a, worker_b = InvalidationBus(path=path), InvalidationBus(path=path)
+    seen_a, seen_b = [], []
+    worker_a.subscribe("sessions", seen_a.append)
+    worker_b.subscribe("sessions", seen_b.append)
+    worker_b.poll()  # Joins before the publish
+    
+    worker_a.publish("sessions", "hash-a")
+    worker_a.publish("sessions")
+    assert worker_a.poll() == 0
+    assert worker_b.poll() == 2
+    assert worker_b.poll() == 0
+    assert seen_a == []
+    assert seen_b == ["hash-a", None]
+
+
+def test_only_one_worker_runs_leader_jobs(tmp_path):
+    """Test that the leader lock is held by one scheduler at a time."""
+    from app.services.scheduler import PeriodicTasks
+    
+    path = str(tmp_path / "scheduler.lock")
+    first, second = PeriodicTasks(leader_lock_path=path), PeriodicTasks(leader_lock_path=path)
+    assert first.is_leader()
+    assert first.is_leader()
+    assert not second.is_leader()
+    assert PeriodicTasks(leader_lock_path=None).is_leader()
+
+
+def test_write_through_sessions_are_shared(tmp_path):
+    """Test that a write-through session update is read by another worker after eviction."""
+    from app.services.session_store import SessionStore
+    
+    spill = str(tmp_path / "sessions.sqlite")
+    worker_a = SessionStore(max_entries=10, ttl_seconds=60, spill_path=spill, write_through=True)
+    worker_b = SessionStore(max_entries=10, ttl_seconds=60, spill_path=spill, write_through=True)
+    worker_b.update("hash-a", cluster="Cluster A")
+    assert worker_a.get("hash-a").cluster == "Cluster A"
+    
+    worker_a.update("hash-a", cluster="Cluster B")
+    assert worker_b.get("hash-a").cluster == "Cluster A"  # Stale until invalidated
+    worker_b.evict("hash-a")
+    assert worker_b.get("hash-a").cluster == "Cluster B"
+    
+    # Written on every message in this mode: never a raw number on disk
+    worker_a.update("hash-a", address="whatsapp:+919811112222", pending_text="Help with reading")
+    raw = (tmp_path / "sessions.sqlite").read_bytes()
+    assert b"919811112222" not in raw
+    assert b"reading" not in raw
+    worker_b.evict("hash-a")
+    assert worker_b.get("hash-a").address == "whatsapp:+919811112222"
+
+
+def test_metrics_endpoint_reports_routes_and_caches(db_session):
+    """Test that /metrics exposes route latency by path template, status codes and cache ratios."""
+    response = client.post("/api/teacher/query", json={
+        "phone": "+919800000050",
+        "cluster": "Test Cluster A",
+        "topic": "",
+        "text": "Students confuse numerators and denominators in fractions"
+    })
+    assert response.status_code == 200
+    client.get(f"/api/teacher/query/{response.json()['id']}")
+    client.get("/api/teacher/query/missing")
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/teacher/query"}' in text
+    assert 'http_responses_total{method="GET",route="/api/teacher/query/{query_id}",status="404"}' in text
+    assert 'http_requests_in_flight{method="GET",route="/metrics"} 1' in text
+    assert 'template_engine_seconds_count{operation="detect_topic"}' in text
+    assert 'db_pool_size{engine="write"}' in text
+    assert 'cache_hit_ratio{cache="templates"}' in text
+
+
+def test_metrics_sum_threads_and_workers(tmp_path):
+    """Test that per-thread shards and other workers' snapshots add up in one exposition."""
+    import os
+    import threading
+    from app.services.metrics import MetricsRegistry
+    
+    worker = MetricsRegistry(directory=str(tmp_path))
+    latency = worker.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    threads = [
+        threading.Thread(target=lambda: [latency.observe(0.05, ("/a",)) for _ in range(1000)])
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latency.observe(5.0, ("/a",))
+    worker.write_snapshot()
+    os.rename(tmp_path / f"{os.getpid()}.json", tmp_path / "1.json")  # As if written by pid 1
+    
+    text = worker.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 8000' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 8002' in text
+    assert 'latency_seconds_count{route="/a"} 8002' in text
@@ -0,0 +1,142 @@
+"""Plan-regression tests: no query on the hot paths may do a full-table scan."""
+import re
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Cluster, TeacherQuery
+from app.schemas import TeacherQueryCreate, FlagRequest
+from app.services.aggregator import AggregationService
+from app.services.idempotency import IdempotencyCache
+from app.services.broadcast import BroadcastEngine
+from app.services.messaging import StubTransport
+from app.utils.privacy import check_consent_required
+from app.api import teacher
+
+# "SCAN teacher_queries" (or "SCAN TABLE ..." on older SQLite) without an index
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?(?P<table>\w+)( AS \w+)?$")
+
+
+@pytest.fixture
+def plan_db(tmp_path):
+    """Seeded database that records every statement it executes."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'plans.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    db = session_factory()
+    clusters = [Cluster(name=f"Plan Cluster {i}", region="Plan") for i in range(5)]
+    db.add_all(clusters)
+    db.flush()
+    start = datetime(2026, 1, 1)
+    db.add_all(
+        TeacherQuery(
+            phone_hash=f"{i % 50:064x}",
+            cluster_id=clusters[i % 5].id,
+            topic_tag=["fractions-conceptual", "absenteeism", "reading-fluency"][i % 3],
+            narrative_text=f"Plan query {i}",
+            created_at=start + timedelta(hours=i),
+            flagged_for_crp=i % 7 == 0,
+            resolved=i % 14 == 0,
+            consent_given=True
+        )
+        for i in range(500)
+    )
+    db.commit()
+    db.close()
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        statements.append((statement, parameters))
+
+    yield engine, session_factory, statements
+    engine.dispose()
+
+
+def _full_scans(engine, statements):
+    """(statement, plan line) for every full-table scan among the statements."""
+    scans = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                if FULL_SCAN.match(row[-1]):
+                    scans.append((statement, row[-1]))
+    return scans
+
+
+def test_aggregation_queries_use_indexes(plan_db):
+    """Test every AggregationService query shape against the indexes."""
+    engine, session_factory, statements = plan_db
+    db = session_factory()
+
+    AggregationService.get_aggregated_stats(db)
+    AggregationService.get_aggregated_stats(db, cluster="Plan Cluster 1")
+    AggregationService.get_aggregated_stats(db, topic="absenteeism")
+    AggregationService.get_aggregated_stats(db, date_from="2026-01-05", date_to="2026-01-10")
+    AggregationService.get_aggregated_stats(
+        db, cluster="Plan Cluster 2", topic="fractions-conceptual",
+        date_from="2026-01-05", date_to="2026-01-10"
+    )
+    AggregationService.get_topic_trends(db, days=3650)
+    AggregationService.get_crp_queue(db)
+    AggregationService.get_crp_queue(db, cluster="Plan Cluster 3")
+    db.close()
+
+    assert statements
+    assert _full_scans(engine, statements) == []
+
+
+def test_crp_queue_reads_only_the_partial_index(plan_db):
+    """Test that the unfiltered CRP queue is served from the partial index."""
+    engine, session_factory, statements = plan_db
+    db = session_factory()
+    open_rows = AggregationService.get_crp_queue(db, limit=500)
+    db.close()
+
+    assert open_rows and all(q.flagged_for_crp and not q.resolved for q in open_rows)
+    statement, parameters = statements[-1]
+    with engine.connect() as conn:
+        plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    assert any("ix_teacher_queries_crp_open" in line for line in plan)
+
+
+def test_api_queries_use_indexes(plan_db):
+    """Test the queries behind the teacher, broadcast and idempotency paths."""
+    engine, session_factory, statements = plan_db
+    db = session_factory()
+    cluster = db.query(Cluster).filter(Cluster.name == "Plan Cluster 0").one()
+
+    check_consent_required(f"{7:064x}", db)
+    response = teacher._persist_query(
+        TeacherQueryCreate(cluster="Plan Cluster 0", topic="", text="Plan reading question"),
+        f"{7:064x}",
+        db
+    )
+    teacher.get_teacher_query(response.id, db)
+    teacher.flag_query_to_crp(FlagRequest(query_id=response.id), db)
+
+    engine_for_broadcast = BroadcastEngine(
+        transport=StubTransport(), session_factory=session_factory, resolve_address=lambda h: None
+    )
+    broadcast = engine_for_broadcast.create(db, cluster.id, "absenteeism", "Plan broadcast")
+    engine_for_broadcast.stats(db, broadcast.id)
+    engine_for_broadcast.start(broadcast.id).result(timeout=10)
+
+    cache = IdempotencyCache()
+    cache.put(db, "plan:1", "response")
+    cache._entries.clear()
+    cache.get(db, "plan:1")
+    cache.get_many(db, ["plan:1", "plan:2"])
+    cache.cleanup(db)
+    db.close()
+
+    assert _full_scans(engine, statements) == []
@@ -0,0 +1,76 @@
+"""Startup tests: importing the app is cheap and side-effect free; the schema comes from the migrations."""
+import json
+import os
+import subprocess
+import sys
+from sqlalchemy import create_engine, inspect, text
+from app.database import Base
+from app.migrations import upgrade_schema
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cost of `import app.main` on top of the framework (FastAPI, SQLAlchemy,
+# pydantic), which every worker pays anyway. About 0.3-0.4 s on one slow core.
+IMPORT_BUDGET_SECONDS = 1.0
+LAZY_MODULES = ("pptx", "yaml", "twilio", "alembic")
+
+_PROBE = """
+import json, os, sys, time
+import fastapi, fastapi.openapi.models, fastapi.middleware.cors, multipart
+import sqlalchemy, sqlalchemy.orm, pydantic_settings, starlette.staticfiles
+start = time.perf_counter()
+import app.main
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "loaded": [m for m in %r if m in sys.modules],
+    "files": sorted(os.listdir("."))
+}))
+"""
+
+
+def test_import_is_fast_and_side_effect_free(tmp_path):
+    """Test that importing app.main stays in budget, loads no optional deps and writes nothing."""
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND_DIR,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}"
+    )
+    workdir = tmp_path / "cwd"
+    workdir.mkdir()
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE % (LAZY_MODULES,)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert probe["loaded"] == []
+    assert probe["files"] == []  # No exports/ or media/ directories
+    assert not (tmp_path / "startup.db").exists()
+    assert probe["seconds"] < IMPORT_BUDGET_SECONDS, f"import took {probe['seconds']:.2f}s"
+
+
+def test_migrations_build_the_model_schema(tmp_path):
+    """Test migrating an empty database, and stamping one built by create_all."""
+    from alembic.autogenerate import compare_metadata
+    from alembic.runtime.migration import MigrationContext
+
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    upgrade_schema(migrated)
+    with migrated.connect() as connection:
+        context = MigrationContext.configure(connection, opts={
+            # The FTS5 shadow tables are created by DDL, not declared in the models
+            "include_name": lambda name, type_, parent: not (name or "").startswith("teacher_queries_fts")
+        })
+        head = context.get_current_revision()
+        assert compare_metadata(context, Base.metadata) == []
+        assert "teacher_queries_fts" in inspect(connection).get_table_names()
+
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(legacy)
+    with legacy.begin() as connection:
+        connection.execute(text("INSERT INTO clusters (id, name) VALUES ('c1', 'Legacy Cluster')"))
+    upgrade_schema(legacy)
+    upgrade_schema(legacy)  # Idempotent on every worker boot
+    with legacy.connect() as connection:
+        assert MigrationContext.configure(connection).get_current_revision() == head
+        assert connection.execute(text("SELECT name FROM clusters")).scalar() == "Legacy Cluster"
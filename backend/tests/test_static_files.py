@@ -0,0 +1,85 @@
+"""Test cache-friendly static file serving."""
+import os
+import gzip
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.static_files import CachedStaticFiles
+
+LARGE_SIZE = 8 * 1024 * 1024
+
+
+@pytest.fixture
+def media_client(tmp_path):
+    """App with a media directory holding a large file and a text file."""
+    large = os.urandom(LARGE_SIZE)
+    (tmp_path / "demo.mp4").write_bytes(large)
+    (tmp_path / "notes.txt").write_bytes(b"hello teachers " * 200)
+    (tmp_path / "notes.txt.gz").write_bytes(gzip.compress(b"hello teachers " * 200))
+    (tmp_path / "intro.0123456789abcdef.mp4").write_bytes(b"versioned")
+
+    app = FastAPI()
+    app.mount("/media", CachedStaticFiles(directory=str(tmp_path)), name="media")
+    return TestClient(app), large
+
+
+def test_range_requests_resume_download(media_client):
+    """Test that a dropped download can be resumed with a Range request."""
+    client, large = media_client
+
+    first = client.get("/media/demo.mp4", headers={"Range": "bytes=0-999999"})
+    assert first.status_code == 206
+    assert first.headers["content-range"] == f"bytes 0-999999/{LARGE_SIZE}"
+    assert first.headers["content-length"] == "1000000"
+
+    rest = client.get(
+        "/media/demo.mp4",
+        headers={"Range": "bytes=1000000-", "If-Range": first.headers["etag"]}
+    )
+    assert rest.status_code == 206
+    assert first.content + rest.content == large
+
+    suffix = client.get("/media/demo.mp4", headers={"Range": "bytes=-10"})
+    assert suffix.content == large[-10:]
+
+    bad = client.get("/media/demo.mp4", headers={"Range": f"bytes={LARGE_SIZE}-"})
+    assert bad.status_code == 416
+
+    # A stale If-Range falls back to the full file
+    stale = client.get("/media/demo.mp4", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert len(stale.content) == LARGE_SIZE
+
+
+def test_strong_etag_and_cache_control(media_client):
+    """Test ETag revalidation and immutable caching of content-addressed names."""
+    client, _ = media_client
+
+    response = client.get("/media/demo.mp4")
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert response.headers["cache-control"] == "no-cache"
+
+    revalidated = client.get("/media/demo.mp4", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+
+    versioned = client.get("/media/intro.0123456789abcdef.mp4")
+    assert "immutable" in versioned.headers["cache-control"]
+
+    head = client.head("/media/demo.mp4")
+    assert head.status_code == 200
+    assert head.headers["content-length"] == str(LARGE_SIZE)
+
+
+def test_precompressed_variant(media_client):
+    """Test that the .gz sibling is served only to clients accepting gzip."""
+    client, _ = media_client
+
+    compressed = client.get("/media/notes.txt", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.text == "hello teachers " * 200
+
+    plain = client.get("/media/notes.txt", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] != compressed.headers["etag"]
+